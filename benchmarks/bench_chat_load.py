@@ -0,0 +1,181 @@
+# benchmarks/bench_chat_load.py
+"""
+Prueba de carga de /chat-stream/{convo_id} sin servicios externos.
+
+Arranca FakeUpstream (PSE, páginas y RAG) y un worker de uvicorn con
+benchmarks.fake_app (modelo y Firestore falsos), y lanza turnos de chat con
+concurrencia creciente. Para cada nivel informa:
+  - TTFB: hasta el primer byte de la respuesta SSE
+  - TTFT: hasta el primer evento con texto del modelo
+  - extremo a extremo: hasta el evento 'done'
+  - turnos por segundo y errores
+y al final la concurrencia máxima por worker que cumple el SLO de TTFT (p99).
+
+Uso (desde la raíz del repositorio):
+    python -m benchmarks.bench_chat_load [--levels 1,8,32,64] [--turns-per-stream 2] [--slo-ttft 2.0]
+        [--page-kind pdf --page-kb 1024] [--gemini-chunks 60 --gemini-chunk-interval 0.03]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import uuid
+
+import httpx
+
+# Valores de relleno para las variables obligatorias de Settings.
+PLACEHOLDER_ENV = {
+    "GOOGLE_CLOUD_PROJECT": "bench",
+    "GOOGLE_CLOUD_LOCATION": "us-central1",
+    "GEMINI_MODEL": "fake-gemini",
+    "PSE_API_KEY": "bench",
+    "PSE_ID": "bench",
+}
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+async def _wait_until_ready(url: str, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get(url)).status_code < 500:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} no respondió en {timeout}s")
+
+def _percentile(values, pct):
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+async def _turn(client: httpx.AsyncClient, base_url: str, shared_prompt: bool) -> dict:
+    convo_id = uuid.uuid4().hex
+    prompt = "¿Qué obligaciones tiene el Estado en materia de acceso a la justicia?"
+    if not shared_prompt:
+        prompt += f" (consulta {convo_id[:8]})"
+    started = time.perf_counter()
+    result = {"ttfb": None, "ttft": None, "e2e": None, "ok": False}
+    async with client.stream(
+        "POST", f"{base_url}/chat-stream/{convo_id}",
+        json={"prompt": prompt}, headers={"X-User-ID": f"bench-{convo_id[:6]}"},
+    ) as response:
+        async for line in response.aiter_lines():
+            now = time.perf_counter() - started
+            if result["ttfb"] is None:
+                result["ttfb"] = now
+            if not line.startswith("data: "):
+                continue
+            event = json.loads(line[6:])
+            if "text" in event and result["ttft"] is None:
+                result["ttft"] = now
+            elif event.get("event") == "done":
+                result["e2e"] = now
+                result["ok"] = True
+            elif "error" in event:
+                break
+    return result
+
+async def _level(base_url: str, concurrency: int, turns: int, shared_prompt: bool) -> dict:
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    timeout = httpx.Timeout(120.0)
+    results = []
+    async with httpx.AsyncClient(limits=limits, timeout=timeout) as client:
+        queue = asyncio.Queue()
+        for _ in range(turns):
+            queue.put_nowait(None)
+
+        async def worker():
+            while not queue.empty():
+                queue.get_nowait()
+                try:
+                    results.append(await _turn(client, base_url, shared_prompt))
+                except httpx.HTTPError:
+                    results.append({"ok": False})
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        wall = time.perf_counter() - started
+
+    ok = [r for r in results if r["ok"]]
+    return {
+        "concurrency": concurrency,
+        "turns_per_s": len(ok) / wall,
+        "errors": len(results) - len(ok),
+        **{f"{metric}_{pct}": _percentile([r[metric] for r in ok if r[metric] is not None], pct)
+           for metric in ("ttfb", "ttft", "e2e") for pct in (50, 99)},
+    }
+
+async def _run(args):
+    upstream_port, app_port = _free_port(), _free_port()
+    upstream = subprocess.Popen([
+        sys.executable, "-m", "benchmarks.fakes", "--port", str(upstream_port),
+        "--pse-latency", str(args.pse_latency), "--page-latency", str(args.page_latency),
+        "--page-kind", args.page_kind, "--page-kb", str(args.page_kb), "--rag-latency", str(args.rag_latency),
+    ], stdout=subprocess.DEVNULL)
+    env = {
+        **PLACEHOLDER_ENV,
+        **os.environ,
+        "PSE_SEARCH_URL": f"http://127.0.0.1:{upstream_port}/customsearch/v1",
+        "RAG_API_URL": f"http://127.0.0.1:{upstream_port}/query",
+        "CLOUD_LOGGING_ENABLED": "false",
+        "BENCH_GEMINI_CHUNKS": str(args.gemini_chunks),
+        "BENCH_GEMINI_CHUNK_INTERVAL": str(args.gemini_chunk_interval),
+        "BENCH_GEMINI_FIRST_TOKEN_DELAY": str(args.gemini_first_token_delay),
+    }
+    app_output = None if args.verbose else subprocess.DEVNULL
+    app = subprocess.Popen([
+        sys.executable, "-m", "uvicorn", "benchmarks.fake_app:app",
+        "--port", str(app_port), "--workers", "1", "--log-level", "warning", "--no-access-log",
+    ], env=env, stdout=app_output, stderr=app_output)
+    base_url = f"http://127.0.0.1:{app_port}"
+    try:
+        await _wait_until_ready(f"{base_url}/status")
+        print(f"{'conc.':>5} {'turnos/s':>9} {'err':>4} {'TTFB p50':>9} {'p99':>7} {'TTFT p50':>9} {'p99':>7} {'e2e p50':>8} {'p99':>7}")
+        best = None
+        for concurrency in args.levels:
+            r = await _level(base_url, concurrency, concurrency * args.turns_per_stream, args.shared_prompt)
+            print(
+                f"{r['concurrency']:>5} {r['turns_per_s']:>9.2f} {r['errors']:>4} "
+                f"{r['ttfb_50']:>9.3f} {r['ttfb_99']:>7.3f} {r['ttft_50']:>9.3f} {r['ttft_99']:>7.3f} "
+                f"{r['e2e_50']:>8.3f} {r['e2e_99']:>7.3f}"
+            )
+            if r["errors"] == 0 and r["ttft_99"] <= args.slo_ttft:
+                best = concurrency
+        print(f"\nConcurrencia máxima por worker con TTFT p99 <= {args.slo_ttft}s y sin errores: {best or 'ninguna'}")
+    finally:
+        for process in (app, upstream):
+            process.terminate()
+            process.wait(timeout=10)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--levels", type=lambda v: [int(x) for x in v.split(",")], default=[1, 8, 32, 64])
+    parser.add_argument("--turns-per-stream", type=int, default=2, help="Turnos seguidos de cada stream en cada nivel")
+    parser.add_argument("--slo-ttft", type=float, default=2.0, help="Segundos de TTFT p99 aceptables")
+    parser.add_argument("--shared-prompt", action="store_true", help="Misma pregunta en todos los turnos (mide las cachés)")
+    parser.add_argument("--pse-latency", type=float, default=0.3)
+    parser.add_argument("--page-latency", type=float, default=0.2)
+    parser.add_argument("--page-kind", choices=("html", "pdf"), default="html")
+    parser.add_argument("--page-kb", type=int, default=64)
+    parser.add_argument("--rag-latency", type=float, default=0.2)
+    parser.add_argument("--gemini-chunks", type=int, default=60)
+    parser.add_argument("--gemini-chunk-interval", type=float, default=0.03)
+    parser.add_argument("--gemini-first-token-delay", type=float, default=0.5)
+    parser.add_argument("--verbose", action="store_true", help="Muestra los logs del worker")
+    args = parser.parse_args()
+    asyncio.run(_run(args))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+# benchmarks/bench_extraction_pool.py
+"""
+Mide cuánto se retrasan los chunks de streams concurrentes mientras se extrae
+texto de documentos grandes, con la extracción dentro del event loop ('inline')
+y a través de extraction_pool.run con EXTRACTION_EXECUTOR 'thread' y 'process'
+(cola acotada, timeout, tope de CPU y forkserver incluidos).
+
+La carga incluye --pathological extracciones que superan EXTRACTION_CPU_BUDGET
+(benchmarks.fakes.busy_extraction). Para cada modo informa la duración total,
+el retraso por chunk y cuántos documentos recurrieron al snippet (None).
+
+Uso (desde la raíz del repositorio, con las variables de entorno de la app):
+    python -m benchmarks.bench_extraction_pool [--pdf ruta.pdf] [--docs 6] [--streams 50] [--pathological 2]
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+
+from src.config import settings
+from src.modules import doc_extractor, extraction_pool
+from benchmarks.fakes import busy_extraction
+
+CHUNK_INTERVAL = 0.02  # Un chunk cada 20 ms por stream, como un stream de Gemini
+
+def _build_html(paragraphs: int) -> str:
+    body = "".join(
+        f"<div><p>Párrafo {i}: la Corte Interamericana reitera que el Estado debe garantizar el acceso a la justicia.</p></div>"
+        for i in range(paragraphs)
+    )
+    return f"<html><body>{body}</body></html>"
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+async def _stream(stop: asyncio.Event, delays: list):
+    """Simula un stream SSE y registra el retraso de cada chunk respecto a lo esperado."""
+    while not stop.is_set():
+        expected = time.perf_counter() + CHUNK_INTERVAL
+        await asyncio.sleep(CHUNK_INTERVAL)
+        delays.append(max(0.0, time.perf_counter() - expected))
+
+async def _run(mode: str, jobs, streams: int):
+    if mode != "inline":
+        settings.EXTRACTION_EXECUTOR = mode
+        extraction_pool.startup()
+        # Espera a que arranquen los trabajadores: el arranque no es parte de la medida.
+        await asyncio.gather(*(extraction_pool.run(busy_extraction, 0.0) for _ in range(settings.EXTRACTION_WORKERS)))
+
+    delays = []
+    stop = asyncio.Event()
+    stream_tasks = [asyncio.create_task(_stream(stop, delays)) for _ in range(streams)]
+    await asyncio.sleep(0.2)
+
+    started = time.perf_counter()
+    if mode == "inline":
+        results = []
+        for func, args in jobs:
+            results.append(func(*args))
+            await asyncio.sleep(0)
+    else:
+        results = await asyncio.gather(*(extraction_pool.run(func, *args) for func, args in jobs))
+    elapsed = time.perf_counter() - started
+
+    stop.set()
+    await asyncio.gather(*stream_tasks)
+    if mode != "inline":
+        extraction_pool.shutdown()
+
+    print(
+        f"{mode:>8}: extracción {elapsed:6.2f}s | retraso por chunk "
+        f"p50={statistics.median(delays) * 1000:7.1f}ms p99={_percentile(delays, 99) * 1000:7.1f}ms "
+        f"max={max(delays) * 1000:7.1f}ms ({len(delays)} chunks) | snippet={sum(r is None for r in results)}/{len(results)}"
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pdf", help="PDF local para incluir en la carga")
+    parser.add_argument("--docs", type=int, default=6, help="Documentos a extraer")
+    parser.add_argument("--paragraphs", type=int, default=20000, help="Párrafos del HTML sintético")
+    parser.add_argument("--pathological", type=int, default=2, help="Extracciones que superan el presupuesto de CPU")
+    parser.add_argument("--cpu-budget", type=float, default=1.0, help="EXTRACTION_CPU_BUDGET (s)")
+    parser.add_argument("--streams", type=int, default=50, help="Streams concurrentes simulados")
+    parser.add_argument("--workers", type=int, default=2, help="EXTRACTION_WORKERS")
+    parser.add_argument("--max-queue", type=int, default=settings.EXTRACTION_MAX_QUEUE, help="EXTRACTION_MAX_QUEUE")
+    parser.add_argument("--timeout", type=float, default=30.0, help="EXTRACTION_TIMEOUT (s)")
+    args = parser.parse_args()
+
+    settings.EXTRACTION_WORKERS = args.workers
+    settings.EXTRACTION_MAX_QUEUE = args.max_queue
+    settings.EXTRACTION_TIMEOUT = args.timeout
+    settings.EXTRACTION_CPU_BUDGET = args.cpu_budget
+
+    html = _build_html(args.paragraphs)
+    jobs = [(doc_extractor.extract_html_text, (html, 7000, args.cpu_budget)) for _ in range(args.docs)]
+    if args.pdf:
+        with open(args.pdf, "rb") as f:
+            pdf = f.read()
+        jobs += [(doc_extractor.extract_pdf_text, (pdf, 10, 7000, args.cpu_budget)) for _ in range(args.docs)]
+    jobs += [(busy_extraction, (args.cpu_budget * 4,)) for _ in range(args.pathological)]
+
+    for mode in ("inline", "thread", "process"):
+        asyncio.run(_run(mode, jobs, args.streams))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+# benchmarks/bench_rag_resilience.py
+"""
+Ejercita la capa de resiliencia del RAG contra el servidor HTTP local falso de
+benchmarks.fakes, que inyecta latencia y errores, y la compara con la llamada directa (timeout fijo).
+
+Fases:
+  sano        latencia base con una cola lenta (3 % de peticiones a 3 s)
+  colgado     las peticiones no responden (se agota el timeout)
+  caído       todas las peticiones responden 500
+  recuperado  de nuevo sano, pasado el enfriamiento del circuito
+  más lento   la latencia normal sube de forma estable (--shifted-latency), por
+              encima del timeout aprendido pero por debajo del máximo
+  adaptado    misma latencia, tras el enfriamiento: el timeout debe haber crecido
+  normal      la latencia vuelve a la base
+
+Para cada fase informa la latencia p50/p99 de search_internal_source_documents,
+cuántas veces se usó el contexto vacío de reserva y los contadores de resilience.
+Termina con código 1 si en la fase 'adaptado' alguna petición resiliente usó la reserva.
+
+Uso (desde la raíz del repositorio, con las variables de entorno de la app):
+    python -m benchmarks.bench_rag_resilience [--requests 200] [--concurrency 10] [--cooldown 2]
+        [--min-timeout 0.3] [--shifted-latency 0.6]
+"""
+
+import argparse
+import asyncio
+import random
+import sys
+import time
+
+from src.config import settings
+from src.modules import http_clients, rag_client, resilience
+from benchmarks.fakes import FakeUpstream
+
+class _DirectEndpoint:
+    """Llamada sin capa de resiliencia, como antes: solo el timeout fijo del cliente HTTP."""
+
+    async def call(self, func):
+        return await func()
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+async def _drive(requests: int, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, fallbacks = [], 0
+
+    async def one(i: int):
+        nonlocal fallbacks
+        async with semaphore:
+            started = time.perf_counter()
+            # Consultas distintas para no medir la caché de resultados.
+            result = await rag_client.search_internal_source_documents(f"consulta {random.random()} {i}")
+            latencies.append(time.perf_counter() - started)
+            if not result.documents:
+                fallbacks += 1
+
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    return latencies, fallbacks
+
+async def _run(mode: str, args):
+    server = FakeUpstream(rag_latency=0.05, rag_results=1)
+    rag_client.RAG_API_URL = f"{await server.start()}/query"
+    endpoint = rag_client._endpoint
+    if mode == "directo":
+        rag_client._endpoint = _DirectEndpoint()
+    else:
+        rag_client._endpoint = resilience.ResilientEndpoint(
+            "rag-bench",
+            min_timeout=args.min_timeout,
+            max_timeout=args.max_timeout,
+            timeout_multiplier=settings.RAG_TIMEOUT_MULTIPLIER,
+            hedge_percentile=settings.RAG_HEDGE_PERCENTILE,
+            min_samples=settings.RAG_LATENCY_MIN_SAMPLES,
+            failure_threshold=settings.RAG_BREAKER_FAILURES,
+            cooldown=args.cooldown,
+        )
+    await http_clients.startup()
+
+    base_latency = server.base_latency
+    phases = [
+        ("sano", dict(slow_ratio=0.03, error_ratio=0.0, hang=False)),
+        ("colgado", dict(slow_ratio=0.0, error_ratio=0.0, hang=True)),
+        ("caído", dict(slow_ratio=0.0, error_ratio=1.0, hang=False)),
+        ("recuperado", dict(slow_ratio=0.03, error_ratio=0.0, hang=False)),
+        ("más lento", dict(slow_ratio=0.0, base_latency=args.shifted_latency)),
+        ("adaptado", dict()),
+        ("normal", dict(base_latency=base_latency)),
+    ]
+    adapted_fallbacks = 0
+    try:
+        for name, config in phases:
+            for key, value in config.items():
+                setattr(server, key, value)
+            if name in ("recuperado", "adaptado"):
+                # Pasado el enfriamiento, una única petición de prueba cierra el circuito;
+                # mientras está en vuelo, el resto usa la reserva.
+                await asyncio.sleep(args.cooldown)
+                await _drive(1, 1)
+            before = server.requests
+            wall = time.perf_counter()
+            requests = args.requests if name in ("sano", "recuperado", "normal") else args.requests // 4
+            latencies, fallbacks = await _drive(requests, args.concurrency)
+            if name == "adaptado":
+                adapted_fallbacks = fallbacks
+            wall = time.perf_counter() - wall
+            extra = ""
+            if isinstance(rag_client._endpoint, resilience.ResilientEndpoint):
+                s = rag_client._endpoint.stats()
+                extra = f" circuito={s['circuit']} timeout={s['timeout_s']}s cubiertas={s['hedged']} cortocircuitadas={s['short_circuited']}"
+            print(
+                f"{mode:<10} {name:<10} p50={_percentile(latencies, 50):.3f}s p99={_percentile(latencies, 99):.3f}s "
+                f"reserva={fallbacks}/{len(latencies)} llamadas_al_rag={server.requests - before} total={wall:.1f}s{extra}"
+            )
+    finally:
+        await http_clients.shutdown()
+        await server.stop()
+        rag_client._endpoint = endpoint
+    return adapted_fallbacks
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--max-timeout", type=float, default=settings.RAG_TIMEOUT, help="Techo del timeout (RAG_TIMEOUT)")
+    parser.add_argument("--cooldown", type=float, default=2.0, help="Enfriamiento del circuito (RAG_BREAKER_COOLDOWN)")
+    parser.add_argument("--min-timeout", type=float, default=0.3, help="Suelo del timeout adaptativo (RAG_MIN_TIMEOUT)")
+    parser.add_argument("--shifted-latency", type=float, default=0.6, help="Latencia base en la fase 'más lento' (s)")
+    args = parser.parse_args()
+    # El cliente directo usa el timeout fijo del perfil 'rag'.
+    settings.RAG_TIMEOUT = args.max_timeout
+    asyncio.run(_run("directo", args))
+    if asyncio.run(_run("resiliente", args)):
+        print("FALLO: el timeout adaptativo no se ajustó a la nueva latencia del servicio.")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
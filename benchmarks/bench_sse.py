@@ -0,0 +1,113 @@
+# benchmarks/bench_sse.py
+"""
+Compara la salida SSE anterior (un evento json.dumps por chunk y la respuesta
+acumulada con `+=`) con la actual (chunks agrupados por src.core.sse,
+codificación con orjson si está instalado y respuesta acumulada en una lista).
+Informa bytes/s, eventos enviados y CPU por respuesta. Cada evento se escribe en un socket local, que es donde
+se paga el coste por evento.
+
+Uso (desde la raíz del repositorio):
+    python -m benchmarks.bench_sse [--streams 200] [--chunks 400] [--chunk-delay 0.0]
+"""
+
+import argparse
+import asyncio
+import json
+import time
+
+from src.core import sse
+
+CHUNK_TEXT = "La Corte IDH ha sostenido que el derecho de acceso a la justicia "  # ~64 caracteres, como un chunk de Gemini
+
+async def _gemini(chunks: int, delay: float):
+    for i in range(chunks):
+        if delay:
+            await asyncio.sleep(delay)
+        yield f"{CHUNK_TEXT}{i} "
+
+class _Sink:
+    """Escribe cada evento en un socket local, como hace uvicorn con cada chunk de StreamingResponse."""
+
+    def __init__(self, writer: asyncio.StreamWriter, counters: dict):
+        self.writer = writer
+        self.counters = counters
+
+    async def write(self, data):
+        # StreamingResponse codifica a UTF-8 los str antes de escribir en el socket.
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        self.writer.write(data)
+        await self.writer.drain()
+        self.counters["bytes"] += len(data)
+        self.counters["frames"] += 1
+
+async def _legacy_response(chunks: int, delay: float, sink: _Sink):
+    full_response_text = ""
+    async for chunk in _gemini(chunks, delay):
+        await sink.write(f"data: {json.dumps({'text': chunk})}\n\n")
+        full_response_text += chunk
+    await sink.write(f"data: {json.dumps({'event': 'done'})}\n\n")
+    return full_response_text
+
+async def _coalesced_response(chunks: int, delay: float, sink: _Sink, max_chars: int, interval: float):
+    response_parts = []
+    async for text in sse.coalesce(_gemini(chunks, delay), max_chars, interval):
+        await sink.write(sse.encode_event({"text": text}))
+        response_parts.append(text)
+    await sink.write(sse.encode_event({"event": "done"}))
+    return "".join(response_parts)
+
+async def _run(mode: str, args) -> dict:
+    counters = {"bytes": 0, "frames": 0}
+    handlers = []
+
+    async def _discard(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        handlers.append(asyncio.current_task())
+        while await reader.read(65536):
+            pass
+        writer.close()
+
+    server = await asyncio.start_server(_discard, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    writers = [(await asyncio.open_connection("127.0.0.1", port))[1] for _ in range(args.streams)]
+    sinks = [_Sink(w, counters) for w in writers]
+
+    def make(sink):
+        if mode == "legacy":
+            return _legacy_response(args.chunks, args.chunk_delay, sink)
+        return _coalesced_response(args.chunks, args.chunk_delay, sink, args.max_chars, args.interval)
+
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    texts = await asyncio.gather(*(make(sink) for sink in sinks))
+    wall, cpu = time.perf_counter() - wall_start, time.process_time() - cpu_start
+    assert all(len(t) == len(texts[0]) for t in texts)
+
+    for writer in writers:
+        writer.close()
+    await asyncio.gather(*(w.wait_closed() for w in writers), *handlers)
+    server.close()
+    await server.wait_closed()
+    return {
+        "bytes_per_s": counters["bytes"] / wall,
+        "frames_per_response": counters["frames"] / args.streams,
+        "cpu_ms_per_response": cpu * 1000 / args.streams,
+        "wall_s": wall,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--streams", type=int, default=200, help="Respuestas concurrentes")
+    parser.add_argument("--chunks", type=int, default=400, help="Chunks de Gemini por respuesta")
+    parser.add_argument("--chunk-delay", type=float, default=0.0, help="Segundos entre chunks (0 = throughput máximo)")
+    parser.add_argument("--max-chars", type=int, default=512)
+    parser.add_argument("--interval", type=float, default=0.05)
+    args = parser.parse_args()
+
+    print(f"Codificador JSON: {'orjson' if sse.orjson is not None else 'json (stdlib)'}")
+    print(f"{'modo':<10} {'MB/s':>10} {'eventos/resp':>13} {'CPU ms/resp':>12} {'total s':>9}")
+    for mode in ("legacy", "coalesced"):
+        r = asyncio.run(_run(mode, args))
+        print(f"{mode:<10} {r['bytes_per_s'] / 1e6:>10.2f} {r['frames_per_response']:>13.1f} {r['cpu_ms_per_response']:>12.2f} {r['wall_s']:>9.2f}")
+
+if __name__ == "__main__":
+    main()
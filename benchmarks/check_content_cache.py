@@ -0,0 +1,119 @@
+# benchmarks/check_content_cache.py
+"""
+Comprueba la contabilidad de bytes de content_cache:
+
+  memoria   el LRU respeta CONTENT_CACHE_MAX_BYTES y su contador coincide con
+            la suma de las entradas (el tamaño se calcula al crear la entrada);
+  disco     el total de cache_size coincide con SUM(size) tras inserciones,
+            reemplazos de una misma URL y expulsiones, sin recorrer la tabla
+            en cada escritura, y no supera CONTENT_CACHE_DB_MAX_BYTES;
+  workers   otra conexión al mismo fichero (otro worker de uvicorn) mantiene
+            el mismo total;
+  previa    una base de datos creada antes de cache_size se inicializa con el
+            contenido que ya tenía.
+
+Termina con código 1 si falla alguna comprobación.
+
+Uso (desde la raíz del repositorio, con las variables de entorno de la app):
+    python -m benchmarks.check_content_cache [--documents 400]
+"""
+
+import argparse
+import asyncio
+import os
+import sqlite3
+import sys
+import tempfile
+
+from src.config import settings
+from src.modules import content_cache
+
+def _totals(path: str):
+    conn = sqlite3.connect(path)
+    try:
+        tracked = conn.execute("SELECT total FROM cache_size WHERE id = 0").fetchone()[0]
+        actual = conn.execute("SELECT COALESCE(SUM(size), 0) FROM documents").fetchone()[0]
+    finally:
+        conn.close()
+    return tracked, actual
+
+async def _run(args, workdir: str) -> list:
+    failures = []
+
+    def check(condition: bool, message: str):
+        print(f"  {'OK   ' if condition else 'FALLO'} {message}")
+        if not condition:
+            failures.append(message)
+
+    text = "Corte Interamericana — acceso a la justicia. " * 40  # Con caracteres de varios bytes
+
+    print("memoria:")
+    settings.CONTENT_CACHE_DB_PATH = None
+    settings.CONTENT_CACHE_MAX_BYTES = len(text.encode("utf-8")) * 10
+    for i in range(args.documents):
+        await content_cache.store(f"https://ejemplo.org/{i % 30}", text + str(i))
+    memory_bytes = sum(doc.size for doc in content_cache._memory.values())
+    check(content_cache._memory_bytes == memory_bytes, f"contador del LRU = suma de las entradas ({memory_bytes} bytes)")
+    check(memory_bytes <= settings.CONTENT_CACHE_MAX_BYTES, "el LRU no supera CONTENT_CACHE_MAX_BYTES")
+    check(all(doc.size == len(doc.text.encode("utf-8")) for doc in content_cache._memory.values()), "size = bytes del texto en UTF-8")
+
+    print("disco:")
+    path = os.path.join(workdir, "cache.sqlite")
+    settings.CONTENT_CACHE_DB_PATH = path
+    settings.CONTENT_CACHE_DB_MAX_BYTES = len(text.encode("utf-8")) * 50
+    statements = []
+    content_cache._get_db().set_trace_callback(statements.append)
+    for i in range(args.documents):
+        # Reescribe URLs ya guardadas y con textos de distinto tamaño.
+        await content_cache.store(f"https://ejemplo.org/{i % 120}", text * (1 + i % 3))
+    tracked, actual = _totals(path)
+    check(tracked == actual, f"cache_size = SUM(size) ({tracked} bytes)")
+    check(actual <= settings.CONTENT_CACHE_DB_MAX_BYTES, "el disco no supera CONTENT_CACHE_DB_MAX_BYTES")
+    check(content_cache._stats["evictions"] > 0, f"hubo expulsiones ({content_cache._stats['evictions']})")
+    scans = [s for s in statements if "SUM(size)" in s]
+    check(not scans, f"ninguna escritura recorre la tabla ({len(scans)} SUM(size))")
+
+    print("workers:")
+    content_cache.close()
+    other = sqlite3.connect(path)
+    other.execute("DELETE FROM documents WHERE url = ?", ("https://ejemplo.org/0",))
+    other.commit()
+    other.close()
+    for i in range(20):
+        await content_cache.store(f"https://otro.org/{i}", text)
+    tracked, actual = _totals(path)
+    check(tracked == actual, f"con otra conexión escribiendo, cache_size = SUM(size) ({tracked} bytes)")
+    content_cache.close()
+
+    print("previa:")
+    legacy = os.path.join(workdir, "previa.sqlite")
+    conn = sqlite3.connect(legacy)
+    conn.execute(
+        "CREATE TABLE documents ("
+        " url TEXT PRIMARY KEY, text TEXT NOT NULL, etag TEXT, last_modified TEXT,"
+        " fetched_at REAL NOT NULL, last_access REAL NOT NULL, size INTEGER NOT NULL)"
+    )
+    conn.executemany("INSERT INTO documents VALUES (?, ?, NULL, NULL, 0, 0, ?)", [(f"u{i}", "x" * 100, 100) for i in range(7)])
+    conn.commit()
+    conn.close()
+    settings.CONTENT_CACHE_DB_PATH = legacy
+    await content_cache.store("https://nueva.org/", "y" * 50)
+    tracked, actual = _totals(legacy)
+    check(tracked == actual == 750, f"cache_size incluye las entradas previas ({tracked} bytes)")
+    content_cache.close()
+    return failures
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documents", type=int, default=400, help="Escrituras en cada nivel")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        failures = asyncio.run(_run(args, workdir))
+    if failures:
+        print(f"FALLO: {len(failures)} comprobaciones fallidas.")
+        sys.exit(1)
+    print("OK: la caché lleva la cuenta de sus bytes sin recalcularlos.")
+
+if __name__ == "__main__":
+    main()
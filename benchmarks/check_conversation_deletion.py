@@ -0,0 +1,123 @@
+# benchmarks/check_conversation_deletion.py
+"""
+Comprueba la eliminación de conversaciones en segundo plano contra el
+Firestore en memoria de benchmarks.fakes:
+
+  - idas y vueltas a Firestore: borrar N mensajes debe costar unas pocas
+    lecturas de IDs y ceil(N / DELETE_BATCH_SIZE) batches, no una por mensaje;
+  - corrección: no quedan mensajes ni el documento de la conversación, el
+    trabajo termina en 'done' con el recuento correcto y otra conversación
+    del mismo usuario no se toca;
+  - escrituras tardías: un mensaje que se está confirmando al empezar el
+    borrado, o una respuesta encolada después, no vuelven a crear la conversación.
+
+Termina con código 1 si falla alguna comprobación.
+
+Uso (desde la raíz del repositorio, con las variables de entorno de la app):
+    python -m benchmarks.check_conversation_deletion [--messages 1200] [--latency 0.005]
+"""
+
+import argparse
+import asyncio
+import math
+import sys
+
+from src.config import settings
+from src.models.chat_models import ChatMessage
+from src.modules import firestore_client
+from benchmarks.fakes import FakeFirestore
+
+USER_ID = "check-deletion"
+
+class CountingFirestore(FakeFirestore):
+    """FakeFirestore que cuenta las idas y vueltas (cada operación espera una vez la latencia)."""
+
+    def __init__(self, latency: float = 0.0):
+        super().__init__(latency)
+        self.round_trips = 0
+
+    async def _delay(self):
+        self.round_trips += 1
+        await super()._delay()
+
+def _messages(db: FakeFirestore, convo_id: str):
+    return db._collection(("users", USER_ID, "conversations", convo_id, "messages"))
+
+def _conversations(db: FakeFirestore):
+    return db._collection(("users", USER_ID, "conversations"))
+
+async def _seed(db: FakeFirestore, convo_id: str, count: int):
+    _conversations(db)[convo_id] = {"title": convo_id, "message_count": count}
+    messages = _messages(db, convo_id)
+    for i in range(count):
+        messages[f"m{i:06d}"] = {"role": "user" if i % 2 == 0 else "model", "content": f"mensaje {i}", "timestamp": i}
+
+async def _wait_for_job(convo_id: str):
+    task = firestore_client._deletion_tasks.get((USER_ID, convo_id))
+    if task is not None:
+        await task
+
+async def _run(args) -> list:
+    failures = []
+
+    def check(condition: bool, message: str):
+        print(f"  {'OK   ' if condition else 'FALLO'} {message}")
+        if not condition:
+            failures.append(message)
+
+    db = CountingFirestore(latency=args.latency)
+    firestore_client._db = db
+    firestore_client.start_persistence_worker()
+
+    print(f"Borrado de {args.messages} mensajes:")
+    await _seed(db, "grande", args.messages)
+    await _seed(db, "otra", 3)
+    db.round_trips = 0
+    await firestore_client.start_conversation_deletion(USER_ID, "grande")
+    await _wait_for_job("grande")
+    round_trips = db.round_trips
+    status = await firestore_client.get_deletion_status(USER_ID, "grande")
+    rounds = math.ceil(args.messages / (settings.DELETE_BATCH_SIZE * settings.DELETE_PARALLELISM))
+    # Registro del trabajo y marca 'deleting' (2); por cada tanda, lectura de IDs, batches y progreso;
+    # lectura final vacía, borrado del documento y estado 'done' (3).
+    expected = 2 + rounds * 2 + math.ceil(args.messages / settings.DELETE_BATCH_SIZE) + 3
+    print(f"  idas y vueltas a Firestore: {round_trips} (esperadas {expected}, una por mensaje serían {args.messages})")
+    check(round_trips <= expected, f"como mucho {expected} idas y vueltas")
+    check(status is not None and status["status"] == "done", f"el trabajo termina en 'done' ({status})")
+    check(status is not None and status["deleted_messages"] == args.messages, "recuento de mensajes eliminados")
+    check(not _messages(db, "grande"), "no quedan mensajes")
+    check("grande" not in _conversations(db), "no queda el documento de la conversación")
+    check(len(_messages(db, "otra")) == 3 and "otra" in _conversations(db), "la otra conversación sigue intacta")
+
+    print("Escrituras tardías:")
+    await _seed(db, "tardia", 2)
+    # Un mensaje en un batch ya en curso al empezar el borrado...
+    firestore_client.enqueue_message(USER_ID, "tardia", ChatMessage(role="user", content="pregunta"))
+    while not firestore_client._in_flight:
+        await asyncio.sleep(0)
+    await firestore_client.start_conversation_deletion(USER_ID, "tardia")
+    # ...y la respuesta de una generación que termina después.
+    firestore_client.enqueue_message(USER_ID, "tardia", ChatMessage(role="model", content="respuesta tardía"))
+    await _wait_for_job("tardia")
+    status = await firestore_client.get_deletion_status(USER_ID, "tardia")
+    firestore_client.enqueue_message(USER_ID, "tardia", ChatMessage(role="model", content="respuesta tras 'done'"))
+    await firestore_client.stop_persistence_worker()
+    check(status is not None and status["status"] == "done", "el trabajo termina en 'done'")
+    check("tardia" not in _conversations(db), "la conversación no se vuelve a crear")
+    check(not _messages(db, "tardia"), "no quedan mensajes huérfanos")
+    return failures
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=1200, help="Mensajes de la conversación a borrar")
+    parser.add_argument("--latency", type=float, default=0.005, help="Latencia de cada operación de Firestore (s)")
+    args = parser.parse_args()
+
+    failures = asyncio.run(_run(args))
+    if failures:
+        print(f"FALLO: {len(failures)} comprobaciones fallidas.")
+        sys.exit(1)
+    print("OK: eliminación correcta y con pocas idas y vueltas.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+# benchmarks/check_extraction_cpu_cap.py
+"""
+Comprueba que el pool de extracción en modo 'process' impone de verdad
+EXTRACTION_CPU_BUDGET, con la extracción patológica de benchmarks.fakes
+(Python puro que absorbe cualquier Exception en cada paso):
+
+  - una extracción de --cpu-seconds se detiene al agotar el presupuesto
+    (más el redondeo a segundos enteros de RLIMIT_CPU) y devuelve None;
+  - una extracción dentro del presupuesto termina con su texto;
+  - el trabajador sigue sirviendo documentos y el pool no se recrea.
+
+Termina con código 1 si falla alguna comprobación.
+
+Uso (desde la raíz del repositorio, con las variables de entorno de la app):
+    python -m benchmarks.check_extraction_cpu_cap [--budget 1.0] [--cpu-seconds 4.0] [--slack 0.5]
+"""
+
+import argparse
+import asyncio
+import sys
+import time
+
+from src.config import settings
+from src.modules import extraction_pool
+from benchmarks.fakes import busy_extraction
+
+async def _run(args) -> list:
+    failures = []
+
+    def check(condition: bool, message: str):
+        print(f"  {'OK   ' if condition else 'FALLO'} {message}")
+        if not condition:
+            failures.append(message)
+
+    settings.EXTRACTION_EXECUTOR = "process"
+    settings.EXTRACTION_WORKERS = 1
+    settings.EXTRACTION_CPU_BUDGET = args.budget
+    settings.EXTRACTION_TIMEOUT = args.cpu_seconds * 3
+    extraction_pool.startup()
+    executor = extraction_pool._executor
+    try:
+        await extraction_pool.run(busy_extraction, 0.0)  # Espera a que arranque el trabajador.
+
+        print(f"patológica ({args.cpu_seconds}s de CPU, presupuesto {args.budget}s):")
+        started = time.perf_counter()
+        text = await extraction_pool.run(busy_extraction, args.cpu_seconds)
+        wall = time.perf_counter() - started
+        # RLIMIT_CPU cuenta segundos enteros: el corte llega como mucho un segundo después.
+        limit = args.budget + 1 + args.slack
+        print(f"  duración {wall:.2f}s (límite {limit:.2f}s)")
+        check(text is None, "se usa el snippet (devuelve None)")
+        check(wall <= limit, "se detiene al agotar el presupuesto")
+
+        print("dentro del presupuesto:")
+        text = await extraction_pool.run(busy_extraction, args.budget / 4)
+        check(text is not None, "devuelve el texto extraído")
+        check(extraction_pool._executor is executor, "el mismo pool sigue sirviendo (no se recreó)")
+    finally:
+        extraction_pool.shutdown()
+    return failures
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--budget", type=float, default=1.0, help="EXTRACTION_CPU_BUDGET (s)")
+    parser.add_argument("--cpu-seconds", type=float, default=4.0, help="CPU que consume la extracción patológica (s)")
+    parser.add_argument("--slack", type=float, default=0.5, help="Margen para el planificador (s)")
+    args = parser.parse_args()
+
+    failures = asyncio.run(_run(args))
+    if failures:
+        print(f"FALLO: {len(failures)} comprobaciones fallidas.")
+        sys.exit(1)
+    print("OK: el tope de CPU por documento se cumple aunque la extracción absorba las excepciones.")
+
+if __name__ == "__main__":
+    main()
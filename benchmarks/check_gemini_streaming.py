@@ -0,0 +1,139 @@
+# benchmarks/check_gemini_streaming.py
+"""
+Comprueba que el streaming de Gemini no bloquea el event loop y que se cancela
+cuando el cliente se va, con el modelo falso de benchmarks.fakes (chunks con
+retardo) en lugar de Vertex AI:
+
+  servicio     mientras se genera una respuesta de chat (src.main:app, en
+               proceso), se piden otras rutas (/status) y deben responder al
+               momento, no al terminar la generación;
+  desconexión  un cliente lee unos pocos eventos y se desconecta: pasado
+               SSE_RESUME_GRACE la generación se cancela y el modelo deja de
+               emitir chunks (se cierra su stream).
+
+Termina con código 1 si falla alguna comprobación.
+
+Uso (desde la raíz del repositorio, con las variables de entorno de la app):
+    python -m benchmarks.check_gemini_streaming [--chunks 40] [--chunk-interval 0.05]
+"""
+
+import argparse
+import asyncio
+import sys
+import time
+
+import httpx
+
+from src.config import settings
+from src.modules import firestore_client, gemini_client, rag_client, stream_registry
+from benchmarks.fakes import FakeFirestore, FakeGenerativeModel, FakeUpstream
+
+class CountingModel(FakeGenerativeModel):
+    """Modelo falso que cuenta los chunks emitidos y si su stream se cerró antes de terminar."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.emitted = 0
+        self.closed_early = False
+
+    async def _stream(self):
+        finished = False
+        try:
+            async for chunk in super()._stream():
+                self.emitted += 1
+                yield chunk
+            finished = True
+        finally:
+            if not finished:
+                self.closed_early = True
+
+async def _serving_check(app, model: CountingModel, check):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://app", timeout=60) as client:
+        headers = {"X-User-ID": "check-streaming"}
+        convo_id = (await client.post("/conversations", json={"title": "Comprobación"}, headers=headers)).json()["id"]
+        started = time.perf_counter()
+        chat = asyncio.create_task(client.post(f"/chat-stream/{convo_id}", json={"prompt": "¿Qué es el control de convencionalidad?"}, headers=headers))
+
+        latencies = []
+        while not chat.done():
+            if model.emitted:
+                before = time.perf_counter()
+                await client.get("/status")
+                latencies.append(time.perf_counter() - before)
+            await asyncio.sleep(0.02)
+        response = await chat
+        total = time.perf_counter() - started
+
+    worst = max(latencies) if latencies else float("inf")
+    print(f"  generación {total:.2f}s; {len(latencies)} peticiones a /status durante ella, la más lenta {worst * 1000:.1f}ms")
+    check(b'"done"' in response.content, "la respuesta de chat termina")
+    check(len(latencies) >= 5, "se sirvieron otras peticiones durante la generación")
+    check(worst < 0.1, "ninguna esperó a que terminara la generación (< 100ms)")
+
+async def _disconnect_check(model: CountingModel, check):
+    settings.SSE_RESUME_GRACE = 0.2
+    model.emitted, model.closed_early = 0, False
+
+    async def frames():
+        async for text in gemini_client.generate_streaming_response("Pregunta", []):
+            yield text.encode()
+
+    stream = stream_registry.start("check-streaming", "desconexion", frames())
+    subscriber = stream_registry.subscribe(stream)
+    for _ in range(3):
+        await subscriber.__anext__()
+    await subscriber.aclose()  # El cliente se desconecta.
+    emitted_at_disconnect = model.emitted
+
+    await asyncio.sleep(settings.SSE_RESUME_GRACE + 0.1)
+    emitted_after_grace = model.emitted
+    await asyncio.sleep(model.chunk_interval * 5)
+    print(f"  chunks emitidos: {emitted_at_disconnect} al desconectar, {model.emitted} al final (de {model.chunks})")
+    check(stream.task.cancelled(), "la generación se cancela pasado SSE_RESUME_GRACE")
+    check(model.closed_early, "el stream del modelo se cierra")
+    check(model.emitted == emitted_after_grace < model.chunks, "el modelo deja de emitir chunks")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=40, help="Chunks de cada respuesta del modelo falso")
+    parser.add_argument("--chunk-interval", type=float, default=0.05, help="Segundos entre chunks")
+    args = parser.parse_args()
+
+    settings.CLOUD_LOGGING_ENABLED = False
+    settings.WARMUP_ON_STARTUP = False
+    model = CountingModel(chunks=args.chunks, chunk_interval=args.chunk_interval, first_token_delay=0.2)
+    gemini_client.model = model
+    gemini_client.summary_model = FakeGenerativeModel(first_token_delay=0.0)
+    firestore_client._db = FakeFirestore(latency=0.0)
+    failures = []
+
+    def check(condition: bool, message: str):
+        print(f"  {'OK   ' if condition else 'FALLO'} {message}")
+        if not condition:
+            failures.append(message)
+
+    async def run():
+        from src.main import app
+
+        upstream = FakeUpstream(pse_latency=0.0, page_latency=0.0, rag_latency=0.0)
+        base_url = await upstream.start()
+        settings.PSE_SEARCH_URL = f"{base_url}/customsearch/v1"
+        rag_client.RAG_API_URL = f"{base_url}/query"
+        try:
+            async with app.router.lifespan_context(app):
+                print("servicio:")
+                await _serving_check(app, model, check)
+                print("desconexión:")
+                await _disconnect_check(model, check)
+        finally:
+            await upstream.stop()
+
+    asyncio.run(run())
+    if failures:
+        print(f"FALLO: {len(failures)} comprobaciones fallidas.")
+        sys.exit(1)
+    print("OK: el streaming no bloquea el event loop y se cancela al desconectarse el cliente.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+# benchmarks/check_import_time.py
+"""
+Comprueba el presupuesto de importación de la aplicación: importar src.main no
+debe cargar las dependencias pesadas (SDK de Vertex AI, Firestore/gRPC, Cloud
+Logging, pypdf, lxml), que se inicializan de forma diferida, y
+debe tardar menos que el presupuesto. Así /status responde en un arranque en
+frío antes de que se cargue nada de eso.
+
+Ejecuta `python -X importtime -c "import src.main"` en un proceso limpio.
+Después arranca la aplicación con uvicorn (con la configuración por defecto,
+p. ej. CLOUD_LOGGING_ENABLED=True) y mide el tiempo hasta que /status
+responde: el lifespan tampoco debe esperar por los clientes de la nube.
+Termina con código 1 si se incumple alguna de las condiciones.
+
+Uso (desde la raíz del repositorio):
+    python -m benchmarks.check_import_time [--budget 1.0] [--startup-budget 2.0] [--top 15]
+"""
+
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+
+HEAVY_MODULES = (
+    "vertexai",
+    "google.cloud.aiplatform",
+    "google.cloud.firestore",
+    "google.cloud.logging",
+    "grpc",
+    "pypdf",
+    "lxml",
+)
+
+# Valores de relleno para las variables obligatorias de Settings; no se usan al importar.
+PLACEHOLDER_ENV = {
+    "GOOGLE_CLOUD_PROJECT": "import-check",
+    "GOOGLE_CLOUD_LOCATION": "us-central1",
+    "GEMINI_MODEL": "import-check",
+    "PSE_API_KEY": "import-check",
+    "PSE_ID": "import-check",
+}
+
+def _measure():
+    env = {**PLACEHOLDER_ENV, **os.environ}
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import src.main"],
+        capture_output=True, text=True, env=env,
+    )
+    if result.returncode != 0:
+        sys.exit(f"No se pudo importar src.main:\n{result.stderr}")
+
+    # Formato de cada línea: "import time: <propio us> | <acumulado us> | <sangría><módulo>"
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        _, self_us, cumulative_us, name = (part.strip() for part in line.replace("import time:", "|", 1).split("|"))
+        modules[name] = (int(self_us), int(cumulative_us))
+    return modules
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def _measure_startup(timeout: float = 30.0) -> float:
+    """Segundos desde que se lanza uvicorn hasta que GET /status responde 200."""
+    env = {**PLACEHOLDER_ENV, **os.environ}
+    port = _free_port()
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "src.main:app", "--port", str(port), "--log-level", "warning"],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - started < timeout:
+            if process.poll() is not None:
+                sys.exit("uvicorn terminó antes de responder a /status.")
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/status", timeout=1) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - started
+            except OSError:
+                pass
+            time.sleep(0.02)
+        sys.exit(f"/status no respondió en {timeout}s.")
+    finally:
+        process.terminate()
+        process.wait()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--budget", type=float, default=1.0, help="Segundos máximos para importar src.main")
+    parser.add_argument("--startup-budget", type=float, default=2.0, help="Segundos máximos hasta que /status responde")
+    parser.add_argument("--top", type=int, default=15, help="Módulos más lentos a mostrar")
+    args = parser.parse_args()
+
+    modules = _measure()
+    total = modules["src.main"][1] / 1e6
+    heavy = sorted(
+        name for name in modules
+        if any(name == prefix or name.startswith(prefix + ".") for prefix in HEAVY_MODULES)
+    )
+
+    print(f"{'acumulado ms':>13}  módulo")
+    for name, (_, cumulative) in sorted(modules.items(), key=lambda m: m[1][1], reverse=True)[:args.top]:
+        print(f"{cumulative / 1000:>13.1f}  {name}")
+    print(f"\nimport src.main: {total:.3f}s (presupuesto {args.budget:.3f}s)")
+    startup = _measure_startup()
+    print(f"arranque hasta que /status responde: {startup:.3f}s (presupuesto {args.startup_budget:.3f}s)")
+
+    failed = False
+    if heavy:
+        print(f"ERROR: dependencias pesadas cargadas al importar: {', '.join(heavy[:10])}{' ...' if len(heavy) > 10 else ''}")
+        failed = True
+    if total > args.budget:
+        print("ERROR: se supera el presupuesto de importación.")
+        failed = True
+    if startup > args.startup_budget:
+        print("ERROR: se supera el presupuesto de arranque.")
+        failed = True
+    if failed:
+        sys.exit(1)
+    print("OK")
+
+if __name__ == "__main__":
+    main()
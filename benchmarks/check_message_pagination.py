@@ -0,0 +1,135 @@
+# benchmarks/check_message_pagination.py
+"""
+Comprueba los listados de conversaciones y mensajes contra el Firestore en
+memoria de benchmarks.fakes, a través de la aplicación (src.main:app, en
+proceso):
+
+  sin paginar  GET /conversations/{id}/messages sin limit ni cursor devuelve
+               la conversación completa, sin cabecera X-Next-Cursor;
+  paginado     recorrer las páginas con el cursor devuelve todos los mensajes
+               una sola vez y en orden, con una ida y vuelta a Firestore por
+               página (el cursor no obliga a releer el último documento);
+  pendientes   la última página incluye la respuesta que la cola de escritura
+               aún no ha confirmado (lectura de lo propio tras el 'done');
+  recuento     una conversación anterior al contador message_count lo
+               devuelve como desconocido (null), no como un número erróneo.
+
+Termina con código 1 si falla alguna comprobación.
+
+Uso (desde la raíz del repositorio, con las variables de entorno de la app):
+    python -m benchmarks.check_message_pagination [--messages 450] [--page-size 200]
+"""
+
+import argparse
+import asyncio
+import datetime
+import math
+import sys
+
+import httpx
+
+from src.config import settings
+from src.models.chat_models import ChatMessage
+from src.modules import firestore_client
+from benchmarks.fakes import FakeFirestore
+
+USER_ID = "check-pagination"
+HEADERS = {"X-User-ID": USER_ID}
+
+class CountingFirestore(FakeFirestore):
+    """FakeFirestore que cuenta las idas y vueltas (cada operación espera una vez la latencia)."""
+
+    def __init__(self, latency: float = 0.0):
+        super().__init__(latency)
+        self.round_trips = 0
+
+    async def _delay(self):
+        self.round_trips += 1
+        await super()._delay()
+
+def _seed(db: FakeFirestore, convo_id: str, count: int, **convo_fields):
+    start = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+    db._collection(("users", USER_ID, "conversations"))[convo_id] = {"title": convo_id, "created_at": start, **convo_fields}
+    messages = db._collection(("users", USER_ID, "conversations", convo_id, "messages"))
+    for i in range(count):
+        # Pares de mensajes con el mismo timestamp: el orden lo desempata el ID.
+        messages[f"m{i:06d}"] = {"role": "user" if i % 2 == 0 else "model", "content": f"mensaje {i}",
+                                 "timestamp": start + datetime.timedelta(seconds=i // 2)}
+
+async def _run(args) -> list:
+    failures = []
+
+    def check(condition: bool, message: str):
+        print(f"  {'OK   ' if condition else 'FALLO'} {message}")
+        if not condition:
+            failures.append(message)
+
+    from src.main import app
+
+    settings.MESSAGES_PAGE_SIZE = args.page_size
+    db = CountingFirestore()
+    firestore_client._db = db
+    _seed(db, "larga", args.messages, message_count=args.messages, message_count_exact=True)
+    expected = [f"mensaje {i}" for i in range(args.messages)]
+    url = "/conversations/larga/messages"
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://app") as client:
+        print("sin paginar:")
+        response = await client.get(url, headers=HEADERS)
+        check([m["content"] for m in response.json()] == expected, f"devuelve los {args.messages} mensajes en orden")
+        check("X-Next-Cursor" not in response.headers, "sin cabecera X-Next-Cursor")
+
+        print(f"paginado (limit={args.page_size}):")
+        contents, cursor, pages = [], None, 0
+        db.round_trips = 0
+        while True:
+            params = {"limit": args.page_size, **({"cursor": cursor} if cursor else {})}
+            response = await client.get(url, params=params, headers=HEADERS)
+            contents += [m["content"] for m in response.json()]
+            pages += 1
+            cursor = response.headers.get("X-Next-Cursor")
+            if not cursor:
+                break
+        expected_pages = math.ceil(args.messages / args.page_size)
+        check(contents == expected, "todas las páginas juntas: cada mensaje una vez y en orden")
+        check(db.round_trips == pages, f"una ida y vuelta por página ({db.round_trips} para {pages} páginas)")
+        check(pages in (expected_pages, expected_pages + 1), f"{pages} páginas")
+        response = await client.get(url, params={"cursor": "no-es-un-cursor"}, headers=HEADERS)
+        check(response.status_code == 400, "un cursor no válido devuelve 400")
+
+        print("pendientes:")
+        # Pendiente, en curso o ya escrita: la respuesta aparece una sola vez.
+        firestore_client.enqueue_message(USER_ID, "larga", ChatMessage(role="model", content="respuesta sin confirmar"))
+        response = await client.get(url, params={"limit": args.messages + 10}, headers=HEADERS)
+        contents = [m["content"] for m in response.json()]
+        check(contents[-1:] == ["respuesta sin confirmar"] and contents.count("respuesta sin confirmar") == 1,
+              "la última página incluye la respuesta encolada")
+        response = await client.get(url, params={"limit": 2}, headers=HEADERS)
+        check(all(m["content"] != "respuesta sin confirmar" for m in response.json()), "las páginas intermedias no la incluyen")
+        await firestore_client.stop_persistence_worker()
+
+        print("recuento:")
+        # Anterior al contador: el primer Increment creó el campo contando desde 0.
+        _seed(db, "antigua", 10, message_count=2)
+        response = await client.get("/conversations", headers=HEADERS)
+        counts = {c["id"]: c["message_count"] for c in response.json()}
+        check(counts.get("antigua", 0) is None, f"conversación antigua: message_count desconocido ({counts.get('antigua')})")
+        check(counts.get("larga") == args.messages + 1, f"conversación con contador: message_count exacto ({counts.get('larga')})")
+        for task in list(firestore_client._backfill_tasks.values()):
+            await task  # El recálculo necesita transacciones de Firestore; con el falso solo se registra el aviso.
+    return failures
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=450, help="Mensajes de la conversación")
+    parser.add_argument("--page-size", type=int, default=200, help="limit de cada página")
+    args = parser.parse_args()
+
+    failures = asyncio.run(_run(args))
+    if failures:
+        print(f"FALLO: {len(failures)} comprobaciones fallidas.")
+        sys.exit(1)
+    print("OK: los listados devuelven todo, paginan sin lecturas extra e incluyen lo pendiente.")
+
+if __name__ == "__main__":
+    main()
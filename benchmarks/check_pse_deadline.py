@@ -0,0 +1,86 @@
+# benchmarks/check_pse_deadline.py
+"""
+Comprueba que la etapa de búsqueda externa (PSE) está acotada, contra el
+servidor HTTP local falso de benchmarks.fakes:
+
+  paralelo  las páginas tardan --page-latency cada una: la etapa debe durar
+            aprox. la búsqueda más la descarga más lenta, no la suma de todas;
+  plazo     las páginas tardan más que PSE_SEARCH_DEADLINE (--deadline): la
+            etapa debe terminar al vencer el plazo y usar los snippets.
+
+Termina con código 1 si falla alguna comprobación.
+
+Uso (desde la raíz del repositorio, con las variables de entorno de la app):
+    python -m benchmarks.check_pse_deadline [--page-latency 0.5] [--deadline 1.0] [--slack 0.3]
+"""
+
+import argparse
+import asyncio
+import sys
+import time
+
+from src.config import settings
+from src.modules import extraction_pool, http_clients, pse_client
+from benchmarks.fakes import FakeUpstream
+
+SEARCH_LATENCY = 0.05
+SNIPPET = "Fragmento del resultado de búsqueda."
+
+async def _search(query: str):
+    started = time.perf_counter()
+    result = await pse_client.search_source_documents(query, num_results=3)
+    return result.documents, time.perf_counter() - started
+
+async def _run(args) -> list:
+    failures = []
+
+    def check(condition: bool, message: str):
+        print(f"  {'OK   ' if condition else 'FALLO'} {message}")
+        if not condition:
+            failures.append(message)
+
+    upstream = FakeUpstream(pse_latency=SEARCH_LATENCY, pse_results=3, page_latency=args.page_latency, page_kb=16)
+    settings.PSE_SEARCH_URL = f"{await upstream.start()}/customsearch/v1"
+    settings.PSE_SEARCH_DEADLINE = args.deadline
+    # Todas las páginas falsas están en el mismo host; las reales suelen ser de dominios distintos.
+    settings.PSE_MAX_CONNECTIONS_PER_HOST = 3
+    settings.PSE_FETCH_CONCURRENCY = 3
+    await http_clients.startup()
+    extraction_pool.startup()
+    try:
+        print(f"paralelo (3 páginas de {args.page_latency}s, plazo {args.deadline}s):")
+        documents, wall = await _search("consulta paralela")
+        slowest = SEARCH_LATENCY + args.page_latency
+        print(f"  duración {wall:.3f}s; búsqueda + página más lenta = {slowest:.3f}s; en serie serían {SEARCH_LATENCY + 3 * args.page_latency:.3f}s")
+        check(len(documents) == 3, "tres documentos")
+        check(wall <= slowest + args.slack, f"la etapa dura como la descarga más lenta (+{args.slack}s)")
+        check(all(doc.content != SNIPPET for doc in documents), "todas las páginas aportan su contenido")
+
+        upstream.page_latency = args.deadline * 3
+        print(f"plazo (3 páginas de {upstream.page_latency}s, plazo {args.deadline}s):")
+        documents, wall = await _search("consulta con plazo")
+        print(f"  duración {wall:.3f}s")
+        check(len(documents) == 3, "tres documentos")
+        check(args.deadline <= wall <= args.deadline + args.slack, f"la etapa termina al vencer el plazo (+{args.slack}s)")
+        check(all(doc.content == SNIPPET for doc in documents), "las páginas sin terminar usan su snippet")
+    finally:
+        extraction_pool.shutdown()
+        await http_clients.shutdown()
+        await upstream.stop()
+    return failures
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--page-latency", type=float, default=0.5, help="Latencia de cada página en la fase 'paralelo' (s)")
+    parser.add_argument("--deadline", type=float, default=1.0, help="PSE_SEARCH_DEADLINE (s)")
+    parser.add_argument("--slack", type=float, default=0.3, help="Margen para la extracción y el planificador (s)")
+    args = parser.parse_args()
+
+    failures = asyncio.run(_run(args))
+    if failures:
+        print(f"FALLO: {len(failures)} comprobaciones fallidas.")
+        sys.exit(1)
+    print("OK: la etapa de búsqueda está acotada por la descarga más lenta y por el plazo.")
+
+if __name__ == "__main__":
+    main()
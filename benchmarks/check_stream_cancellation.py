@@ -0,0 +1,89 @@
+# benchmarks/check_stream_cancellation.py
+"""
+Comprueba que una generación del registro de streams cancelada antes de su
+primer paso (justo después de stream_registry.start) se limpia igual que una
+que llega a ejecutarse:
+
+  - el ticket de admisión se libera (activos y en cola vuelven a cero);
+  - subscribe() termina en lugar de esperar a un stream que nunca acaba.
+
+Se cancela de las tres formas que usa la aplicación: al eliminar la
+conversación (cancel_conversation), al apagar (shutdown) y al vencer
+SSE_RESUME_GRACE sin clientes; y con el ticket admitido y en cola.
+
+Termina con código 1 si falla alguna comprobación.
+
+Uso (desde la raíz del repositorio, con las variables de entorno de la app):
+    python -m benchmarks.check_stream_cancellation
+"""
+
+import asyncio
+import functools
+import sys
+
+from src.config import settings
+from src.core import admission
+from src.modules import stream_registry
+
+USER_ID = "check-cancel"
+
+async def _frames():
+    yield b"data: {}\n\n"
+
+async def _cancel_conversation(stream):
+    await stream_registry.cancel_conversation(stream.user_id, stream.convo_id)
+
+async def _shutdown(stream):
+    await stream_registry.shutdown()
+
+async def _grace(stream):
+    stream_registry._cancel_abandoned(stream)
+
+async def _start_and_cancel(main, cancel, queued: bool, check):
+    blocker = admission.reserve("otro-usuario") if queued else None
+    ticket = admission.reserve(USER_ID)
+    stream = stream_registry.start(
+        USER_ID, "convo", main._admitted(ticket, _frames()), on_done=functools.partial(admission.release, ticket)
+    )
+    await cancel(stream)  # Antes de que la tarea dé su primer paso.
+    if blocker is not None:
+        admission.release(blocker)
+
+    events = []
+    try:
+        async with asyncio.timeout(2):
+            async for frame in stream_registry.subscribe(stream):
+                events.append(frame)
+        ended = True
+    except TimeoutError:
+        ended = False
+    stats = admission.stats()
+    check(stream.task.cancelled(), "la tarea se canceló antes de empezar")
+    check(ended, "subscribe() termina")
+    check(stats["active"] == 0 and stats["waiting"] == 0, f"el ticket se libera (activos {stats['active']}, en cola {stats['waiting']})")
+
+def main():
+    settings.ADMISSION_MAX_ACTIVE = 1
+    failures = []
+
+    def check(condition: bool, message: str):
+        print(f"  {'OK   ' if condition else 'FALLO'} {message}")
+        if not condition:
+            failures.append(message)
+
+    async def run():
+        import src.main as app_main
+
+        for name, cancel in (("cancel_conversation", _cancel_conversation), ("shutdown", _shutdown), ("SSE_RESUME_GRACE", _grace)):
+            for queued in (False, True):
+                print(f"{name}, ticket {'en cola' if queued else 'admitido'}:")
+                await _start_and_cancel(app_main, cancel, queued, check)
+
+    asyncio.run(run())
+    if failures:
+        print(f"FALLO: {len(failures)} comprobaciones fallidas.")
+        sys.exit(1)
+    print("OK: las generaciones canceladas antes de empezar liberan su ticket y terminan sus suscripciones.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+# benchmarks/check_system_prompt.py
+"""
+Comprueba que el prompt de sistema (PIDA_SYSTEM_PROMPT) no viaja en los
+mensajes ni se acumula en el historial: conversa varios turnos con la
+aplicación real (src.main:app, en proceso) usando el modelo falso de
+benchmarks.fakes, que registra lo que recibe en cada turno, y los servidores
+PSE/RAG falsos.
+
+Por cada turno informa de los tokens de entrada estimados (historial + mensaje)
+y de los que se habrían enviado pegando el prompt de sistema al mensaje, como
+antes. Con --context-cache se simula una caché de contexto de Vertex AI para
+ejercitar también ese camino y su contador de tokens ahorrados.
+
+Termina con código 1 si algún mensaje o historial contiene el prompt de sistema.
+
+Uso (desde la raíz del repositorio, con las variables de entorno de la app):
+    python -m benchmarks.check_system_prompt [--turns 5] [--context-cache]
+"""
+
+import argparse
+import asyncio
+import sys
+
+import httpx
+
+from src.config import settings
+from src.core.prompts import PIDA_SYSTEM_PROMPT
+from src.modules import firestore_client, gemini_client, rag_client
+from benchmarks.fakes import FakeFirestore, FakeGenerativeModel, FakeUpstream
+
+class RecordingModel(FakeGenerativeModel):
+    """Modelo falso que guarda el historial y el mensaje de cada turno."""
+
+    def __init__(self, **kwargs):
+        super().__init__(chunks=5, chunk_interval=0.0, first_token_delay=0.0, **kwargs)
+        self.system_instruction = kwargs.get("system_instruction")
+        self.turns = []
+
+    def start_chat(self, history=None, **kwargs):
+        chat = super().start_chat(history=history, **kwargs)
+        texts = [part.text for content in history or [] for part in content.parts]
+        send = chat.send_message_async
+
+        async def send_message_async(content, **kwargs):
+            self.turns.append((texts, content))
+            return await send(content, **kwargs)
+
+        chat.send_message_async = send_message_async
+        return chat
+
+class _FakeCachedContent:
+    name = "cachedContents/check"
+
+    def update(self, ttl=None):
+        pass
+
+async def _converse(turns: int) -> str:
+    from src.main import app
+
+    convo_id = None
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://app", timeout=30) as client:
+            headers = {"X-User-ID": "check-system-prompt"}
+            response = await client.post("/conversations", json={"title": "Comprobación"}, headers=headers)
+            convo_id = response.json()["id"]
+            for i in range(turns):
+                prompt = f"Pregunta {i + 1}: ¿qué dice la Corte sobre el derecho a la consulta previa?"
+                response = await client.post(f"/chat-stream/{convo_id}", json={"prompt": prompt}, headers=headers)
+                if b'"done"' not in response.content:
+                    raise RuntimeError(f"El turno {i + 1} no terminó: {response.content[-300:]!r}")
+            return (await client.get("/status/gemini")).json()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=5, help="Turnos de la conversación")
+    parser.add_argument("--context-cache", action="store_true", help="Simular la caché de contexto de Vertex AI")
+    args = parser.parse_args()
+
+    settings.CLOUD_LOGGING_ENABLED = False
+    settings.WARMUP_ON_STARTUP = False
+    model = RecordingModel(system_instruction=PIDA_SYSTEM_PROMPT)
+    gemini_client.model = model
+    gemini_client.summary_model = FakeGenerativeModel(first_token_delay=0.0)
+    firestore_client._db = FakeFirestore(latency=0.0)
+    if args.context_cache:
+        settings.GEMINI_CONTEXT_CACHE_ENABLED = True
+        gemini_client._refresh_cached_content = lambda: (_FakeCachedContent(), model, True)
+
+    async def run():
+        upstream = FakeUpstream(pse_latency=0.0, page_latency=0.0, rag_latency=0.0)
+        base_url = await upstream.start()
+        settings.PSE_SEARCH_URL = f"{base_url}/customsearch/v1"
+        rag_client.RAG_API_URL = f"{base_url}/query"
+        try:
+            if args.context_cache:
+                await gemini_client.refresh_context_cache()
+            return await _converse(args.turns)
+        finally:
+            await upstream.stop()
+
+    stats = asyncio.run(run())
+
+    system_tokens = gemini_client.estimate_tokens(PIDA_SYSTEM_PROMPT)
+    failures = 0
+    print(f"Prompt de sistema: ~{system_tokens} tokens (system_instruction del modelo: {model.system_instruction is not None})")
+    print("turno  historial  copias  tokens ahora  tokens antes")
+    for i, (history, message) in enumerate(model.turns, 1):
+        copies = sum(PIDA_SYSTEM_PROMPT in text for text in history) + (PIDA_SYSTEM_PROMPT in message)
+        failures += copies
+        now = sum(gemini_client.estimate_tokens(text) for text in history) + gemini_client.estimate_tokens(message)
+        print(f"{i:>5}  {len(history):>9}  {copies:>6}  {now:>12}  {now + system_tokens:>12}")
+    print(f"/status/gemini: {stats}")
+
+    if len(model.turns) != args.turns or failures:
+        print("FALLO: el prompt de sistema aparece en los mensajes o en el historial.")
+        sys.exit(1)
+    print("OK: el prompt de sistema no se repite en los mensajes ni en el historial.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,29 @@
+# benchmarks/fake_app.py
+"""
+La aplicación real (src.main:app) con Vertex AI y Firestore sustituidos por los
+fakes de benchmarks.fakes. El PSE y el RAG se apuntan con PSE_SEARCH_URL y
+RAG_API_URL a un FakeUpstream. Lo arranca bench_chat_load.py:
+
+    uvicorn benchmarks.fake_app:app --port 8000
+
+Variables de entorno del modelo falso (valores por defecto entre paréntesis):
+    BENCH_GEMINI_CHUNKS (60), BENCH_GEMINI_CHUNK_CHARS (40),
+    BENCH_GEMINI_CHUNK_INTERVAL (0.03), BENCH_GEMINI_FIRST_TOKEN_DELAY (0.5),
+    BENCH_FIRESTORE_LATENCY (0.01)
+"""
+
+import os
+
+from benchmarks.fakes import FakeFirestore, FakeGenerativeModel
+from src.modules import firestore_client, gemini_client
+
+gemini_client.model = FakeGenerativeModel(
+    chunks=int(os.environ.get("BENCH_GEMINI_CHUNKS", 60)),
+    chunk_chars=int(os.environ.get("BENCH_GEMINI_CHUNK_CHARS", 40)),
+    chunk_interval=float(os.environ.get("BENCH_GEMINI_CHUNK_INTERVAL", 0.03)),
+    first_token_delay=float(os.environ.get("BENCH_GEMINI_FIRST_TOKEN_DELAY", 0.5)),
+)
+gemini_client.summary_model = FakeGenerativeModel(first_token_delay=0.1)
+firestore_client._db = FakeFirestore(latency=float(os.environ.get("BENCH_FIRESTORE_LATENCY", 0.01)))
+
+from src.main import app  # noqa: E402
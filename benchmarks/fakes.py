@@ -0,0 +1,444 @@
+# benchmarks/fakes.py
+"""
+Sustitutos locales de los servicios externos para medir el backend sin salir
+de la máquina:
+
+  - FakeGenerativeModel: imita GenerativeModel de Vertex AI y emite la respuesta
+    en chunks a un ritmo configurable.
+  - FakeFirestore: cliente de Firestore en memoria con las operaciones que usa
+    src/modules/firestore_client.py.
+  - busy_extraction: extracción falsa que solo consume CPU, para probar el
+    tope de CPU del pool de extracción.
+  - FakeUpstream: servidor HTTP local que responde como Custom Search (PSE),
+    como las páginas enlazadas (HTML o PDF, del tamaño que se pida) y como el
+    servicio RAG (/query), con latencia y errores configurables.
+
+El servidor puede lanzarse como proceso aparte:
+    python -m benchmarks.fakes --port 8765 [--pse-latency 0.3] [--page-kind pdf] [--page-kb 512]
+"""
+
+import argparse
+import asyncio
+import datetime
+import json
+import random
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+# --- VERTEX AI ---
+
+class _FakeResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+class FakeGenerativeModel:
+    """Modelo que responde con `chunks` trozos de `chunk_chars` caracteres cada `chunk_interval` segundos."""
+
+    def __init__(self, chunks: int = 60, chunk_chars: int = 40, chunk_interval: float = 0.03,
+                 first_token_delay: float = 0.5, **kwargs):
+        self.chunks = chunks
+        self.chunk_chars = chunk_chars
+        self.chunk_interval = chunk_interval
+        self.first_token_delay = first_token_delay
+
+    def start_chat(self, history=None, **kwargs) -> "_FakeChat":
+        return _FakeChat(self)
+
+    async def generate_content_async(self, contents, generation_config=None, stream: bool = False, **kwargs):
+        if stream:
+            return self._stream()
+        await asyncio.sleep(self.first_token_delay)
+        return _FakeResponse("Resumen de la conversación generado por el modelo falso.")
+
+    async def _stream(self):
+        await asyncio.sleep(self.first_token_delay)
+        text = ("La Corte Interamericana ha establecido que los Estados deben garantizar " * 4)[:self.chunk_chars]
+        for i in range(self.chunks):
+            if i:
+                await asyncio.sleep(self.chunk_interval)
+            yield _FakeResponse(text)
+
+class _FakeChat:
+    def __init__(self, model: FakeGenerativeModel):
+        self.model = model
+
+    async def send_message_async(self, content, stream: bool = False, generation_config=None, **kwargs):
+        if stream:
+            return self.model._stream()
+        return await self.model.generate_content_async(content)
+
+# --- FIRESTORE ---
+
+def _resolve(old: Any, value: Any) -> Any:
+    """Aplica los valores especiales de Firestore (SERVER_TIMESTAMP, Increment)."""
+    from google.cloud.firestore_v1 import SERVER_TIMESTAMP
+    from google.cloud.firestore_v1.transforms import Increment
+    if value is SERVER_TIMESTAMP:
+        return datetime.datetime.now(datetime.timezone.utc)
+    if isinstance(value, Increment):
+        return (old or 0) + value.value
+    return value
+
+def _sort_value(value: Any) -> Tuple[int, Any]:
+    # Firestore ordena los valores nulos antes que el resto.
+    return (0, 0) if value is None else (1, value)
+
+class _Snapshot:
+    def __init__(self, reference: "_DocumentRef", data: Optional[Dict[str, Any]], field_paths: Optional[List[str]] = None):
+        self.reference = reference
+        self.id = reference.id
+        self.exists = data is not None
+        if data is not None and field_paths is not None:
+            data = {k: v for k, v in data.items() if k in field_paths}
+        self._data = data
+
+    def to_dict(self) -> Optional[Dict[str, Any]]:
+        return dict(self._data) if self._data is not None else None
+
+    def get(self, field: str) -> Any:
+        return (self._data or {}).get(field)
+
+class _Query:
+    def __init__(self, db: "FakeFirestore", path: Tuple[str, ...], fields=None, orders=(), filters=(), limit_to=None, after=None):
+        self._db = db
+        self._path = path
+        self._fields = fields
+        self._orders = tuple(orders)
+        self._filters = tuple(filters)
+        self._limit = limit_to
+        self._after = after
+
+    def _copy(self, **changes) -> "_Query":
+        state = dict(fields=self._fields, orders=self._orders, filters=self._filters, limit_to=self._limit, after=self._after)
+        state.update(changes)
+        return _Query(self._db, self._path, **state)
+
+    def select(self, field_paths: List[str]) -> "_Query":
+        return self._copy(fields=list(field_paths))
+
+    def order_by(self, field: str, direction: str = "ASCENDING") -> "_Query":
+        return self._copy(orders=self._orders + ((field, direction == "DESCENDING"),))
+
+    def where(self, field: str = None, op: str = None, value: Any = None, filter=None) -> "_Query":
+        if filter is not None:
+            field, op, value = filter.field_path, filter.op_string, filter.value
+        return self._copy(filters=self._filters + ((field, op, value),))
+
+    def limit(self, count: int) -> "_Query":
+        return self._copy(limit_to=count)
+
+    def start_after(self, cursor) -> "_Query":
+        """Acepta un snapshot o, como Firestore, un dict con los valores de cada orden ('__name__' para el ID)."""
+        return self._copy(after=cursor)
+
+    def _field(self, doc_id: str, data: Dict[str, Any], field: str) -> Any:
+        return doc_id if field == "__name__" else data.get(field)
+
+    def _is_after(self, doc_id: str, data: Dict[str, Any]) -> bool:
+        """Si el documento va detrás del cursor dict según los órdenes de la consulta."""
+        for field, descending in self._orders:
+            value, bound = _sort_value(self._field(doc_id, data, field)), _sort_value(self._after.get(field))
+            if value != bound:
+                return (value < bound) if descending else (value > bound)
+        return False
+
+    def _key(self, doc_id: str, data: Dict[str, Any]):
+        # Como en Firestore, el ID del documento desempata con la dirección del último orden.
+        key = [_sort_value(data.get(field)) for field, _ in self._orders]
+        return key + [doc_id]
+
+    async def stream(self):
+        await self._db._delay()
+        docs = list(self._db._collection(self._path).items())
+        for field, op, value in self._filters:
+            if op != "==":
+                raise NotImplementedError(f"Operador no soportado por FakeFirestore: {op}")
+            docs = [(i, d) for i, d in docs if d.get(field) == value]
+
+        # Orden estable por claves sucesivas, de la última a la primera.
+        docs.sort(key=lambda item: item[0], reverse=bool(self._orders and self._orders[-1][1]))
+        for index in range(len(self._orders) - 1, -1, -1):
+            field, descending = self._orders[index]
+            docs.sort(key=lambda item: _sort_value(self._field(item[0], item[1], field)), reverse=descending)
+
+        if isinstance(self._after, dict):
+            docs = [(i, d) for i, d in docs if self._is_after(i, d)]
+        elif self._after is not None:
+            ids = [i for i, _ in docs]
+            position = ids.index(self._after.id) + 1 if self._after.id in ids else 0
+            docs = docs[position:]
+        if self._limit is not None:
+            docs = docs[:self._limit]
+        for doc_id, data in docs:
+            yield _Snapshot(_DocumentRef(self._db, self._path, doc_id), data, self._fields)
+
+class _CollectionRef(_Query):
+    def __init__(self, db: "FakeFirestore", path: Tuple[str, ...]):
+        super().__init__(db, path)
+
+    def document(self, doc_id: Optional[str] = None) -> "_DocumentRef":
+        return _DocumentRef(self._db, self._path, doc_id or uuid.uuid4().hex[:20])
+
+class _DocumentRef:
+    def __init__(self, db: "FakeFirestore", collection_path: Tuple[str, ...], doc_id: str):
+        self._db = db
+        self._collection_path = collection_path
+        self.id = doc_id
+
+    def collection(self, name: str) -> _CollectionRef:
+        return _CollectionRef(self._db, self._collection_path + (self.id, name))
+
+    async def get(self, field_paths: Optional[List[str]] = None) -> _Snapshot:
+        await self._db._delay()
+        return _Snapshot(self, self._db._collection(self._collection_path).get(self.id), field_paths)
+
+    async def set(self, data: Dict[str, Any], merge: bool = False):
+        await self._db._delay()
+        self._db._write(self, data, merge)
+
+    async def update(self, data: Dict[str, Any]):
+        await self._db._delay()
+        if self.id not in self._db._collection(self._collection_path):
+            raise KeyError(f"No existe el documento {self.id}")
+        self._db._write(self, data, merge=True)
+
+    async def delete(self):
+        await self._db._delay()
+        self._db._collection(self._collection_path).pop(self.id, None)
+
+class _Batch:
+    def __init__(self, db: "FakeFirestore"):
+        self._db = db
+        self._ops: List[Tuple[str, _DocumentRef, Optional[Dict[str, Any]], bool]] = []
+
+    def set(self, ref: _DocumentRef, data: Dict[str, Any], merge: bool = False):
+        self._ops.append(("set", ref, data, merge))
+
+    def delete(self, ref: _DocumentRef):
+        self._ops.append(("delete", ref, None, False))
+
+    async def commit(self):
+        if len(self._ops) > 500:
+            raise ValueError("Un batch de Firestore admite como máximo 500 escrituras.")
+        await self._db._delay()
+        for op, ref, data, merge in self._ops:
+            if op == "set":
+                self._db._write(ref, data, merge)
+            else:
+                self._db._collection(ref._collection_path).pop(ref.id, None)
+
+class FakeFirestore:
+    """Sustituto en memoria de firestore.AsyncClient; `latency` añade una espera a cada operación."""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self._collections: Dict[Tuple[str, ...], Dict[str, Dict[str, Any]]] = {}
+
+    async def _delay(self):
+        await asyncio.sleep(self.latency)
+
+    def _collection(self, path: Tuple[str, ...]) -> Dict[str, Dict[str, Any]]:
+        return self._collections.setdefault(path, {})
+
+    def _write(self, ref: _DocumentRef, data: Dict[str, Any], merge: bool):
+        docs = self._collection(ref._collection_path)
+        current = dict(docs.get(ref.id) or {}) if merge else {}
+        for key, value in data.items():
+            current[key] = _resolve(current.get(key), value)
+        docs[ref.id] = current
+
+    def collection(self, name: str) -> _CollectionRef:
+        return _CollectionRef(self, (name,))
+
+    def batch(self) -> _Batch:
+        return _Batch(self)
+
+    def close(self):
+        pass
+
+# --- PSE, PÁGINAS Y RAG ---
+
+def build_pdf(pages: int, lines_per_page: int = 45) -> bytes:
+    """PDF mínimo con texto extraíble (Helvetica), para probar la extracción con documentos grandes."""
+    line = "La Corte Interamericana de Derechos Humanos reitera la obligacion de garantizar el acceso a la justicia."
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # Pages, se completa al final
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    kids = []
+    for page in range(pages):
+        text = "".join(f"({line} {page}.{n}) '\n" for n in range(lines_per_page))
+        stream = f"BT /F1 9 Tf 12 TL 36 806 Td\n{text}ET".encode("latin-1")
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        content_id = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_id
+        )
+        kids.append(len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(b"%d 0 R" % k for k in kids), len(kids))
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(out)
+
+def build_html(size_kb: int) -> bytes:
+    paragraph = "<div class='c'><p>El Estado debe investigar, juzgar y sancionar las violaciones de derechos humanos.</p></div>\n"
+    repeat = max(1, size_kb * 1024 // len(paragraph))
+    return f"<html><head><title>Sentencia</title></head><body>{paragraph * repeat}</body></html>".encode()
+
+def busy_extraction(cpu_seconds: float) -> str:
+    """
+    Extracción patológica: consume `cpu_seconds` de CPU en Python puro y, como
+    algunos bucles de pypdf, absorbe cualquier Exception de cada paso.
+    """
+    deadline = time.process_time() + cpu_seconds
+    steps = 0
+    while time.process_time() < deadline:
+        try:
+            sum(range(10000))
+            steps += 1
+        except Exception:
+            pass
+    return f"Texto tras {steps} pasos."
+
+class FakeUpstream:
+    """
+    Servidor HTTP/1.1 mínimo (keep-alive) con tres rutas:
+      GET  /customsearch/v1?q=...  resultados del PSE enlazando a /page/...
+      GET  /page/<id>.<pdf|html>   documento de tamaño `page_kb`
+      POST /query                  respuesta del servicio RAG
+    Las latencias se aplican por petición; `error_ratio` y `hang` afectan al RAG.
+    """
+
+    def __init__(self, pse_latency: float = 0.3, pse_results: int = 3, page_latency: float = 0.2,
+                 page_kind: str = "html", page_kb: int = 64, rag_latency: float = 0.2, rag_results: int = 3):
+        self.pse_latency = pse_latency
+        self.pse_results = pse_results
+        self.page_latency = page_latency
+        self.page_kind = page_kind
+        self.page_kb = page_kb
+        self.base_latency = rag_latency
+        self.rag_results = rag_results
+        self.slow_ratio = 0.0
+        self.slow_latency = 3.0
+        self.error_ratio = 0.0
+        self.hang = False
+        self.requests = 0
+        self._server = None
+        self._pages: Dict[str, bytes] = {}
+
+    def _page(self, kind: str) -> bytes:
+        if kind not in self._pages:
+            # ~3 KB de texto por página de PDF.
+            self._pages[kind] = build_pdf(max(1, self.page_kb // 3)) if kind == "pdf" else build_html(self.page_kb)
+        return self._pages[kind]
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        self._server = await asyncio.start_server(self._handle, host, port)
+        port = self._server.sockets[0].getsockname()[1]
+        return f"http://{host}:{port}"
+
+    async def stop(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                request_line, *header_lines = head.decode("latin-1").split("\r\n")
+                method, target, _ = request_line.split(" ", 2)
+                length = 0
+                for header in header_lines:
+                    if header.lower().startswith("content-length:"):
+                        length = int(header.split(":", 1)[1])
+                body = await reader.readexactly(length) if length else b""
+                self.requests += 1
+
+                status, content_type, payload = await self._route(method, target, body)
+                writer.write(
+                    f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\nContent-Length: {len(payload)}\r\n\r\n".encode() + payload
+                )
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    async def _route(self, method: str, target: str, body: bytes) -> Tuple[str, str, bytes]:
+        url = urlsplit(target)
+        if method == "GET" and url.path.endswith("/customsearch/v1"):
+            await asyncio.sleep(self.pse_latency)
+            query = parse_qs(url.query).get("q", [""])[0]
+            count = min(self.pse_results, int(parse_qs(url.query).get("num", [self.pse_results])[0]))
+            # Una página distinta por consulta, para no medir solo la caché de contenido.
+            key = uuid.uuid5(uuid.NAMESPACE_URL, query).hex[:12]
+            items = [
+                {"title": f"Resultado {i} para {query[:40]}", "link": f"{self._base}/page/{key}-{i}.{self.page_kind}",
+                 "snippet": "Fragmento del resultado de búsqueda."}
+                for i in range(count)
+            ]
+            return "200 OK", "application/json", json.dumps({"items": items}).encode()
+
+        if method == "GET" and url.path.startswith("/page/"):
+            await asyncio.sleep(self.page_latency)
+            kind = "pdf" if url.path.endswith(".pdf") else "html"
+            return "200 OK", "application/pdf" if kind == "pdf" else "text/html; charset=utf-8", self._page(kind)
+
+        if method == "POST" and url.path.endswith("/query"):
+            if self.hang:
+                await asyncio.sleep(3600)
+            latency = self.slow_latency if random.random() < self.slow_ratio else self.base_latency * random.uniform(0.5, 1.5)
+            await asyncio.sleep(latency)
+            if random.random() < self.error_ratio:
+                return "500 Internal Server Error", "application/json", b'{"detail": "error"}'
+            results = [
+                {"title": f"Informe {i}", "author": "CIDH", "source": f"informe-{i}.pdf",
+                 "content": "Texto del informe sobre la situación de derechos humanos. " * 20}
+                for i in range(self.rag_results)
+            ]
+            return "200 OK", "application/json", json.dumps({"results": results}).encode()
+
+        return "404 Not Found", "application/json", b'{"detail": "not found"}'
+
+    @property
+    def _base(self) -> str:
+        host, port = self._server.sockets[0].getsockname()[:2]
+        return f"http://{host}:{port}"
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--pse-latency", type=float, default=0.3)
+    parser.add_argument("--page-latency", type=float, default=0.2)
+    parser.add_argument("--page-kind", choices=("html", "pdf"), default="html")
+    parser.add_argument("--page-kb", type=int, default=64)
+    parser.add_argument("--rag-latency", type=float, default=0.2)
+    parser.add_argument("--rag-error-ratio", type=float, default=0.0)
+    args = parser.parse_args()
+
+    async def serve():
+        upstream = FakeUpstream(pse_latency=args.pse_latency, page_latency=args.page_latency, page_kind=args.page_kind,
+                                page_kb=args.page_kb, rag_latency=args.rag_latency)
+        upstream.error_ratio = args.rag_error_ratio
+        print(f"Servicios falsos escuchando en {await upstream.start(args.host, args.port)}", flush=True)
+        await asyncio.Event().wait()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,8 @@
 # src/config.py
 import logging
-import google.cloud.logging
+from typing import Literal
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
-client = google.cloud.logging.Client()
-client.setup_logging()
 log = logging.getLogger("pida-backend")
 log.setLevel(logging.INFO)
 
@@ -18,10 +16,141 @@ class Settings(BaseSettings):
     PSE_API_KEY: str
     PSE_ID: str
 
+    # --- Arranque ---
+    CLOUD_LOGGING_ENABLED: bool = True     # Enviar los logs a Cloud Logging (desactivar en local)
+    WARMUP_ON_STARTUP: bool = True         # Precargar Vertex AI, Firestore y los extractores tras arrancar
+
     # --- VARIABLES AÑADIDAS QUE FALTABAN ---
     MAX_OUTPUT_TOKENS: int = 16384
     TEMPERATURE: float = 0.7
     TOP_P: float = 0.95
 
+    # --- Caché de contexto de Gemini (prompt de sistema) ---
+    GEMINI_CONTEXT_CACHE_ENABLED: bool = False     # Guardar el prompt de sistema como CachedContent de Vertex AI
+    GEMINI_CONTEXT_CACHE_TTL: float = 3600.0       # Vida de la caché (segundos)
+    GEMINI_CONTEXT_CACHE_REFRESH_MARGIN: float = 300.0  # Se renueva cuando le queda menos que esto
+    GEMINI_CONTEXT_CACHE_RETRY: float = 600.0      # Espera antes de reintentar si Vertex la rechaza
+
+    # --- Búsqueda externa (PSE) ---
+    PSE_SEARCH_URL: str = "https://www.googleapis.com/customsearch/v1"
+    PSE_FETCH_CONCURRENCY: int = 3         # Descargas de páginas simultáneas por búsqueda
+    PSE_MAX_CONNECTIONS_PER_HOST: int = 2  # Descargas simultáneas contra un mismo dominio
+    PSE_SEARCH_DEADLINE: float = 15.0      # Tiempo máximo (s) de toda la etapa de búsqueda
+    PSE_MAX_DOWNLOAD_BYTES: int = 10 * 1024 * 1024  # Bytes máximos a descargar por página (PDF)
+    PSE_MAX_HTML_BYTES: int = 2 * 1024 * 1024       # En HTML el texto útil está al principio
+
+    # --- Caché de resultados de búsqueda (PSE y RAG) ---
+    PSE_RESULT_CACHE_TTL: float = 900.0    # Segundos; cada consulta al PSE consume cuota
+    RAG_RESULT_CACHE_TTL: float = 300.0    # Segundos; el índice interno puede actualizarse
+    QUERY_CACHE_MAX_ENTRIES: int = 1024    # Consultas distintas por fuente
+
+    # --- Clientes HTTP compartidos (pool de conexiones) ---
+    HTTP_MAX_CONNECTIONS: int = 100
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    HTTP_KEEPALIVE_EXPIRY: float = 30.0
+    HTTP2_ENABLED: bool = False            # Requiere el paquete 'h2' (httpx[http2])
+
+    # Perfiles de timeout por servicio (segundos)
+    PSE_SEARCH_TIMEOUT: float = 10.0
+    PSE_FETCH_TIMEOUT: float = 20.0
+    PSE_CONNECT_TIMEOUT: float = 5.0
+    RAG_TIMEOUT: float = 30.0              # Margen para arranques en frío de Cloud Run
+    RAG_CONNECT_TIMEOUT: float = 10.0
+
+    # --- Servicio RAG interno ---
+    RAG_API_URL: str = "https://pida-rag-api-640849120264.us-central1.run.app/query"  # Debe terminar en /query
+
+    # --- Resiliencia del RAG (timeout adaptativo, hedging, circuit breaker) ---
+    RAG_MIN_TIMEOUT: float = 3.0           # Límite inferior del timeout adaptativo (RAG_TIMEOUT es el superior)
+    RAG_TIMEOUT_MULTIPLIER: float = 3.0    # Timeout = p99 observado × multiplicador
+    RAG_HEDGE_PERCENTILE: float = 95.0     # Segundo intento si el primero supera este percentil
+    RAG_LATENCY_MIN_SAMPLES: int = 20      # Muestras antes de adaptar el timeout y cubrir peticiones
+    RAG_BREAKER_FAILURES: int = 5          # Fallos seguidos que abren el circuito
+    RAG_BREAKER_COOLDOWN: float = 30.0     # Segundos con el circuito abierto antes de probar de nuevo
+
+    # --- Caché de texto extraído de fuentes externas ---
+    CONTENT_CACHE_TTL: float = 86400.0                 # Segundos antes de revalidar una URL
+    CONTENT_CACHE_MAX_BYTES: int = 64 * 1024 * 1024    # Tamaño máximo del nivel en memoria
+    CONTENT_CACHE_DB_PATH: str | None = None           # SQLite compartido entre workers (opcional)
+    CONTENT_CACHE_DB_MAX_BYTES: int = 512 * 1024 * 1024
+
+    # --- Extracción de texto (PDF/HTML) fuera del event loop ---
+    EXTRACTION_EXECUTOR: Literal["thread", "process"] = "process"  # Solo 'process' impone el tope de CPU (ver extraction_pool)
+    EXTRACTION_WORKERS: int = 2
+    EXTRACTION_MAX_QUEUE: int = 8          # Documentos en espera además de los que se procesan
+    EXTRACTION_TIMEOUT: float = 10.0       # Tiempo real máximo por documento (s)
+    EXTRACTION_CPU_BUDGET: float = 5.0     # Tiempo de CPU máximo por documento (s); con 'thread' es cooperativo
+
+    # --- Caché del historial de conversaciones ---
+    HISTORY_CACHE_MAX_CONVERSATIONS: int = 512
+    HISTORY_CACHE_TTL: float = 600.0       # Recarga desde Firestore pasado este tiempo (otros workers)
+
+    # --- Ventana del historial y resumen acumulado ---
+    HISTORY_TOKEN_BUDGET: int = 24000      # Tokens estimados de historial literal por turno (0 = sin límite)
+    HISTORY_SUMMARY_MAX_OUTPUT_TOKENS: int = 1024
+
+    # --- Ensamblado del contexto (PSE + RAG) ---
+    CONTEXT_MAX_CHARS: int = 12000         # Presupuesto de caracteres de contexto por turno
+    CONTEXT_PASSAGE_CHARS: int = 700       # Tamaño aproximado de cada pasaje
+    CONTEXT_DEDUP_THRESHOLD: float = 0.8   # Similitud de Jaccard a partir de la cual un pasaje es duplicado
+
+    # --- Salida SSE (agrupación de chunks de Gemini) ---
+    SSE_COALESCE_MAX_CHARS: int = 512      # Se envía el bloque al alcanzar este tamaño...
+    SSE_COALESCE_INTERVAL: float = 0.05    # ...o al pasar este tiempo (segundos); 0 desactiva la agrupación
+
+    # --- Reanudación de streams SSE (Last-Event-ID) ---
+    SSE_RESUME_GRACE: float = 30.0         # Segundos sin clientes antes de cancelar una generación
+    SSE_RESUME_TTL: float = 300.0          # Segundos que se conserva una generación terminada
+    SSE_RESUME_MAX_EVENTS: int = 2048      # Eventos por stream en el buffer circular
+    SSE_RESUME_MAX_BYTES: int = 32 * 1024 * 1024  # Tope global de los buffers
+
+    # --- Control de admisión de generaciones (por worker) ---
+    ADMISSION_MAX_ACTIVE: int = 32         # Generaciones simultáneas en el worker
+    ADMISSION_MAX_ACTIVE_PER_USER: int = 2 # Generaciones simultáneas por usuario
+    ADMISSION_MAX_QUEUE: int = 64          # Peticiones en espera; con la cola llena se responde 429
+    ADMISSION_MAX_QUEUED_PER_USER: int = 2 # Peticiones en espera por usuario
+    ADMISSION_RETRY_AFTER: int = 5         # Segundos sugeridos en la cabecera Retry-After
+
+    # --- Persistencia de mensajes en segundo plano (write-behind) ---
+    PERSIST_BATCH_SIZE: int = 100          # Mensajes por batch; cada uno son 2 escrituras (máx. 250)
+    PERSIST_LINGER: float = 0.05           # Espera (s) para agrupar escrituras antes de cada batch
+    PERSIST_MAX_RETRIES: int = 5
+    PERSIST_RETRY_BACKOFF: float = 0.5     # Espera inicial (s) entre reintentos, se duplica en cada uno
+    PERSIST_SHUTDOWN_TIMEOUT: float = 10.0 # Tiempo máximo para vaciar la cola al apagar
+
+    # --- Paginación de listados ---
+    CONVERSATIONS_PAGE_SIZE: int = 50
+    MESSAGES_PAGE_SIZE: int = 200          # Solo si se pide paginar (limit o cursor)
+    MAX_PAGE_SIZE: int = 500
+
+    # --- Eliminación de conversaciones en lote ---
+    DELETE_BATCH_SIZE: int = 500           # Borrados por batch de Firestore (máx. 500)
+    DELETE_PARALLELISM: int = 4            # Batches confirmados en paralelo
+
 
 settings = Settings()
+
+def setup_console_logging():
+    """Logs por la consola. Es lo primero que hace el lifespan; no importa nada pesado."""
+    logging.basicConfig(level=logging.INFO)
+
+def setup_logging():
+    """
+    Pasa los logs de la consola a Cloud Logging. Crear el cliente importa su
+    librería (gRPC) y busca las credenciales, lo que tarda segundos: se llama
+    en un hilo tras el arranque, no en el lifespan, para que la aplicación
+    responda antes. Si no está disponible, los logs siguen en la consola.
+    """
+    if not settings.CLOUD_LOGGING_ENABLED:
+        return
+    try:
+        import google.cloud.logging
+        client = google.cloud.logging.Client()
+        root = logging.getLogger()
+        console_handlers = list(root.handlers)
+        client.setup_logging()
+        for handler in console_handlers:
+            root.removeHandler(handler)
+        log.info("Logs enviados a Cloud Logging.")
+    except Exception as e:
+        log.warning(f"No se pudo configurar Cloud Logging; se usará la consola: {e}")
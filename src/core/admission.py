@@ -0,0 +1,134 @@
+# src/core/admission.py
+
+import asyncio
+import time
+from collections import Counter, deque
+from typing import AsyncIterator, Deque, Dict
+from src.config import settings, log
+from src.core import metrics
+
+# Control de admisión de generaciones de chat (por worker).
+# Limita las generaciones simultáneas en total (ADMISSION_MAX_ACTIVE) y por
+# usuario (ADMISSION_MAX_ACTIVE_PER_USER). Las peticiones que no caben esperan
+# en una cola FIFO acotada y reciben su posición; si la cola está llena, o el
+# usuario ya tiene demasiadas peticiones, se rechazan al momento (429).
+
+class AdmissionRejected(Exception):
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class Ticket:
+    __slots__ = ("user_id", "admitted", "released", "enqueued_at", "_event")
+
+    def __init__(self, user_id: str):
+        self.user_id = user_id
+        self.admitted = False
+        self.released = False
+        self.enqueued_at = time.monotonic()
+        self._event = asyncio.Event()
+
+_active = 0
+_active_by_user: Counter = Counter()
+_queued_by_user: Counter = Counter()
+_queue: Deque[Ticket] = deque()
+_queue_changed = asyncio.Event()
+_stats = {"admitted": 0, "queued": 0, "rejected_queue_full": 0, "rejected_user_limit": 0, "abandoned_in_queue": 0}
+
+def _can_admit(user_id: str) -> bool:
+    return _active < settings.ADMISSION_MAX_ACTIVE and _active_by_user[user_id] < settings.ADMISSION_MAX_ACTIVE_PER_USER
+
+def _admit(ticket: Ticket):
+    global _active
+    _active += 1
+    _active_by_user[ticket.user_id] += 1
+    ticket.admitted = True
+    ticket._event.set()
+    _stats["admitted"] += 1
+    metrics.ADMISSION_WAIT_SECONDS.observe(time.monotonic() - ticket.enqueued_at)
+
+def _dispatch():
+    """Admite, en orden de llegada, las peticiones en cola cuyo usuario no ha llegado a su límite."""
+    global _queue_changed
+    changed = False
+    for ticket in list(_queue):
+        if _active >= settings.ADMISSION_MAX_ACTIVE:
+            break
+        if _can_admit(ticket.user_id):
+            _queue.remove(ticket)
+            _queued_by_user[ticket.user_id] -= 1
+            _admit(ticket)
+            changed = True
+    if changed:
+        # Despierta a los que esperan para que recalculen su posición.
+        waiter, _queue_changed = _queue_changed, asyncio.Event()
+        waiter.set()
+
+def reserve(user_id: str) -> Ticket:
+    """
+    Reserva un hueco para una generación de `user_id`. El ticket puede quedar
+    admitido al momento o en cola (ver wait). Lanza AdmissionRejected si el
+    usuario ya tiene demasiadas peticiones o si la cola está llena.
+    """
+    user_total = _active_by_user[user_id] + _queued_by_user[user_id]
+    if user_total >= settings.ADMISSION_MAX_ACTIVE_PER_USER + settings.ADMISSION_MAX_QUEUED_PER_USER:
+        _stats["rejected_user_limit"] += 1
+        raise AdmissionRejected("Demasiadas respuestas en curso para este usuario.", settings.ADMISSION_RETRY_AFTER)
+
+    ticket = Ticket(user_id)
+    if not _queue and _can_admit(user_id):
+        _admit(ticket)
+        return ticket
+    if len(_queue) >= settings.ADMISSION_MAX_QUEUE:
+        _stats["rejected_queue_full"] += 1
+        raise AdmissionRejected("El servicio está saturado. Inténtalo de nuevo en unos segundos.", settings.ADMISSION_RETRY_AFTER)
+
+    _queue.append(ticket)
+    _queued_by_user[user_id] += 1
+    _stats["queued"] += 1
+    _dispatch()
+    return ticket
+
+def position(ticket: Ticket) -> int:
+    """Posición (desde 1) del ticket en la cola; 0 si ya está admitido."""
+    if ticket.admitted:
+        return 0
+    return _queue.index(ticket) + 1
+
+async def wait(ticket: Ticket) -> AsyncIterator[int]:
+    """Espera a que el ticket sea admitido; entrega su posición en la cola cada vez que cambia."""
+    last = None
+    while not ticket.admitted:
+        current = position(ticket)
+        if current != last:
+            last = current
+            yield current
+        waiters = [asyncio.create_task(ticket._event.wait()), asyncio.create_task(_queue_changed.wait())]
+        try:
+            await asyncio.wait(waiters, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for waiter in waiters:
+                waiter.cancel()
+
+def release(ticket: Ticket):
+    """Libera el hueco (o la plaza en la cola) del ticket. Es idempotente."""
+    global _active
+    if ticket.released:
+        return
+    ticket.released = True
+    if ticket.admitted:
+        _active -= 1
+        _active_by_user[ticket.user_id] -= 1
+        if not _active_by_user[ticket.user_id]:
+            del _active_by_user[ticket.user_id]
+    else:
+        _queue.remove(ticket)
+        _queued_by_user[ticket.user_id] -= 1
+        _stats["abandoned_in_queue"] += 1
+        log.info(f"Petición del usuario {ticket.user_id} abandonada en la cola de admisión.")
+    if not _queued_by_user[ticket.user_id]:
+        del _queued_by_user[ticket.user_id]
+    _dispatch()
+
+def stats() -> Dict[str, int]:
+    return {**_stats, "active": _active, "waiting": len(_queue), "users_active": len(_active_by_user)}
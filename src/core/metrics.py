@@ -0,0 +1,121 @@
+# src/core/metrics.py
+
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Histogramas de latencia en memoria, exportados en el formato de texto de
+# Prometheus por el endpoint /metrics. Cada worker de uvicorn tiene los suyos.
+# Solo se observan desde el event loop, por lo que no necesitan bloqueo.
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets))
+        # Por combinación de etiquetas: [conteo por bucket (+Inf al final), suma, total]
+        self._series: Dict[Tuple[str, ...], list] = {}
+        _registry.append(self)
+
+    def observe(self, value: float, **labels: str):
+        key = tuple(str(labels.get(name, "")) for name in self.label_names)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        """Observa la duración del bloque, también si termina con una excepción."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _labels(self, key: Tuple[str, ...], extra: Optional[Tuple[str, str]] = None) -> str:
+        pairs = list(zip(self.label_names, key))
+        if extra:
+            pairs.append(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for key, (counts, total_sum, total_count) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{self._labels(key, ('le', repr(bound)))} {cumulative}")
+            lines.append(f"{self.name}_bucket{self._labels(key, ('le', '+Inf'))} {total_count}")
+            lines.append(f"{self.name}_sum{self._labels(key)} {total_sum}")
+            lines.append(f"{self.name}_count{self._labels(key)} {total_count}")
+        return lines
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+_registry: List[Histogram] = []
+
+def render() -> str:
+    """Todas las métricas en el formato de exposición de texto de Prometheus (0.0.4)."""
+    lines: List[str] = []
+    for histogram in _registry:
+        lines.extend(histogram.render())
+    return "\n".join(lines) + "\n"
+
+# --- MÉTRICAS DE LA APLICACIÓN ---
+
+CHAT_STAGE_SECONDS = Histogram(
+    "pida_chat_stage_seconds",
+    "Duración de cada etapa de un turno de chat.",
+    label_names=("stage",),
+)
+PSE_PAGE_FETCH_SECONDS = Histogram(
+    "pida_pse_page_fetch_seconds",
+    "Descarga y extracción de cada página devuelta por el PSE.",
+    label_names=("result",),
+)
+FIRESTORE_COMMIT_SECONDS = Histogram(
+    "pida_firestore_commit_seconds",
+    "Confirmación de cada batch de la cola de escritura de mensajes.",
+)
+MESSAGE_PERSIST_SECONDS = Histogram(
+    "pida_message_persist_seconds",
+    "Tiempo desde que un mensaje se encola hasta que queda guardado en Firestore.",
+)
+ADMISSION_WAIT_SECONDS = Histogram(
+    "pida_admission_wait_seconds",
+    "Espera en la cola de admisión antes de empezar una generación de chat.",
+)
+
+class TurnTimings:
+    """Duraciones de las etapas de un turno, para el evento final tipo Server-Timing."""
+
+    def __init__(self):
+        self.stages: Dict[str, float] = {}
+
+    def record(self, stage: str, seconds: float):
+        self.stages[stage] = seconds
+        CHAT_STAGE_SECONDS.observe(seconds, stage=stage)
+
+    @contextmanager
+    def stage(self, stage: str) -> Iterator[None]:
+        """Registra la duración del bloque si termina bien (una etapa cancelada no cuenta)."""
+        started = time.perf_counter()
+        yield
+        self.record(stage, time.perf_counter() - started)
+
+    def as_milliseconds(self) -> Dict[str, float]:
+        return {stage: round(seconds * 1000, 1) for stage, seconds in self.stages.items()}
+
+    def server_timing(self) -> str:
+        """Cadena con la sintaxis de la cabecera Server-Timing ('etapa;dur=ms, ...')."""
+        return ", ".join(f"{stage};dur={ms}" for stage, ms in self.as_milliseconds().items())
@@ -1,4 +1,5 @@
 # src/core/security.py
+import logging
 from fastapi import Request, HTTPException, status, Depends
 # Importa el logger desde tu configuración para poder registrar mensajes
 from src.config import log 
@@ -20,7 +21,9 @@ async def get_current_user_id_insecure(request: Request) -> str:
     
     # LÍNEA DE DEPURACIÓN: Registra el ID y el origen que recibe el servidor.
     # Esto nos dirá exactamente qué está llegando desde cada dominio.
-    log.info(f"--- DEBUGGING: Header 'X-User-ID' received: '{user_id}' from origin: {request.headers.get('origin')} ---")
+    # Se ejecuta en cada petición: solo se formatea si el nivel DEBUG está activo.
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug(f"--- DEBUGGING: Header 'X-User-ID' received: '{user_id}' from origin: {request.headers.get('origin')} ---")
     
     if user_id is None:
         raise credentials_exception
@@ -0,0 +1,104 @@
+# src/core/sse.py
+
+import asyncio
+import json
+from typing import Any, AsyncIterator, Dict, List
+
+try:
+    import orjson
+except ImportError:  # orjson llega como dependencia de FastAPI, pero no es imprescindible
+    orjson = None
+
+# Etapa de salida del streaming SSE.
+# Gemini entrega muchos chunks pequeños; enviar cada uno como un evento propio
+# supone una serialización JSON y una escritura en el socket por chunk. Aquí
+# los chunks se agrupan por tamaño o por intervalo antes de codificarlos, y el
+# primero se envía en cuanto llega para no retrasar el primer byte.
+
+_QUEUE_SIZE = 64  # Chunks adelantados como máximo; mantiene la contrapresión sobre Gemini
+_END = object()
+_TICK = object()
+
+class _Failure:
+    __slots__ = ("error",)
+
+    def __init__(self, error: BaseException):
+        self.error = error
+
+def encode_event(data: Dict[str, Any]) -> bytes:
+    """Codifica un evento SSE 'data:' con el codificador JSON más rápido disponible."""
+    if orjson is not None:
+        return b"data: " + orjson.dumps(data) + b"\n\n"
+    return f"data: {json.dumps(data)}\n\n".encode()
+
+async def coalesce(chunks: AsyncIterator[str], max_chars: int, interval: float) -> AsyncIterator[str]:
+    """
+    Reagrupa los chunks de texto de `chunks`. Se emite un bloque cuando el texto
+    acumulado llega a `max_chars` o cuando han pasado `interval` segundos desde
+    que entró el primer chunk del bloque. El primer chunk del stream se emite
+    sin esperar. Con interval <= 0 los chunks pasan tal cual.
+    """
+    if interval <= 0:
+        async for chunk in chunks:
+            yield chunk
+        return
+
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=_QUEUE_SIZE)
+
+    async def _pump():
+        try:
+            async for chunk in chunks:
+                await queue.put(chunk)
+        except Exception as e:
+            await queue.put(_Failure(e))
+        await queue.put(_END)
+
+    def _tick():
+        # Aviso de fin de intervalo. Si la cola está llena no hace falta: el
+        # consumidor tiene chunks que leer y comprobará el plazo al hacerlo.
+        try:
+            queue.put_nowait(_TICK)
+        except asyncio.QueueFull:
+            pass
+
+    pump = asyncio.create_task(_pump())
+    buffer: List[str] = []
+    size = 0
+    deadline = 0.0
+    timer = None
+    first = True
+    try:
+        while True:
+            item = await queue.get()
+            if item is _END:
+                break
+            if isinstance(item, _Failure):
+                raise item.error
+            if item is not _TICK:
+                if not buffer and not first:
+                    deadline = loop.time() + interval
+                    timer = loop.call_at(deadline, _tick)
+                buffer.append(item)
+                size += len(item)
+
+            if buffer and (first or size >= max_chars or loop.time() >= deadline):
+                first = False
+                if timer is not None:
+                    timer.cancel()
+                    timer = None
+                text = "".join(buffer)
+                buffer.clear()
+                size = 0
+                yield text
+
+        if buffer:
+            yield "".join(buffer)
+    finally:
+        if timer is not None:
+            timer.cancel()
+        # Si el consumidor abandona el stream, se cancela la lectura de la fuente
+        # para que esta cierre su propio stream (p. ej. el de Gemini).
+        if not pump.done():
+            pump.cancel()
+            await asyncio.gather(pump, return_exceptions=True)
@@ -1,23 +1,68 @@
 # src/main.py
 
-import json
 import asyncio
-from fastapi import FastAPI, Request, Depends, HTTPException, status
-from fastapi.responses import StreamingResponse, JSONResponse
+import functools
+import time
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request, Response, Depends, HTTPException, Query, status
+from fastapi.responses import StreamingResponse, JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 
-from src.config import settings, log
+from src.config import settings, log, setup_console_logging, setup_logging
 from src.models.chat_models import ChatRequest, ChatMessage
-from src.modules import pse_client, gemini_client, rag_client, firestore_client
-from src.core.prompts import PIDA_SYSTEM_PROMPT
+from src.modules import pse_client, gemini_client, rag_client, firestore_client, http_clients, content_cache, extraction_pool, history_cache, context_assembler, stream_registry, query_cache, resilience
+from src.core import sse, metrics, admission
 # --- LÍNEA CORREGIDA ---
 # Se cambió 'get_current_user_id' por el nombre correcto de la función.
 from src.core.security import get_current_user_id_insecure
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
+
+async def _warm_up():
+    """
+    Carga en segundo plano lo que se inicializa de forma diferida (SDK de Vertex AI,
+    cliente de Firestore, extractores de PDF/HTML) para que la primera petición
+    no pague ese coste. Las importaciones pesadas se hacen en un hilo.
+    """
+    started = time.perf_counter()
+    try:
+        await asyncio.to_thread(gemini_client.get_model)
+        await gemini_client.refresh_context_cache()
+        await asyncio.to_thread(firestore_client.get_db)
+        await asyncio.to_thread(extraction_pool.preload)
+        log.info(f"Calentamiento completado en {time.perf_counter() - started:.2f}s.")
+    except Exception as e:
+        log.warning(f"Error durante el calentamiento (se inicializará en el primer uso): {e}")
+
+async def _background_startup():
+    await asyncio.to_thread(setup_logging)
+    if settings.WARMUP_ON_STARTUP:
+        await _warm_up()
+    await firestore_client.resume_deletion_jobs()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Recursos compartidos durante toda la vida de la aplicación. Los clientes de
+    # la nube se crean de forma diferida: el arranque no espera por ellos.
+    setup_console_logging()
+    await http_clients.startup()
+    extraction_pool.startup()
+    firestore_client.start_persistence_worker()
+    startup_task = asyncio.create_task(_background_startup())
+    yield
+    if not startup_task.done():
+        startup_task.cancel()
+    # Primero las generaciones en curso, para que su respuesta parcial entre en la cola de escritura.
+    await stream_registry.shutdown()
+    await firestore_client.stop_persistence_worker()
+    await http_clients.shutdown()
+    extraction_pool.shutdown()
+    content_cache.close()
+    firestore_client.close_db()
 
 app = FastAPI(
     title="PIDA Backend API - Logic Only",
-    description="API para el asistente jurídico PIDA, con persistencia en BD y autenticación."
+    description="API para el asistente jurídico PIDA, con persistencia en BD y autenticación.",
+    lifespan=lifespan
 )
 
 # --- CONFIGURACIÓN DE CORS ---
@@ -33,58 +78,111 @@ app.add_middleware(
     allow_origins=origins,
     allow_credentials=True,
     allow_methods=["POST", "GET", "DELETE", "PATCH", "OPTIONS"],
-    allow_headers=["*"],
+    allow_headers=["*"],  # Incluye Last-Event-ID para reanudar streams
+    expose_headers=["X-Next-Cursor", "Retry-After"],
 )
 
 # --- LÓGICA DE STREAMING ---
+SSE_HEADERS = {
+    "Content-Type": "text/event-stream",
+    "Cache-Control": "no-cache",
+    "Connection": "keep-alive",
+    "X-Accel-Buffering": "no"
+}
+
+async def _timed(timings: metrics.TurnTimings, stage: str, awaitable):
+    with timings.stage(stage):
+        return await awaitable
+
+async def _admitted(ticket: admission.Ticket, frames):
+    """Espera turno en la cola de admisión (informando de la posición) y después emite `frames`."""
+    try:
+        async for position in admission.wait(ticket):
+            yield sse.encode_event({"event": "status", "message": f"En cola, posición {position}... ⏳", "queue_position": position})
+        async for frame in frames:
+            yield frame
+    finally:
+        admission.release(ticket)
+
 async def stream_chat_response_generator(chat_request: ChatRequest, country_code: str | None, user_id: str, convo_id: str):
-    def create_sse_event(data: dict) -> str:
-        return f"data: {json.dumps(data)}\n\n"
+    turn_started = time.perf_counter()
+    timings = metrics.TurnTimings()
+    # Etapas del turno. Ninguna depende de otra: el mensaje del usuario se encola
+    # para persistirlo mientras se carga el historial y se consultan ambas fuentes.
+    user_message = ChatMessage(role="user", content=chat_request.prompt)
+    with timings.stage("persist_user"):
+        user_message_id = firestore_client.enqueue_message(user_id, convo_id, user_message)
+    # El historial excluye el mensaje actual, que puede escribirse antes de que termine la lectura.
+    history_task = asyncio.create_task(_timed(timings, "history", history_cache.get_history(user_id, convo_id, exclude_ids={user_message_id})))
+    web_task = asyncio.create_task(_timed(timings, "pse", pse_client.search_source_documents(chat_request.prompt, num_results=3)))
+    rag_task = asyncio.create_task(_timed(timings, "rag", rag_client.search_internal_source_documents(chat_request.prompt)))
+    stage_tasks = [history_task, web_task, rag_task]
+    response_parts: List[str] = []
+    reply_persisted = False
 
     try:
-        user_message = ChatMessage(role="user", content=chat_request.prompt)
-        await firestore_client.add_message_to_conversation(user_id, convo_id, user_message)
-        yield create_sse_event({"event": "status", "message": "Iniciando... 🕵️"})
-        await asyncio.sleep(0.5)
-        history_from_db = await firestore_client.get_conversation_messages(user_id, convo_id)
-        history_for_gemini = gemini_client.prepare_history_for_vertex(history_from_db[:-1])
-        yield create_sse_event({"event": "status", "message": "Consultando jurisprudencia y fuentes externas..."})
-        search_tasks = [
-            pse_client.search_for_sources(chat_request.prompt, num_results=3),
-            rag_client.search_internal_documents(chat_request.prompt)
-        ]
-        combined_context = ""
-        task_count = len(search_tasks)
-        for i, task in enumerate(asyncio.as_completed(search_tasks)):
-            result = await task
-            combined_context += result
-            yield create_sse_event({"event": "status", "message": f"Fuente de contexto ({i+1}/{task_count}) procesada..."})
-        
-        await asyncio.sleep(0.5)
-        yield create_sse_event({"event": "status", "message": "Contexto recopilado. Construyendo la consulta..."})
+        yield sse.encode_event({"event": "status", "message": "Iniciando... 🕵️"})
+        yield sse.encode_event({"event": "status", "message": "Consultando jurisprudencia y fuentes externas..."})
+
+        search_tasks = {web_task, rag_task}
+        sources_done = 0
+        pending = set(stage_tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                task.result()
+                if task in search_tasks:
+                    sources_done += 1
+                    yield sse.encode_event({"event": "status", "message": f"Fuente de contexto ({sources_done}/{len(search_tasks)}) procesada..."})
+                elif task is history_task:
+                    yield sse.encode_event({"event": "status", "message": "Historial de la conversación recuperado..."})
+
+        # Con el historial ya cargado, el mensaje actual se añade a la caché.
+        history_cache.record_message(user_id, convo_id, user_message)
+        history_for_gemini = history_task.result()
+        with timings.stage("context"):
+            combined_context = context_assembler.assemble_context(chat_request.prompt, web_task.result(), rag_task.result())
+
+        yield sse.encode_event({"event": "status", "message": "Contexto recopilado. Construyendo la consulta..."})
         final_prompt = f"Contexto geográfico: {country_code}\n{combined_context}\n\n---\n\nPregunta del usuario: {chat_request.prompt}"
-        yield create_sse_event({"event": "status", "message": f"Enviando a {settings.GEMINI_MODEL} para análisis... 🧠"})
-        
-        full_response_text = ""
-        async for chunk in gemini_client.generate_streaming_response(
-            system_prompt=PIDA_SYSTEM_PROMPT,
+        yield sse.encode_event({"event": "status", "message": f"Enviando a {settings.GEMINI_MODEL} para análisis... 🧠"})
+        log.info(f"Convo {convo_id}: invocando a Gemini {time.perf_counter() - turn_started:.3f}s tras recibir la petición.")
+
+        response_stream = gemini_client.generate_streaming_response(
             prompt=final_prompt,
             history=history_for_gemini
-        ):
-            yield create_sse_event({'text': chunk})
-            full_response_text += chunk
+        )
+        # Los chunks se agrupan antes de enviarlos: menos eventos y escrituras en el socket.
+        generation_started = time.perf_counter()
+        async for text in sse.coalesce(response_stream, settings.SSE_COALESCE_MAX_CHARS, settings.SSE_COALESCE_INTERVAL):
+            if not response_parts:
+                timings.record("gemini_ttft", time.perf_counter() - generation_started)
+            yield sse.encode_event({'text': text})
+            response_parts.append(text)
+        timings.record("generation", time.perf_counter() - generation_started)
 
-        if full_response_text:
-            model_message = ChatMessage(role="model", content=full_response_text)
-            await firestore_client.add_message_to_conversation(user_id, convo_id, model_message)
+        # La respuesta se encola para persistirla: 'done' no espera a Firestore.
+        with timings.stage("persist_reply"):
+            if response_parts:
+                history_cache.append_message(user_id, convo_id, ChatMessage(role="model", content="".join(response_parts)))
+        reply_persisted = True
+        timings.record("total", time.perf_counter() - turn_started)
 
-        log.info(f"Streaming finalizado para convo {convo_id}. Enviando evento 'done'.")
-        yield create_sse_event({'event': 'done'})
+        yield sse.encode_event({"event": "server_timing", "timings_ms": timings.as_milliseconds(), "server_timing": timings.server_timing()})
+        log.info(f"Streaming finalizado para convo {convo_id} ({timings.server_timing()}). Enviando evento 'done'.")
+        yield sse.encode_event({'event': 'done'})
 
     except Exception as e:
         log.error(f"Error crítico durante el streaming para convo {convo_id}: {e}", exc_info=True)
-        error_message = json.dumps({"error": "Lo siento, ocurrió un error interno al generar la respuesta."})
-        yield f"data: {error_message}\n\n"
+        yield sse.encode_event({"error": "Lo siento, ocurrió un error interno al generar la respuesta."})
+    finally:
+        # Si el turno falla o el cliente se desconecta, no dejamos etapas huérfanas.
+        for task in stage_tasks:
+            if not task.done():
+                task.cancel()
+        # Si el cliente se desconectó a mitad de la respuesta, se guarda lo generado.
+        if response_parts and not reply_persisted:
+            history_cache.append_message(user_id, convo_id, ChatMessage(role="model", content="".join(response_parts)))
 
 # --- ENDPOINTS DE LA API ---
 
@@ -92,13 +190,97 @@ async def stream_chat_response_generator(chat_request: ChatRequest, country_code
 def read_status():
     return {"status": "ok", "message": "PIDA Backend de Lógica funcionando."}
 
+@app.get("/status/pools", tags=["Status"])
+def read_pool_status():
+    """Estado de los pools de conexiones HTTP compartidos (para dimensionarlos bajo carga)."""
+    return http_clients.pool_stats()
+
+@app.get("/status/content-cache", tags=["Status"])
+def read_content_cache_status():
+    """Aciertos, fallos y ocupación de la caché de texto extraído."""
+    return content_cache.stats()
+
+@app.get("/status/history-cache", tags=["Status"])
+def read_history_cache_status():
+    """Aciertos, fallos y ocupación de la caché de historiales."""
+    return history_cache.stats()
+
+@app.get("/status/persistence", tags=["Status"])
+def read_persistence_status():
+    """Profundidad de la cola de escritura en segundo plano y latencia de persistencia."""
+    return firestore_client.persistence_stats()
+
+@app.get("/metrics", response_class=PlainTextResponse, tags=["Status"])
+def read_metrics():
+    """Histogramas de latencia en el formato de texto de Prometheus."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/status/query-cache", tags=["Status"])
+def read_query_cache_status():
+    """Aciertos y agrupación de consultas idénticas en las cachés de resultados del PSE y del RAG."""
+    return query_cache.stats()
+
+@app.get("/status/resilience", tags=["Status"])
+def read_resilience_status():
+    """Estado del circuito, timeout adaptativo y percentiles de latencia de los servicios externos."""
+    return resilience.stats()
+
+@app.get("/status/admission", tags=["Status"])
+def read_admission_status():
+    """Generaciones activas, cola de espera y rechazos del control de admisión."""
+    return admission.stats()
+
+@app.get("/status/gemini", tags=["Status"])
+def read_gemini_status():
+    """Turnos servidos con la caché de contexto del prompt de sistema y tokens de entrada ahorrados."""
+    return gemini_client.stats()
+
+@app.get("/status/streams", tags=["Status"])
+def read_stream_status():
+    """Generaciones en curso y buffers de reanudación de streams SSE."""
+    return stream_registry.stats()
+
 @app.get("/conversations", response_model=List[Dict[str, Any]], tags=["Chat History"])
-async def get_user_conversations(user_id: str = Depends(get_current_user_id_insecure)):
-    return await firestore_client.get_conversations(user_id)
+async def get_user_conversations(
+    response: Response,
+    limit: int = Query(settings.CONVERSATIONS_PAGE_SIZE, ge=1, le=settings.MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    user_id: str = Depends(get_current_user_id_insecure),
+):
+    """Página de conversaciones; el cursor de la siguiente página va en la cabecera X-Next-Cursor."""
+    try:
+        convos, next_cursor = await firestore_client.get_conversations(user_id, limit=limit, cursor=cursor)
+    except firestore_client.InvalidCursorError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return convos
 
 @app.get("/conversations/{convo_id}/messages", response_model=List[ChatMessage], tags=["Chat History"])
-async def get_conversation_details(convo_id: str, user_id: str = Depends(get_current_user_id_insecure)):
-    return await firestore_client.get_conversation_messages(user_id, convo_id)
+async def get_conversation_details(
+    convo_id: str,
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=settings.MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    user_id: str = Depends(get_current_user_id_insecure),
+):
+    """
+    Mensajes en orden cronológico. Sin `limit` ni `cursor` se devuelve la
+    conversación completa, como espera el frontend actual; con cualquiera de
+    los dos, una página (MESSAGES_PAGE_SIZE por defecto) y el cursor de la
+    siguiente en la cabecera X-Next-Cursor.
+    """
+    if limit is None and cursor is None:
+        return await firestore_client.get_conversation_messages(user_id, convo_id)
+    try:
+        messages, next_cursor = await firestore_client.get_conversation_messages_page(
+            user_id, convo_id, limit=limit or settings.MESSAGES_PAGE_SIZE, cursor=cursor
+        )
+    except firestore_client.InvalidCursorError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return messages
 
 @app.post("/conversations", response_model=Dict[str, Any], status_code=status.HTTP_201_CREATED, tags=["Chat History"])
 async def create_new_empty_conversation(request: Request, user_id: str = Depends(get_current_user_id_insecure)):
@@ -109,10 +291,22 @@ async def create_new_empty_conversation(request: Request, user_id: str = Depends
     new_convo = await firestore_client.create_new_conversation(user_id, title)
     return new_convo
 
-@app.delete("/conversations/{convo_id}", status_code=status.HTTP_204_NO_CONTENT, tags=["Chat History"])
+@app.delete("/conversations/{convo_id}", status_code=status.HTTP_202_ACCEPTED, tags=["Chat History"])
 async def delete_a_conversation(convo_id: str, user_id: str = Depends(get_current_user_id_insecure)):
-    await firestore_client.delete_conversation(user_id, convo_id)
-    return
+    # El borrado de los mensajes sigue en segundo plano; su estado se consulta en /deletion.
+    # Antes se cancelan las generaciones en curso, que si no guardarían su respuesta al terminar.
+    await stream_registry.cancel_conversation(user_id, convo_id)
+    history_cache.invalidate(user_id, convo_id)
+    job = await firestore_client.start_conversation_deletion(user_id, convo_id)
+    job["status_url"] = f"/conversations/{convo_id}/deletion"
+    return JSONResponse(status_code=status.HTTP_202_ACCEPTED, content=job)
+
+@app.get("/conversations/{convo_id}/deletion", response_model=Dict[str, Any], tags=["Chat History"])
+async def get_deletion_status(convo_id: str, user_id: str = Depends(get_current_user_id_insecure)):
+    job = await firestore_client.get_deletion_status(user_id, convo_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="No hay una eliminación registrada para esta conversación")
+    return job
 
 @app.patch("/conversations/{convo_id}/title", status_code=status.HTTP_204_NO_CONTENT, tags=["Chat History"])
 async def update_conversation_title_handler(
@@ -134,14 +328,53 @@ async def chat_stream_handler(
     request: Request,
     user_id: str = Depends(get_current_user_id_insecure)
 ):
+    # Reconexión: con Last-Event-ID se reanuda la generación existente en vez de lanzar otra.
+    last_event_id = request.headers.get("Last-Event-ID")
+    if last_event_id:
+        return StreamingResponse(_resume_stream(user_id, convo_id, last_event_id), headers=SSE_HEADERS)
+
+    # Se rechaza antes de abrir el stream: el cliente recibe un 429 inmediato.
+    try:
+        ticket = admission.reserve(user_id)
+    except admission.AdmissionRejected as e:
+        log.warning(f"Usuario {user_id}: petición de chat rechazada por el control de admisión ({e}).")
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)},
+        )
+
     country_code = request.headers.get('X-Country-Code', None)
-    headers = {
-        "Content-Type": "text/event-stream",
-        "Cache-Control": "no-cache",
-        "Connection": "keep-alive",
-        "X-Accel-Buffering": "no"
-    }
-    return StreamingResponse(
-        stream_chat_response_generator(chat_request, country_code, user_id, convo_id),
-        headers=headers
+    # El hueco se mantiene mientras dura la generación (no la conexión) y se libera al terminar,
+    # también si la generación se cancela antes de empezar.
+    stream = stream_registry.start(
+        user_id, convo_id,
+        _admitted(ticket, stream_chat_response_generator(chat_request, country_code, user_id, convo_id)),
+        on_done=functools.partial(admission.release, ticket),
     )
+    return StreamingResponse(stream_registry.subscribe(stream), headers=SSE_HEADERS)
+
+@app.get("/chat-stream/{convo_id}", tags=["Chat"])
+async def chat_stream_resume_handler(
+    convo_id: str,
+    request: Request,
+    user_id: str = Depends(get_current_user_id_insecure)
+):
+    """Reanuda un stream con la cabecera Last-Event-ID (reconexión nativa de EventSource)."""
+    last_event_id = request.headers.get("Last-Event-ID")
+    if not last_event_id:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Falta la cabecera Last-Event-ID.")
+    return StreamingResponse(_resume_stream(user_id, convo_id, last_event_id), headers=SSE_HEADERS)
+
+def _resume_stream(user_id: str, convo_id: str, last_event_id: str):
+    try:
+        stream_id, after_seq = stream_registry.parse_last_event_id(last_event_id)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    try:
+        stream = stream_registry.find(user_id, convo_id, stream_id, after_seq)
+    except stream_registry.StreamGoneError as e:
+        # El cliente debe volver a enviar la pregunta sin Last-Event-ID.
+        raise HTTPException(status_code=status.HTTP_410_GONE, detail=str(e))
+    log.info(f"Convo {convo_id}: reanudando el stream {stream_id} tras el evento {after_seq}.")
+    return stream_registry.subscribe(stream, after_seq)
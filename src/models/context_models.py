@@ -0,0 +1,17 @@
+# src/models/context_models.py
+
+from pydantic import BaseModel, Field
+from typing import List, Literal, Optional
+
+class SourceDocument(BaseModel):
+    """Una fuente de contexto (página externa o documento interno) antes de formatearla para el prompt."""
+    origin: Literal["web", "rag"]
+    title: str
+    link: Optional[str] = None
+    author: Optional[str] = None
+    content: str
+
+class SourceSearchResult(BaseModel):
+    """Resultado de consultar una fuente de contexto. Si la consulta falló, `error_notice` es el aviso que va al prompt."""
+    documents: List[SourceDocument] = Field(default_factory=list)
+    error_notice: Optional[str] = None
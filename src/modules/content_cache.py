@@ -0,0 +1,209 @@
+# src/modules/content_cache.py
+
+import asyncio
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+from src.config import settings, log
+
+# Caché del texto ya extraído de las fuentes externas (no de los bytes crudos).
+# Tiene dos niveles:
+#   1. Memoria: LRU acotado por tamaño en bytes (CONTENT_CACHE_MAX_BYTES).
+#   2. Disco (opcional): SQLite en modo WAL, que sobrevive a reinicios y puede
+#      compartirse entre varios workers de uvicorn del mismo host.
+
+@dataclass
+class CachedDocument:
+    url: str
+    text: str
+    etag: Optional[str]
+    last_modified: Optional[str]
+    fetched_at: float
+    size: int = field(init=False)  # Bytes del texto en UTF-8, calculados una vez al crear la entrada
+
+    def __post_init__(self):
+        self.size = len(self.text.encode("utf-8"))
+
+    def is_fresh(self) -> bool:
+        return time.time() - self.fetched_at < settings.CONTENT_CACHE_TTL
+
+    def validators(self) -> Dict[str, str]:
+        """Encabezados para una petición condicional de revalidación."""
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+_memory: "OrderedDict[str, CachedDocument]" = OrderedDict()
+_memory_bytes = 0
+_stats = {"hits": 0, "stale": 0, "misses": 0, "revalidated": 0, "stores": 0, "evictions": 0}
+
+# --- NIVEL EN MEMORIA ---
+
+def _memory_get(url: str) -> Optional[CachedDocument]:
+    doc = _memory.get(url)
+    if doc is not None:
+        _memory.move_to_end(url)
+    return doc
+
+def _memory_put(doc: CachedDocument):
+    global _memory_bytes
+    if doc.size > settings.CONTENT_CACHE_MAX_BYTES:
+        return
+    previous = _memory.pop(doc.url, None)
+    if previous is not None:
+        _memory_bytes -= previous.size
+    _memory[doc.url] = doc
+    _memory_bytes += doc.size
+    while _memory_bytes > settings.CONTENT_CACHE_MAX_BYTES and _memory:
+        _, evicted = _memory.popitem(last=False)
+        _memory_bytes -= evicted.size
+        _stats["evictions"] += 1
+
+# --- NIVEL EN DISCO (SQLITE) ---
+
+_db: Optional[sqlite3.Connection] = None
+_db_lock = threading.Lock()
+
+def _get_db() -> Optional[sqlite3.Connection]:
+    global _db
+    if not settings.CONTENT_CACHE_DB_PATH:
+        return None
+    if _db is None:
+        conn = sqlite3.connect(settings.CONTENT_CACHE_DB_PATH, timeout=5.0, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            " url TEXT PRIMARY KEY, text TEXT NOT NULL, etag TEXT, last_modified TEXT,"
+            " fetched_at REAL NOT NULL, last_access REAL NOT NULL, size INTEGER NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_documents_last_access ON documents (last_access)")
+        # Total de bytes mantenido por triggers, exacto aunque varios workers
+        # compartan el fichero; se inicializa una sola vez con el contenido previo.
+        conn.executescript(
+            "BEGIN IMMEDIATE;"
+            "CREATE TABLE IF NOT EXISTS cache_size (id INTEGER PRIMARY KEY CHECK (id = 0), total INTEGER NOT NULL);"
+            "CREATE TRIGGER IF NOT EXISTS documents_size_insert AFTER INSERT ON documents"
+            " BEGIN UPDATE cache_size SET total = total + new.size WHERE id = 0; END;"
+            "CREATE TRIGGER IF NOT EXISTS documents_size_update AFTER UPDATE OF size ON documents"
+            " BEGIN UPDATE cache_size SET total = total + new.size - old.size WHERE id = 0; END;"
+            "CREATE TRIGGER IF NOT EXISTS documents_size_delete AFTER DELETE ON documents"
+            " BEGIN UPDATE cache_size SET total = total - old.size WHERE id = 0; END;"
+            "INSERT OR IGNORE INTO cache_size (id, total) SELECT 0, COALESCE(SUM(size), 0) FROM documents;"
+            "COMMIT;"
+        )
+        _db = conn
+    return _db
+
+def _disk_get(url: str) -> Optional[CachedDocument]:
+    with _db_lock:
+        conn = _get_db()
+        if conn is None:
+            return None
+        row = conn.execute(
+            "SELECT text, etag, last_modified, fetched_at FROM documents WHERE url = ?", (url,)
+        ).fetchone()
+        if row is None:
+            return None
+        conn.execute("UPDATE documents SET last_access = ? WHERE url = ?", (time.time(), url))
+        conn.commit()
+    return CachedDocument(url=url, text=row[0], etag=row[1], last_modified=row[2], fetched_at=row[3])
+
+def _disk_put(doc: CachedDocument):
+    with _db_lock:
+        conn = _get_db()
+        if conn is None:
+            return
+        now = time.time()
+        # Upsert en lugar de INSERT OR REPLACE: el borrado implícito de REPLACE no dispara los triggers de cache_size.
+        conn.execute(
+            "INSERT INTO documents (url, text, etag, last_modified, fetched_at, last_access, size)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?)"
+            " ON CONFLICT (url) DO UPDATE SET text = excluded.text, etag = excluded.etag,"
+            " last_modified = excluded.last_modified, fetched_at = excluded.fetched_at,"
+            " last_access = excluded.last_access, size = excluded.size",
+            (doc.url, doc.text, doc.etag, doc.last_modified, doc.fetched_at, now, doc.size),
+        )
+        # Expulsa las entradas menos usadas hasta volver por debajo del límite.
+        total = conn.execute("SELECT total FROM cache_size WHERE id = 0").fetchone()[0]
+        while total > settings.CONTENT_CACHE_DB_MAX_BYTES:
+            row = conn.execute("SELECT url, size FROM documents ORDER BY last_access LIMIT 1").fetchone()
+            if row is None:
+                break
+            conn.execute("DELETE FROM documents WHERE url = ?", (row[0],))
+            total -= row[1]
+            _stats["evictions"] += 1
+        conn.commit()
+
+def _disk_touch(url: str, fetched_at: float):
+    with _db_lock:
+        conn = _get_db()
+        if conn is None:
+            return
+        conn.execute("UPDATE documents SET fetched_at = ?, last_access = ? WHERE url = ?", (fetched_at, fetched_at, url))
+        conn.commit()
+
+# --- API PÚBLICA ---
+
+async def lookup(url: str) -> Optional[CachedDocument]:
+    """
+    Busca el texto de una URL en la caché (memoria y luego disco).
+    Devuelve la entrada aunque haya caducado, para poder revalidarla
+    con ETag/Last-Modified; el llamador comprueba is_fresh().
+    """
+    doc = _memory_get(url)
+    if doc is None and settings.CONTENT_CACHE_DB_PATH:
+        try:
+            doc = await asyncio.to_thread(_disk_get, url)
+        except Exception as e:
+            log.warning(f"Error al leer la caché en disco para {url}: {e}")
+        if doc is not None:
+            _memory_put(doc)
+
+    if doc is None:
+        _stats["misses"] += 1
+    elif doc.is_fresh():
+        _stats["hits"] += 1
+    else:
+        _stats["stale"] += 1
+    return doc
+
+async def store(url: str, text: str, etag: Optional[str] = None, last_modified: Optional[str] = None):
+    """Guarda el texto extraído de una URL en ambos niveles."""
+    doc = CachedDocument(url=url, text=text, etag=etag, last_modified=last_modified, fetched_at=time.time())
+    _memory_put(doc)
+    _stats["stores"] += 1
+    if settings.CONTENT_CACHE_DB_PATH:
+        try:
+            await asyncio.to_thread(_disk_put, doc)
+        except Exception as e:
+            log.warning(f"Error al escribir la caché en disco para {url}: {e}")
+
+async def mark_revalidated(doc: CachedDocument):
+    """El origen respondió 304 Not Modified: la entrada vuelve a estar fresca."""
+    doc.fetched_at = time.time()
+    _memory_put(doc)
+    _stats["revalidated"] += 1
+    if settings.CONTENT_CACHE_DB_PATH:
+        try:
+            await asyncio.to_thread(_disk_touch, doc.url, doc.fetched_at)
+        except Exception as e:
+            log.warning(f"Error al actualizar la caché en disco para {doc.url}: {e}")
+
+def stats() -> Dict[str, int]:
+    """Contadores de aciertos/fallos y ocupación del nivel en memoria."""
+    return {**_stats, "memory_entries": len(_memory), "memory_bytes": _memory_bytes}
+
+def close():
+    """Cierra la conexión a SQLite (se llama al apagar la aplicación)."""
+    global _db
+    with _db_lock:
+        if _db is not None:
+            _db.close()
+            _db = None
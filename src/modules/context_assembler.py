@@ -0,0 +1,174 @@
+# src/modules/context_assembler.py
+
+import math
+import re
+import textwrap
+import unicodedata
+from collections import Counter
+from typing import Dict, List, Set
+from src.config import settings, log
+from src.models.context_models import SourceDocument, SourceSearchResult
+from src.modules import pse_client, rag_client
+
+# Ensamblado del contexto que acompaña a la pregunta del usuario.
+# En lugar de concatenar todo lo que devuelven el PSE y el RAG, las fuentes se
+# dividen en pasajes, se eliminan los casi duplicados (shingles de palabras),
+# se ordenan por relevancia frente a la pregunta (BM25) y se empaquetan los
+# mejores hasta CONTEXT_MAX_CHARS. El resultado conserva el formato de
+# atribución de cada fuente que exige PIDA_SYSTEM_PROMPT.
+
+SHINGLE_SIZE = 3
+BM25_K1 = 1.5
+BM25_B = 0.75
+PASSAGE_SEPARATOR = " [...] "
+
+_SENTENCE_SPLIT = re.compile(r"(?<=[.!?;:])\s+")
+_WORD = re.compile(r"\w+")
+_STOPWORDS = {
+    "que", "los", "las", "del", "por", "con", "para", "una", "uno", "sus", "como", "mas", "pero",
+    "sin", "sobre", "este", "esta", "estos", "estas", "ese", "esa", "entre", "cuando", "muy", "donde",
+    "son", "fue", "han", "ser", "hay", "the", "and", "for", "with", "that", "this", "from",
+}
+
+class _Passage:
+    __slots__ = ("doc_index", "position", "text", "terms", "shingles", "score")
+
+    def __init__(self, doc_index: int, position: int, text: str):
+        self.doc_index = doc_index
+        self.position = position
+        self.text = text
+        self.terms = _terms(text)
+        self.shingles = {hash(tuple(self.terms[i:i + SHINGLE_SIZE])) for i in range(max(1, len(self.terms) - SHINGLE_SIZE + 1))}
+        self.score = 0.0
+
+def _terms(text: str) -> List[str]:
+    """Palabras normalizadas (minúsculas, sin tildes ni palabras vacías)."""
+    normalized = unicodedata.normalize("NFKD", text.lower())
+    normalized = "".join(c for c in normalized if not unicodedata.combining(c))
+    return [w for w in _WORD.findall(normalized) if len(w) > 2 and w not in _STOPWORDS]
+
+def _split_passages(doc_index: int, doc: SourceDocument) -> List[_Passage]:
+    """Divide el contenido de una fuente en pasajes de unas CONTEXT_PASSAGE_CHARS por frases completas."""
+    passages: List[_Passage] = []
+    current: List[str] = []
+    length = 0
+    # Las "frases" más largas que un pasaje (p. ej. texto de PDF sin puntuación) se trocean.
+    pieces = (
+        piece
+        for sentence in _SENTENCE_SPLIT.split(doc.content)
+        for piece in (textwrap.wrap(sentence, settings.CONTEXT_PASSAGE_CHARS) if len(sentence) > settings.CONTEXT_PASSAGE_CHARS else [sentence])
+    )
+    for sentence in pieces:
+        if current and length + len(sentence) > settings.CONTEXT_PASSAGE_CHARS:
+            passages.append(_Passage(doc_index, len(passages), " ".join(current)))
+            current, length = [], 0
+        current.append(sentence)
+        length += len(sentence) + 1
+    if current:
+        passages.append(_Passage(doc_index, len(passages), " ".join(current)))
+    return [p for p in passages if p.terms]
+
+def _jaccard(a: Set[int], b: Set[int]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+def _deduplicate(passages: List[_Passage]) -> List[_Passage]:
+    """
+    Descarta los pasajes casi idénticos a otro ya aceptado (similitud de
+    Jaccard entre sus shingles >= CONTEXT_DEDUP_THRESHOLD). Con las pocas
+    decenas de pasajes de un turno la comparación exacta es más barata que MinHash.
+    """
+    kept: List[_Passage] = []
+    for passage in passages:
+        if all(_jaccard(passage.shingles, other.shingles) < settings.CONTEXT_DEDUP_THRESHOLD for other in kept):
+            kept.append(passage)
+    return kept
+
+def _score_bm25(passages: List[_Passage], query: str):
+    """Puntúa cada pasaje frente a la pregunta con BM25, usando los propios pasajes como corpus."""
+    query_terms = set(_terms(query))
+    if not passages or not query_terms:
+        return
+    avg_length = sum(len(p.terms) for p in passages) / len(passages)
+    document_frequency: Dict[str, int] = Counter()
+    for passage in passages:
+        document_frequency.update(query_terms.intersection(passage.terms))
+
+    total = len(passages)
+    for passage in passages:
+        frequencies = Counter(passage.terms)
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * len(passage.terms) / avg_length)
+        score = 0.0
+        for term in query_terms:
+            tf = frequencies.get(term, 0)
+            if tf:
+                idf = math.log(1 + (total - document_frequency[term] + 0.5) / (document_frequency[term] + 0.5))
+                score += idf * tf * (BM25_K1 + 1) / (tf + norm)
+        passage.score = score
+
+def _pack(passages: List[_Passage], budget: int) -> List[_Passage]:
+    """
+    Elige pasajes hasta llenar `budget` caracteres: primero el mejor de cada
+    fuente (para que el modelo disponga de varias fuentes que citar) y después
+    el resto por orden de relevancia.
+    """
+    ranked = sorted(passages, key=lambda p: p.score, reverse=True)
+    best_per_doc: Dict[int, _Passage] = {}
+    for passage in ranked:
+        best_per_doc.setdefault(passage.doc_index, passage)
+
+    selected: List[_Passage] = []
+    used = 0
+    for passage in list(best_per_doc.values()) + ranked:
+        if passage in selected:
+            continue
+        cost = len(passage.text) + len(PASSAGE_SEPARATOR)
+        if used + cost > budget:
+            continue
+        selected.append(passage)
+        used += cost
+    return selected
+
+def assemble_context(query: str, web_result: SourceSearchResult, rag_result: SourceSearchResult) -> str:
+    """
+    Construye la sección de contexto del prompt a partir de las fuentes
+    externas y de los documentos internos, acotada a CONTEXT_MAX_CHARS.
+    Si una fuente falló, su aviso de error ocupa su lugar.
+    """
+    documents = web_result.documents + rag_result.documents
+    passages: List[_Passage] = []
+    for doc_index, doc in enumerate(documents):
+        passages.extend(_split_passages(doc_index, doc))
+
+    unique = _deduplicate(passages)
+    _score_bm25(unique, query)
+    selected = _pack(unique, settings.CONTEXT_MAX_CHARS)
+
+    # Se reagrupan los pasajes por fuente, en su orden original.
+    by_doc: Dict[int, List[_Passage]] = {}
+    for passage in sorted(selected, key=lambda p: (p.doc_index, p.position)):
+        by_doc.setdefault(passage.doc_index, []).append(passage)
+
+    trimmed = [
+        documents[i].model_copy(update={"content": PASSAGE_SEPARATOR.join(p.text for p in by_doc[i])})
+        for i in sorted(by_doc)
+    ]
+    web = [d for d in trimmed if d.origin == "web"]
+    rag = [d for d in trimmed if d.origin == "rag"]
+
+    if web:
+        context = pse_client.format_source_documents(web)
+    else:
+        context = web_result.error_notice or "No se encontraron resultados de búsqueda externos."
+    if rag:
+        context += rag_client.format_internal_documents(rag)
+    elif rag_result.error_notice:
+        context += rag_result.error_notice
+
+    original_chars = sum(len(d.content) for d in documents)
+    log.info(
+        f"Contexto ensamblado: {len(selected)}/{len(passages)} pasajes "
+        f"({len(passages) - len(unique)} duplicados), {original_chars} -> {len(context)} caracteres."
+    )
+    return context
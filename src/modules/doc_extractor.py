@@ -0,0 +1,142 @@
+# src/modules/doc_extractor.py
+
+import io
+import re
+import time
+from typing import List, Optional, Union
+
+# Funciones puras de extracción de texto. Se ejecutan en el pool de
+# extracción (ver extraction_pool.py), posiblemente en otro proceso, por lo
+# que este módulo no depende de la configuración ni de clientes de la nube.
+# pypdf y lxml se importan dentro de cada función para que el proceso
+# trabajador solo cargue lo que necesita.
+
+CHARSET_SNIFF_BYTES = 1024  # Bytes iniciales donde se busca un charset declarado en el HTML
+HTML_FEED_BYTES = 64 * 1024  # Trozo que se pasa al parser de una vez al extraer un HTML completo
+_DECLARED_CHARSET = re.compile(rb"charset\s*=", re.IGNORECASE)
+
+def preload(pdf: bool = True):
+    """Importa lxml y, si `pdf`, pypdf por adelantado (calentamiento tras el arranque)."""
+    import lxml.etree  # noqa: F401
+    if pdf:
+        import pypdf  # noqa: F401
+
+def _normalize(text: str) -> str:
+    return text.replace("\\n", " ").replace("\n", " ")
+
+def extract_pdf_text(data: bytes, max_pages: int, max_chars: int, cpu_budget: float) -> str:
+    """
+    Extrae el texto de las primeras `max_pages` páginas de un PDF.
+    Se detiene en cuanto se reúnen `max_chars` caracteres o, entre páginas,
+    si se supera `cpu_budget` segundos de CPU (el tope estricto lo impone
+    extraction_pool en modo 'process').
+    """
+    from pypdf import PdfReader
+
+    started = time.thread_time()
+    reader = PdfReader(io.BytesIO(data))
+
+    parts: List[str] = []
+    total = 0
+    for i, page in enumerate(reader.pages):
+        if i >= max_pages or total >= max_chars or time.thread_time() - started > cpu_budget:
+            break
+        page_text = page.extract_text()
+        if page_text:
+            page_text = _normalize(page_text)
+            parts.append(page_text)
+            total += len(page_text)
+
+    return "".join(parts).strip()[:max_chars]
+
+class HtmlTextCollector:
+    """
+    Extrae el texto de los párrafos (<p>) de un HTML a medida que llegan sus
+    bytes, con el parser incremental de lxml. `feed` indica cuándo se han
+    reunido `max_chars` caracteres, para que el llamador deje de descargar.
+    `encoding` es el charset declarado por el servidor, si lo hay.
+    """
+
+    def __init__(self, max_chars: int, encoding: Optional[str] = None):
+        self.max_chars = max_chars
+        self._encoding = encoding
+        self._parser = None
+        self._pending = bytearray()  # Bytes iniciales, hasta decidir el charset
+        self._parts: List[str] = []
+        self._total = 0
+
+    @property
+    def done(self) -> bool:
+        return self._total >= self.max_chars
+
+    def feed(self, data: bytes) -> bool:
+        """Parsea un trozo más del documento. Devuelve True si ya hay `max_chars` caracteres."""
+        if self.done:
+            return True
+        if self._parser is None:
+            self._pending += data
+            if len(self._pending) < CHARSET_SNIFF_BYTES:
+                return False
+            data = self._start()
+        self._parser.feed(data)
+        self._collect()
+        return self.done
+
+    def close(self) -> str:
+        """Termina el parseo y devuelve el texto reunido."""
+        from lxml import etree
+
+        if self.done:
+            return " ".join(self._parts).strip()[:self.max_chars]
+        if self._parser is None:
+            if not self._pending:
+                return ""
+            data = self._start()
+            self._parser.feed(data)
+        try:
+            self._parser.close()
+        except etree.XMLSyntaxError:
+            pass  # Documento sin raíz: no hay párrafos.
+        self._collect()
+        return " ".join(self._parts).strip()[:self.max_chars]
+
+    def _start(self) -> bytes:
+        """Crea el parser con el charset decidido y devuelve los bytes retenidos hasta ahora."""
+        from lxml import etree
+
+        encoding = self._encoding
+        # Sin charset del servidor ni del documento, libxml2 supondría Latin-1; como BeautifulSoup, preferimos UTF-8.
+        if encoding is None and not _DECLARED_CHARSET.search(self._pending[:CHARSET_SNIFF_BYTES]):
+            encoding = "utf-8"
+        try:
+            self._parser = etree.HTMLPullParser(events=("end",), tag="p", encoding=encoding)
+        except LookupError:
+            self._parser = etree.HTMLPullParser(events=("end",), tag="p", encoding="utf-8")
+        data = bytes(self._pending)
+        self._pending = bytearray()
+        return data
+
+    def _collect(self):
+        for _, element in self._parser.read_events():
+            if self._total < self.max_chars:
+                text = _normalize("".join(element.itertext()))
+                self._parts.append(text)
+                self._total += len(text) + 1
+            element.clear(keep_tail=True)  # El árbol no crece con los párrafos ya leídos.
+
+def extract_html_text(html: Union[str, bytes], max_chars: int, cpu_budget: float, encoding: Optional[str] = None) -> str:
+    """
+    Extrae el texto de los párrafos (<p>) de una página HTML ya descargada.
+    El parseo se detiene en cuanto se reúnen `max_chars` caracteres o se supera
+    `cpu_budget` segundos de CPU (comprobado cada HTML_FEED_BYTES; ver
+    extract_pdf_text). `encoding` es el charset declarado por el servidor, si lo hay.
+    """
+    if isinstance(html, str):
+        html, encoding = html.encode("utf-8"), "utf-8"
+
+    started = time.thread_time()
+    collector = HtmlTextCollector(max_chars, encoding)
+    for offset in range(0, len(html), HTML_FEED_BYTES):
+        if collector.feed(html[offset:offset + HTML_FEED_BYTES]) or time.thread_time() - started > cpu_budget:
+            break
+    return collector.close()
@@ -0,0 +1,175 @@
+# src/modules/extraction_pool.py
+
+import asyncio
+import math
+import multiprocessing
+import signal
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Optional
+from src.config import settings, log
+
+# Pool de trabajadores para la extracción de texto de PDF/HTML.
+# El parseo es intensivo en CPU; ejecutarlo dentro del handler bloquearía el
+# event loop y detendría los streams SSE del resto de usuarios del worker.
+#
+# Tope de CPU por documento (EXTRACTION_CPU_BUDGET):
+#   - 'process' (por defecto): antes de cada documento el trabajador fija el
+#     límite blando RLIMIT_CPU a su consumo actual más el presupuesto; al
+#     superarlo el kernel envía SIGXCPU y la extracción se interrumpe aunque
+#     esté dentro de un único page.extract_text(). La interrupción es una
+#     BaseException para que los `except Exception` de pypdf o lxml no la
+#     absorban. El trabajador sigue vivo y queda libre para el siguiente
+#     documento. Si un trabajador muere, el pool se vuelve a crear.
+#   - 'thread': el límite solo se comprueba entre páginas y párrafos
+#     (cooperativo). Un documento patológico conserva su hilo y su hueco en
+#     la cola hasta terminar, aunque el llamador ya haya usado el snippet.
+
+# Módulos que el forkserver importa una sola vez; cada trabajador los hereda ya cargados.
+_WORKER_PRELOAD = ["src.modules.doc_extractor", "pypdf", "lxml.etree"]
+
+class CpuBudgetExceeded(BaseException):
+    """El documento agotó su presupuesto de CPU en el proceso trabajador."""
+
+# Solo se interrumpe mientras hay un documento con límite en curso: un SIGXCPU
+# que llegue después no debe romper el bucle del propio trabajador.
+_limit_active = False
+
+def _raise_cpu_budget_exceeded(signum, frame):
+    if _limit_active:
+        raise CpuBudgetExceeded()
+
+def _init_worker():
+    """Inicializador de cada proceso trabajador."""
+    signal.signal(signal.SIGXCPU, _raise_cpu_budget_exceeded)
+
+def _run_with_cpu_limit(func: Callable[..., str], cpu_budget: float, *args) -> str:
+    """Ejecuta `func` en el proceso trabajador con un límite de CPU de `cpu_budget` segundos."""
+    import resource
+
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    # RLIMIT_CPU se mide en segundos enteros del consumo acumulado del proceso.
+    soft = math.ceil(usage.ru_utime + usage.ru_stime + cpu_budget)
+    if hard != resource.RLIM_INFINITY:
+        soft = min(soft, hard)
+    global _limit_active
+    _limit_active = True
+    resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+    try:
+        return func(*args)
+    except CpuBudgetExceeded:
+        # Se relanza sin la traza de pypdf/lxml, que no hace falta en el proceso principal.
+        raise CpuBudgetExceeded() from None
+    finally:
+        _limit_active = False
+        resource.setrlimit(resource.RLIMIT_CPU, (hard, hard))
+
+_executor: Optional[Executor] = None
+_slots: Optional[asyncio.Semaphore] = None
+
+def startup():
+    """Crea el executor configurado. Se llama desde el lifespan de la aplicación."""
+    global _executor, _slots
+    if _executor is not None:
+        return
+    if settings.EXTRACTION_EXECUTOR == "process":
+        # 'forkserver' evita heredar hilos (gRPC, logging) del proceso principal.
+        # El servidor importa los parsers una sola vez y los trabajadores se
+        # arrancan ya aquí, para que la primera búsqueda no pague su arranque.
+        # Arrancarlos espera a que el servidor termine esas importaciones, así
+        # que se hace en un hilo y no bloquea el event loop.
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload(_WORKER_PRELOAD)
+        _executor = ProcessPoolExecutor(
+            max_workers=settings.EXTRACTION_WORKERS,
+            mp_context=context,
+            initializer=_init_worker,
+        )
+        threading.Thread(target=_start_workers, args=(_executor,), name="extraction-startup", daemon=True).start()
+    else:
+        _executor = ThreadPoolExecutor(max_workers=settings.EXTRACTION_WORKERS, thread_name_prefix="extraction")
+    # Documentos en proceso + en espera. Al llenarse, se usa el snippet en su lugar.
+    _slots = asyncio.Semaphore(settings.EXTRACTION_WORKERS + settings.EXTRACTION_MAX_QUEUE)
+    log.info(f"Pool de extracción inicializado ({settings.EXTRACTION_EXECUTOR}, {settings.EXTRACTION_WORKERS} trabajadores).")
+
+def _start_workers(executor: ProcessPoolExecutor):
+    """Lanza los procesos trabajadores con tareas vacías."""
+    try:
+        for _ in range(settings.EXTRACTION_WORKERS):
+            executor.submit(int)
+    except RuntimeError:
+        pass  # El pool se cerró antes de terminar de arrancar.
+
+def preload():
+    """
+    Importa en el proceso principal los parsers que se usan en él: lxml
+    siempre (pse_client parsea el HTML al descargarlo) y pypdf solo en modo
+    'thread'; en modo 'process' los trabajadores ya lo tienen cargado.
+    """
+    from src.modules import doc_extractor
+    doc_extractor.preload(pdf=settings.EXTRACTION_EXECUTOR != "process")
+
+def shutdown():
+    """Detiene el executor sin esperar a los documentos pendientes."""
+    global _executor, _slots
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+    _executor = None
+    _slots = None
+
+def _restart(broken: Executor):
+    """Sustituye un pool roto (p. ej. un trabajador terminado por el sistema) por uno nuevo."""
+    global _executor, _slots
+    if _executor is not broken:
+        return  # Otra petición ya lo recreó.
+    broken.shutdown(wait=False, cancel_futures=True)
+    _executor = None
+    _slots = None
+    startup()
+
+async def run(func: Callable[..., str], *args) -> Optional[str]:
+    """
+    Ejecuta una función de doc_extractor en el pool.
+    Devuelve None si la cola está llena, si se supera EXTRACTION_TIMEOUT o si
+    la extracción falla; el llamador recurre entonces al snippet de búsqueda.
+    """
+    if _executor is None:
+        startup()
+
+    slots = _slots
+    if slots.locked():
+        log.warning("Cola de extracción llena. Se usará el snippet de la búsqueda.")
+        return None
+    await slots.acquire()
+
+    loop = asyncio.get_running_loop()
+    executor = _executor
+    try:
+        if isinstance(executor, ProcessPoolExecutor):
+            future = loop.run_in_executor(executor, _run_with_cpu_limit, func, settings.EXTRACTION_CPU_BUDGET, *args)
+        else:
+            future = loop.run_in_executor(executor, func, *args)
+    except Exception:
+        slots.release()
+        raise
+    # El hueco se libera cuando el trabajador termina de verdad, no al vencer
+    # el timeout, para que la profundidad de la cola siga acotada.
+    future.add_done_callback(lambda _: slots.release())
+
+    try:
+        return await asyncio.wait_for(asyncio.shield(future), timeout=settings.EXTRACTION_TIMEOUT)
+    except asyncio.TimeoutError:
+        log.warning(f"La extracción superó {settings.EXTRACTION_TIMEOUT}s. Se usará el snippet de la búsqueda.")
+        return None
+    except CpuBudgetExceeded:
+        log.warning(f"La extracción superó {settings.EXTRACTION_CPU_BUDGET}s de CPU. Se usará el snippet de la búsqueda.")
+        return None
+    except BrokenProcessPool as e:
+        log.error(f"Un trabajador del pool de extracción terminó de forma inesperada; se recrea el pool: {e}")
+        _restart(executor)
+        return None
+    except Exception as e:
+        log.warning(f"Error en el pool de extracción: {e}")
+        return None
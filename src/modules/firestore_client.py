@@ -1,84 +1,570 @@
 # src/modules/firestore_client.py
 
-from google.cloud import firestore
+import asyncio
+import functools
+import threading
+import time
+from collections import deque
 from src.config import settings, log
+from src.core import metrics
 from src.models.chat_models import ChatMessage
-from typing import List, Dict, Any
+from typing import Deque, List, Dict, Any, NamedTuple, Optional, Set, Tuple
+import base64
 import datetime
+import json
+import uuid
 
-# Inicializa el cliente de Firestore de forma asíncrona
-db = firestore.AsyncClient(project=settings.GOOGLE_CLOUD_PROJECT)
+# El cliente asíncrono de Firestore (y la propia librería, que arrastra gRPC) se
+# cargan en el primer uso o en el calentamiento, no al importar el módulo: así el
+# arranque en frío en Cloud Run no paga ese coste antes de poder responder.
+_db = None
 
-async def get_conversations(user_id: str) -> List[Dict[str, Any]]:
-    """Obtiene la lista de conversaciones (ID, título, fecha) para un usuario, ordenadas por fecha."""
+def _firestore():
+    """Módulo google.cloud.firestore, importado bajo demanda."""
+    from google.cloud import firestore
+    return firestore
+
+_db_lock = threading.Lock()
+
+def get_db():
+    """
+    Devuelve el cliente de Firestore, creándolo en el primer uso. Crearlo importa
+    la librería y busca las credenciales (segundos): desde el event loop se
+    llama a través de _uses_db, que lo hace en un hilo.
+    """
+    global _db
+    if _db is None:
+        with _db_lock:
+            if _db is None:
+                _db = _firestore().AsyncClient(project=settings.GOOGLE_CLOUD_PROJECT)
+                log.info("Cliente de Firestore inicializado.")
+    return _db
+
+def _uses_db(func):
+    """Crea el cliente en un hilo antes de la primera operación, para no bloquear el event loop."""
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        if _db is None:
+            await asyncio.to_thread(get_db)
+        return await func(*args, **kwargs)
+    return wrapper
+
+def close_db():
+    """Cierra el cliente de Firestore, si llegó a crearse. Se llama al apagar la aplicación."""
+    global _db
+    if _db is not None:
+        _db.close()
+        _db = None
+
+DOCUMENT_ID = "__name__"  # Ruta de campo del ID del documento (FieldPath.document_id())
+
+class InvalidCursorError(ValueError):
+    """El cursor de paginación recibido no es válido."""
+
+def _encode_cursor(value: Any, doc_id: str) -> str:
+    payload = {"id": doc_id}
+    if isinstance(value, datetime.datetime):
+        payload["ts"] = value.isoformat()
+    else:
+        payload["v"] = value
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip("=")
+
+def _decode_cursor(cursor: str) -> Tuple[Any, str]:
     try:
-        conversations_ref = db.collection('users').document(user_id).collection('conversations').order_by("created_at", direction=firestore.Query.DESCENDING)
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        value = datetime.datetime.fromisoformat(payload["ts"]) if "ts" in payload else payload["v"]
+        return value, str(payload["id"])
+    except Exception:
+        raise InvalidCursorError("Cursor de paginación no válido")
+
+async def _page(query, limit: int, cursor: Optional[str], order_field: str, direction: str):
+    """
+    Ordena la consulta por `order_field` y por ID de documento (para que el
+    orden sea estable) y le aplica un cursor opaco y el límite. El cursor lleva
+    ambos valores del último documento de la página anterior, así que no hace
+    falta leerlo de nuevo. Devuelve (documentos, siguiente cursor).
+    """
+    query = query.order_by(order_field, direction=direction).order_by(DOCUMENT_ID, direction=direction)
+    if cursor:
+        value, doc_id = _decode_cursor(cursor)
+        query = query.start_after({order_field: value, DOCUMENT_ID: doc_id})
+    docs = [doc async for doc in query.limit(limit + 1).stream()]
+    if len(docs) <= limit:
+        return docs, None
+    last = docs[limit - 1]
+    return docs[:limit], _encode_cursor(last.get(order_field), last.id)
+
+def _timestamp_to_iso(value) -> Optional[str]:
+    return value.isoformat() if isinstance(value, datetime.datetime) else None
+
+@_uses_db
+async def get_conversations(user_id: str, limit: int = 50, cursor: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    Obtiene una página de conversaciones de un usuario, de la más reciente a la
+    más antigua. Solo se leen los campos necesarios para la barra lateral.
+    Devuelve la página y el cursor de la siguiente (None si no hay más).
+    """
+    try:
+        collection_ref = get_db().collection('users').document(user_id).collection('conversations')
+        query = collection_ref.select(["title", "created_at", "updated_at", "message_count", "message_count_exact", "deleting"])
+        docs, next_cursor = await _page(query, limit, cursor, "created_at", _firestore().Query.DESCENDING)
         convos = []
-        async for doc in conversations_ref.stream():
+        for doc in docs:
             data = doc.to_dict()
-            convos.append({"id": doc.id, "title": data.get("title", "Sin Título")})
-        return convos
+            if data.get("deleting"):
+                continue
+            if not data.get("message_count_exact"):
+                _schedule_message_count_backfill(user_id, doc.id)
+            convos.append({
+                "id": doc.id,
+                "title": data.get("title", "Sin Título"),
+                "updated_at": _timestamp_to_iso(data.get("updated_at") or data.get("created_at")),
+                # None = desconocido, hasta que termine el recálculo.
+                "message_count": data.get("message_count", 0) if data.get("message_count_exact") else None,
+            })
+        return convos, next_cursor
+    except InvalidCursorError:
+        raise
     except Exception as e:
         log.error(f"Error al obtener conversaciones para el usuario {user_id}: {e}")
-        return []
+        return [], None
 
-async def get_conversation_messages(user_id: str, convo_id: str) -> List[ChatMessage]:
-    """Obtiene todos los mensajes de una conversación específica, ordenados por tiempo."""
+@_uses_db
+async def get_conversation_messages_page(user_id: str, convo_id: str, limit: int = 200, cursor: Optional[str] = None) -> Tuple[List[ChatMessage], Optional[str]]:
+    """
+    Obtiene una página de mensajes de una conversación, en orden cronológico, y
+    el cursor de la siguiente. La última página incluye al final los mensajes
+    que la cola de escritura aún no ha confirmado, como get_conversation_messages.
+    """
     try:
-        messages_ref = db.collection('users').document(user_id).collection('conversations').document(convo_id).collection('messages').order_by('timestamp')
+        collection_ref = get_db().collection('users').document(user_id).collection('conversations').document(convo_id).collection('messages')
+        query = collection_ref.select(["role", "content", "timestamp"])
+        docs, next_cursor = await _page(query, limit, cursor, "timestamp", _firestore().Query.ASCENDING)
         messages = []
+        read_ids = set()
+        for msg_doc in docs:
+            read_ids.add(msg_doc.id)
+            data = msg_doc.to_dict()
+            data['content'] = str(data.get('content', ''))
+            messages.append(ChatMessage(**data))
+        if next_cursor is None:
+            for item in _unwritten_messages(user_id, convo_id):
+                if item.message_id not in read_ids:
+                    messages.append(ChatMessage(role=item.data["role"], content=str(item.data["content"])))
+        return messages, next_cursor
+    except InvalidCursorError:
+        raise
+    except Exception as e:
+        log.error(f"Error al obtener mensajes para la convo {convo_id} del usuario {user_id}: {e}")
+        return [], None
+
+@_uses_db
+async def get_conversation_messages(user_id: str, convo_id: str, exclude_ids: Optional[Set[str]] = None) -> List[ChatMessage]:
+    """
+    Obtiene todos los mensajes de una conversación específica, ordenados por tiempo.
+    `exclude_ids` omite mensajes concretos (p. ej. el del turno actual, que puede
+    estar escribiéndose en paralelo a esta lectura).
+    Incluye al final los mensajes que la cola de escritura aún no ha confirmado.
+    """
+    try:
+        messages_ref = get_db().collection('users').document(user_id).collection('conversations').document(convo_id).collection('messages').select(["role", "content", "timestamp"]).order_by('timestamp')
+        messages = []
+        read_ids = set()
         async for msg_doc in messages_ref.stream():
+            read_ids.add(msg_doc.id)
+            if exclude_ids and msg_doc.id in exclude_ids:
+                continue
             data = msg_doc.to_dict()
             # Aseguramos que el contenido sea un string
             data['content'] = str(data.get('content', ''))
             messages.append(ChatMessage(**data))
+        # Sin esto, una respuesta recién encolada faltaría en el historial del turno siguiente.
+        for item in _unwritten_messages(user_id, convo_id):
+            if item.message_id not in read_ids and not (exclude_ids and item.message_id in exclude_ids):
+                messages.append(ChatMessage(role=item.data["role"], content=str(item.data["content"])))
         return messages
     except Exception as e:
         log.error(f"Error al obtener mensajes para la convo {convo_id} del usuario {user_id}: {e}")
         return []
 
-async def add_message_to_conversation(user_id: str, convo_id: str, message: ChatMessage):
-    """Añade un nuevo mensaje a una conversación, incluyendo un timestamp del servidor."""
+def _conversation_activity_update() -> Dict[str, Any]:
+    """Campos desnormalizados del documento de la conversación que se actualizan con cada mensaje."""
+    return {"updated_at": _firestore().SERVER_TIMESTAMP, "message_count": _firestore().Increment(1)}
+
+# Las conversaciones creadas antes de existir message_count no tienen un
+# recuento fiable: el primer Increment crea el campo contando desde 0. Al
+# listarlas se recalcula en segundo plano y se marcan con message_count_exact.
+_backfill_tasks: Dict[Tuple[str, str], asyncio.Task] = {}
+
+def _schedule_message_count_backfill(user_id: str, convo_id: str):
+    key = (user_id, convo_id)
+    if key not in _backfill_tasks:
+        _backfill_tasks[key] = asyncio.create_task(_backfill_message_count(user_id, convo_id))
+
+async def _backfill_message_count(user_id: str, convo_id: str):
+    """Recalcula message_count de una conversación antigua con una consulta de agregación."""
+    convo_ref = get_db().collection('users').document(user_id).collection('conversations').document(convo_id)
+
+    @_firestore().async_transactional
+    async def _update(transaction):
+        # Leer el documento en la transacción bloquea los batches de mensajes
+        # (que también lo actualizan) hasta confirmar el recuento.
+        snapshot = await convo_ref.get(field_paths=["message_count_exact"], transaction=transaction)
+        if not snapshot.exists or (snapshot.to_dict() or {}).get("message_count_exact"):
+            return
+        result = await convo_ref.collection('messages').count().get()
+        transaction.set(convo_ref, {"message_count": result[0][0].value, "message_count_exact": True}, merge=True)
+
+    try:
+        await _update(get_db().transaction())
+    except Exception as e:
+        log.warning(f"No se pudo recalcular el número de mensajes de la convo {convo_id} del usuario {user_id}: {e}")
+    finally:
+        _backfill_tasks.pop((user_id, convo_id), None)
+
+def new_message_id() -> str:
+    """Genera el ID de un mensaje antes de escribirlo, para poder referenciarlo de antemano."""
+    return uuid.uuid4().hex
+
+@_uses_db
+async def get_conversation_summary(user_id: str, convo_id: str) -> Tuple[Optional[str], int]:
+    """Obtiene el resumen acumulado de la conversación y cuántos mensajes iniciales cubre."""
+    try:
+        convo_ref = get_db().collection('users').document(user_id).collection('conversations').document(convo_id)
+        snapshot = await convo_ref.get(field_paths=["history_summary", "history_summary_upto"])
+        data = snapshot.to_dict() or {}
+        return data.get("history_summary"), int(data.get("history_summary_upto", 0))
+    except Exception as e:
+        log.error(f"Error al obtener el resumen de la convo {convo_id} del usuario {user_id}: {e}")
+        return None, 0
+
+@_uses_db
+async def update_conversation_summary(user_id: str, convo_id: str, summary: str, upto: int):
+    """Guarda el resumen acumulado de los primeros `upto` mensajes de la conversación."""
     try:
-        message_data = message.model_dump()
-        message_data["timestamp"] = firestore.SERVER_TIMESTAMP
-        await db.collection('users').document(user_id).collection('conversations').document(convo_id).collection('messages').add(message_data)
+        convo_ref = get_db().collection('users').document(user_id).collection('conversations').document(convo_id)
+        await convo_ref.update({"history_summary": summary, "history_summary_upto": upto})
     except Exception as e:
-        log.error(f"Error al añadir mensaje a la convo {convo_id} del usuario {user_id}: {e}")
+        log.error(f"Error al guardar el resumen de la convo {convo_id} del usuario {user_id}: {e}")
 
+@_uses_db
 async def create_new_conversation(user_id: str, title: str) -> Dict[str, Any]:
     """Crea una nueva conversación y devuelve su ID y título."""
     try:
-        doc_ref = db.collection('users').document(user_id).collection('conversations').document()
+        doc_ref = get_db().collection('users').document(user_id).collection('conversations').document()
         await doc_ref.set({
             "title": title,
-            "created_at": firestore.SERVER_TIMESTAMP
+            "created_at": _firestore().SERVER_TIMESTAMP,
+            "updated_at": _firestore().SERVER_TIMESTAMP,
+            "message_count": 0,
+            "message_count_exact": True,
         })
         return {"id": doc_ref.id, "title": title}
     except Exception as e:
         log.error(f"Error al crear nueva conversación para el usuario {user_id}: {e}")
         return {}
 
-async def delete_conversation(user_id: str, convo_id: str):
-    """Elimina una conversación y todos sus mensajes de forma recursiva."""
+def _deletion_job_ref(user_id: str, convo_id: str):
+    # Colección de primer nivel para poder reanudar los trabajos pendientes con
+    # una sola consulta por 'status' al arrancar.
+    return get_db().collection('conversation_deletions').document(f"{user_id}__{convo_id}")
+
+async def _delete_conversation_documents(user_id: str, convo_id: str, job_ref=None) -> int:
+    """
+    Elimina los mensajes de una conversación en batches de DELETE_BATCH_SIZE,
+    confirmando hasta DELETE_PARALLELISM batches a la vez, y después el propio
+    documento. Es idempotente: si se interrumpe, puede volver a ejecutarse.
+    Devuelve el número de mensajes eliminados.
+    """
+    convo_ref = get_db().collection('users').document(user_id).collection('conversations').document(convo_id)
+    # Firestore no tiene un 'delete recursivo' nativo en el SDK de servidor,
+    # así que eliminamos los mensajes primero. Solo se leen los IDs (select vacío).
+    messages_query = convo_ref.collection('messages').select([]).limit(settings.DELETE_BATCH_SIZE * settings.DELETE_PARALLELISM)
+    deleted = 0
+    while True:
+        refs = [doc.reference async for doc in messages_query.stream()]
+        if not refs:
+            break
+
+        async def _commit(chunk):
+            batch = get_db().batch()
+            for ref in chunk:
+                batch.delete(ref)
+            await batch.commit()
+
+        chunks = [refs[i:i + settings.DELETE_BATCH_SIZE] for i in range(0, len(refs), settings.DELETE_BATCH_SIZE)]
+        await asyncio.gather(*(_commit(chunk) for chunk in chunks))
+        deleted += len(refs)
+        if job_ref is not None:
+            await job_ref.set({"deleted_messages": deleted, "updated_at": _firestore().SERVER_TIMESTAMP}, merge=True)
+
+    await convo_ref.delete()
+    return deleted
+
+# --- ELIMINACIÓN EN SEGUNDO PLANO ---
+# DELETE /conversations/{id} responde de inmediato (202) y el borrado se hace en
+# un trabajo cuyo estado se guarda en 'conversation_deletions', de modo que se
+# puede consultar y, si el proceso se reinicia a mitad, reanudar al arrancar.
+
+_deletion_tasks: Dict[Tuple[str, str], asyncio.Task] = {}
+# Conversaciones eliminadas (o en eliminación) en este worker. enqueue_message
+# descarta sus mensajes: una respuesta que termina después del borrado no debe
+# volver a crear la conversación. Los IDs no se reutilizan, así que basta con
+# recordar las más recientes.
+_deleted_conversations: Dict[Tuple[str, str], None] = {}
+MAX_DELETED_CONVERSATIONS = 10000
+
+def _mark_deleted(user_id: str, convo_id: str):
+    _deleted_conversations[(user_id, convo_id)] = None
+    while len(_deleted_conversations) > MAX_DELETED_CONVERSATIONS:
+        del _deleted_conversations[next(iter(_deleted_conversations))]
+
+@_uses_db
+async def _run_deletion_job(user_id: str, convo_id: str):
+    job_ref = _deletion_job_ref(user_id, convo_id)
     try:
-        convo_ref = db.collection('users').document(user_id).collection('conversations').document(convo_id)
-        # Firestore no tiene un 'delete recursivo' nativo en el SDK de servidor, 
-        # así que eliminamos los mensajes primero.
-        messages_ref = convo_ref.collection('messages')
-        async for msg_doc in messages_ref.stream():
-            await msg_doc.reference.delete()
-        
-        await convo_ref.delete()
-        log.info(f"Conversación {convo_id} del usuario {user_id} eliminada correctamente.")
+        # Un batch ya en curso podría escribir en la conversación después de listar sus mensajes.
+        await _wait_for_in_flight(user_id, convo_id)
+        deleted = await _delete_conversation_documents(user_id, convo_id, job_ref)
+        await job_ref.set({"status": "done", "updated_at": _firestore().SERVER_TIMESTAMP}, merge=True)
+        log.info(f"Conversación {convo_id} del usuario {user_id} eliminada correctamente ({deleted} mensajes).")
     except Exception as e:
         log.error(f"Error al eliminar la conversación {convo_id} del usuario {user_id}: {e}")
+        try:
+            await job_ref.set({"status": "failed", "error": str(e), "updated_at": _firestore().SERVER_TIMESTAMP}, merge=True)
+        except Exception:
+            pass
+    finally:
+        _deletion_tasks.pop((user_id, convo_id), None)
+
+def _launch_deletion_job(user_id: str, convo_id: str):
+    key = (user_id, convo_id)
+    _mark_deleted(user_id, convo_id)
+    if key not in _deletion_tasks:
+        _deletion_tasks[key] = asyncio.create_task(_run_deletion_job(user_id, convo_id))
+
+@_uses_db
+async def start_conversation_deletion(user_id: str, convo_id: str) -> Dict[str, Any]:
+    """
+    Registra el trabajo de eliminación, oculta la conversación del listado y
+    lanza el borrado en segundo plano. Devuelve el estado inicial del trabajo.
+    """
+    _mark_deleted(user_id, convo_id)
+    discard_pending_messages(user_id, convo_id)
+    convo_ref = get_db().collection('users').document(user_id).collection('conversations').document(convo_id)
+    await _deletion_job_ref(user_id, convo_id).set({
+        "user_id": user_id,
+        "convo_id": convo_id,
+        "status": "running",
+        "deleted_messages": 0,
+        "created_at": _firestore().SERVER_TIMESTAMP,
+        "updated_at": _firestore().SERVER_TIMESTAMP,
+    })
+    await convo_ref.set({"deleting": True}, merge=True)
+    _launch_deletion_job(user_id, convo_id)
+    return {"id": convo_id, "status": "running", "deleted_messages": 0}
+
+@_uses_db
+async def get_deletion_status(user_id: str, convo_id: str) -> Optional[Dict[str, Any]]:
+    """Estado del trabajo de eliminación de una conversación, o None si no existe."""
+    try:
+        snapshot = await _deletion_job_ref(user_id, convo_id).get()
+        if not snapshot.exists:
+            return None
+        data = snapshot.to_dict()
+        status = {"id": convo_id, "status": data.get("status"), "deleted_messages": data.get("deleted_messages", 0)}
+        if data.get("error"):
+            status["error"] = data["error"]
+        return status
+    except Exception as e:
+        log.error(f"Error al obtener el estado de eliminación de la convo {convo_id}: {e}")
+        return None
+
+@_uses_db
+async def resume_deletion_jobs():
+    """Relanza los trabajos de eliminación que quedaron a medias. Se llama al arrancar."""
+    try:
+        query = get_db().collection('conversation_deletions').where(filter=_firestore().FieldFilter("status", "==", "running"))
+        resumed = 0
+        async for job in query.stream():
+            data = job.to_dict()
+            _launch_deletion_job(data["user_id"], data["convo_id"])
+            resumed += 1
+        if resumed:
+            log.info(f"Reanudados {resumed} trabajos de eliminación de conversaciones.")
+    except Exception as e:
+        log.error(f"Error al reanudar los trabajos de eliminación: {e}")
 
+@_uses_db
 async def update_conversation_title(user_id: str, convo_id: str, new_title: str):
     """Actualiza el título de una conversación específica."""
     try:
-        convo_ref = db.collection('users').document(user_id).collection('conversations').document(convo_id)
+        convo_ref = get_db().collection('users').document(user_id).collection('conversations').document(convo_id)
         await convo_ref.update({"title": new_title})
         log.info(f"Título de la conversación {convo_id} actualizado a '{new_title}'.")
     except Exception as e:
         log.error(f"Error al actualizar el título de la convo {convo_id}: {e}")
+
+# --- PERSISTENCIA EN SEGUNDO PLANO (WRITE-BEHIND) ---
+# enqueue_message() encola el mensaje y vuelve de inmediato; un único worker lo
+# escribe con batch writes de Firestore, agrupando varias conversaciones.
+# Cada batch lleva como mucho un mensaje por conversación y los batches se
+# confirman uno tras otro, así el SERVER_TIMESTAMP respeta el orden de llegada
+# dentro de cada conversación.
+
+class _PendingWrite(NamedTuple):
+    user_id: str
+    convo_id: str
+    message_id: str
+    data: Dict[str, Any]
+    enqueued_at: float
+
+_pending: Deque[_PendingWrite] = deque()
+_in_flight: List[_PendingWrite] = []  # Batch que se está confirmando
+_in_flight_done: Optional[asyncio.Event] = None
+_wakeup: Optional[asyncio.Event] = None
+_worker_task: Optional[asyncio.Task] = None
+_stopping = False
+_persist_stats = {
+    "enqueued": 0, "written": 0, "failed": 0, "batches": 0, "retries": 0,
+    "flush_latency_last": 0.0, "flush_latency_max": 0.0, "flush_latency_sum": 0.0,
+}
+
+def enqueue_message(user_id: str, convo_id: str, message: ChatMessage, message_id: Optional[str] = None) -> str:
+    """
+    Encola un mensaje para escribirlo en segundo plano y devuelve su ID.
+    No bloquea: el worker de persistencia lo escribirá en el siguiente batch.
+    Los mensajes de una conversación eliminada se descartan.
+    """
+    if _worker_task is None or _worker_task.done():
+        start_persistence_worker()
+    message_id = message_id or new_message_id()
+    if (user_id, convo_id) in _deleted_conversations:
+        log.info(f"Mensaje para la convo {convo_id}, ya eliminada, descartado.")
+        return message_id
+    message_data = message.model_dump()
+    _pending.append(_PendingWrite(user_id, convo_id, message_id, message_data, time.monotonic()))
+    _persist_stats["enqueued"] += 1
+    _wakeup.set()
+    return message_id
+
+def _next_batch() -> List[_PendingWrite]:
+    """Saca de la cola hasta PERSIST_BATCH_SIZE escrituras, como mucho una por conversación."""
+    batch: List[_PendingWrite] = []
+    deferred: List[_PendingWrite] = []
+    seen: Set[Tuple[str, str]] = set()
+    while _pending and len(batch) < settings.PERSIST_BATCH_SIZE:
+        item = _pending.popleft()
+        key = (item.user_id, item.convo_id)
+        if key in seen:
+            deferred.append(item)
+        else:
+            seen.add(key)
+            batch.append(item)
+    # Los aplazados vuelven al frente de la cola en su orden original.
+    _pending.extendleft(reversed(deferred))
+    return batch
+
+@_uses_db
+async def _commit_batch(items: List[_PendingWrite]):
+    for attempt in range(settings.PERSIST_MAX_RETRIES + 1):
+        try:
+            batch = get_db().batch()
+            for item in items:
+                convo_ref = get_db().collection('users').document(item.user_id).collection('conversations').document(item.convo_id)
+                # El timestamp se fija al confirmar: encolar no necesita importar la librería.
+                batch.set(convo_ref.collection('messages').document(item.message_id), {**item.data, "timestamp": _firestore().SERVER_TIMESTAMP})
+                batch.set(convo_ref, _conversation_activity_update(), merge=True)
+            with metrics.FIRESTORE_COMMIT_SECONDS.time():
+                await batch.commit()
+            break
+        except Exception as e:
+            if attempt == settings.PERSIST_MAX_RETRIES:
+                _persist_stats["failed"] += len(items)
+                log.error(f"No se pudieron persistir {len(items)} mensajes tras {attempt + 1} intentos: {e}")
+                return
+            _persist_stats["retries"] += 1
+            delay = settings.PERSIST_RETRY_BACKOFF * 2 ** attempt
+            log.warning(f"Error al persistir un batch de {len(items)} mensajes, reintento en {delay:.1f}s: {e}")
+            await asyncio.sleep(delay)
+
+    now = time.monotonic()
+    _persist_stats["written"] += len(items)
+    _persist_stats["batches"] += 1
+    for item in items:
+        latency = now - item.enqueued_at
+        metrics.MESSAGE_PERSIST_SECONDS.observe(latency)
+        _persist_stats["flush_latency_last"] = latency
+        _persist_stats["flush_latency_max"] = max(_persist_stats["flush_latency_max"], latency)
+        _persist_stats["flush_latency_sum"] += latency
+
+async def _persistence_worker():
+    global _in_flight_done
+    while True:
+        if not _pending:
+            if _stopping:
+                return
+            await _wakeup.wait()
+            _wakeup.clear()
+            if not _stopping:
+                # Breve espera para agrupar las escrituras que llegan juntas.
+                await asyncio.sleep(settings.PERSIST_LINGER)
+        while _pending:
+            _in_flight[:] = _next_batch()
+            _in_flight_done = asyncio.Event()
+            try:
+                await _commit_batch(_in_flight)
+            finally:
+                _in_flight.clear()
+                _in_flight_done.set()
+
+def start_persistence_worker():
+    """Arranca el worker de persistencia. Se llama desde el lifespan de la aplicación."""
+    global _wakeup, _worker_task, _stopping
+    if _worker_task is not None and not _worker_task.done():
+        return
+    _stopping = False
+    _wakeup = asyncio.Event()
+    _worker_task = asyncio.create_task(_persistence_worker())
+    if _pending:
+        _wakeup.set()
+
+async def stop_persistence_worker():
+    """Vacía la cola pendiente (hasta PERSIST_SHUTDOWN_TIMEOUT) y detiene el worker."""
+    global _stopping, _worker_task
+    if _worker_task is None:
+        return
+    _stopping = True
+    _wakeup.set()
+    try:
+        await asyncio.wait_for(_worker_task, timeout=settings.PERSIST_SHUTDOWN_TIMEOUT)
+    except asyncio.TimeoutError:
+        log.error(f"Apagado con {len(_pending)} mensajes sin persistir.")
+        _worker_task.cancel()
+    _worker_task = None
+
+def _unwritten_messages(user_id: str, convo_id: str) -> List[_PendingWrite]:
+    """Escrituras de la conversación encoladas o en curso, en orden de llegada."""
+    return [item for item in (*_in_flight, *_pending) if (item.user_id, item.convo_id) == (user_id, convo_id)]
+
+async def _wait_for_in_flight(user_id: str, convo_id: str):
+    """Espera a que se confirme el batch en curso si lleva algún mensaje de la conversación."""
+    if _in_flight_done is not None and any((item.user_id, item.convo_id) == (user_id, convo_id) for item in _in_flight):
+        await _in_flight_done.wait()
+
+def discard_pending_messages(user_id: str, convo_id: str):
+    """Descarta las escrituras pendientes de una conversación que se va a eliminar."""
+    remaining = [item for item in _pending if (item.user_id, item.convo_id) != (user_id, convo_id)]
+    if len(remaining) != len(_pending):
+        _pending.clear()
+        _pending.extend(remaining)
+
+def persistence_stats() -> Dict[str, float]:
+    """Profundidad de la cola y latencia de escritura (desde que se encola hasta el commit)."""
+    written = _persist_stats["written"]
+    return {
+        **_persist_stats,
+        "queue_depth": len(_pending),
+        "flush_latency_avg": _persist_stats["flush_latency_sum"] / written if written else 0.0,
+    }
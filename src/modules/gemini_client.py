@@ -1,64 +1,268 @@
 # src/modules/gemini_client.py
 
-import vertexai
 import asyncio # <--- IMPORTANTE: Asegúrate de que asyncio está importado
-from vertexai.generative_models import GenerativeModel, Content, Part, GenerationConfig
-from typing import List, AsyncGenerator
+import datetime
+import threading
+import time
+from typing import TYPE_CHECKING, Any, Dict, List, AsyncGenerator, Optional, Tuple
 from src.config import settings, log
 from src.models.chat_models import ChatMessage
+from src.core.prompts import PIDA_SYSTEM_PROMPT, HISTORY_SUMMARY_PROMPT
+
+if TYPE_CHECKING:
+    from vertexai.generative_models import Content, GenerativeModel
+
+# Estimación de tokens sin llamar a la API (aprox. 4 caracteres por token).
+CHARS_PER_TOKEN = 4
 
 # --- INICIALIZACIÓN DEL CLIENTE Y MODELO ---
-try:
-    vertexai.init(project=settings.GOOGLE_CLOUD_PROJECT, location=settings.GOOGLE_CLOUD_LOCATION)
+# El SDK de Vertex AI tarda segundos en importarse. Se carga en el primer uso
+# (o en el calentamiento del lifespan), no al importar este módulo, para que un
+# arranque en frío pueda responder a /status sin esperar por él.
+# El prompt de sistema va como system_instruction del modelo de chat, no pegado
+# a cada mensaje del usuario. Los resúmenes usan un modelo aparte, sin él.
+model: Optional["GenerativeModel"] = None
+summary_model: Optional["GenerativeModel"] = None
+generation_config = None
+summary_generation_config = None
+_init_lock = threading.Lock()
+
+def get_model() -> Optional["GenerativeModel"]:
+    """
+    Inicializa Vertex AI y los modelos en la primera llamada y devuelve el de chat.
+    Devuelve None si la inicialización falla; se reintenta en la siguiente llamada.
+    Es bloqueante: desde el event loop se usa get_model_async.
+    """
+    if model is not None:
+        return model
+    with _init_lock:
+        return _init_model()
+
+async def get_model_async() -> Optional["GenerativeModel"]:
+    """get_model sin bloquear el event loop: la primera inicialización se hace en un hilo."""
+    if model is not None:
+        return model
+    return await asyncio.to_thread(get_model)
+
+def _init_model() -> Optional["GenerativeModel"]:
+    global model, summary_model, generation_config, summary_generation_config
+    if model is not None:
+        return model
+    try:
+        import vertexai
+        from vertexai.generative_models import GenerativeModel, GenerationConfig
+
+        vertexai.init(project=settings.GOOGLE_CLOUD_PROJECT, location=settings.GOOGLE_CLOUD_LOCATION)
+
+        generation_config = GenerationConfig(
+            max_output_tokens=settings.MAX_OUTPUT_TOKENS,
+            temperature=settings.TEMPERATURE,
+            top_p=settings.TOP_P,
+        )
+
+        summary_generation_config = GenerationConfig(
+            max_output_tokens=settings.HISTORY_SUMMARY_MAX_OUTPUT_TOKENS,
+            temperature=0.2,
+        )
+
+        summary_model = GenerativeModel(settings.GEMINI_MODEL)
+        model = GenerativeModel(settings.GEMINI_MODEL, system_instruction=PIDA_SYSTEM_PROMPT)
+        log.info(f"Cliente de Vertex AI inicializado y modelo '{settings.GEMINI_MODEL}' cargado.")
+
+    except Exception as e:
+        log.critical(f"No se pudo inicializar Vertex AI o cargar el modelo: {e}", exc_info=True)
+        model = None
+    return model
+
+# --- CACHÉ DE CONTEXTO (OPCIONAL) ---
+# Con GEMINI_CONTEXT_CACHE_ENABLED, el prompt de sistema se guarda una vez como
+# CachedContent de Vertex AI y los turnos usan un modelo creado a partir de él:
+# esos tokens no se vuelven a procesar (ni a facturar a precio completo) en
+# cada turno. La caché se renueva antes de caducar, en segundo plano; mientras
+# no está lista, o si Vertex la rechaza (p. ej. por no llegar al mínimo de
+# tokens), se usa el modelo normal con system_instruction.
+
+_cached_content = None
+_cached_model: Optional["GenerativeModel"] = None
+_cache_expires_at = 0.0       # time.monotonic() en que caduca _cached_content
+_cache_retry_at = 0.0         # No se reintenta crearla antes de este instante
+_cache_task: Optional[asyncio.Task] = None
+_stats = {
+    "turns": 0, "cached_turns": 0, "input_tokens_saved": 0,
+    "cache_creations": 0, "cache_refreshes": 0, "cache_failures": 0,
+}
+
+def _cache_ttl() -> datetime.timedelta:
+    return datetime.timedelta(seconds=settings.GEMINI_CONTEXT_CACHE_TTL)
+
+def _refresh_cached_content() -> Tuple[Any, "GenerativeModel", bool]:
+    """
+    Prolonga la caché existente o crea una nueva (llamada bloqueante al API).
+    Devuelve la caché, el modelo asociado y si se ha creado de nuevo.
+    """
+    from vertexai.preview import caching
+    from vertexai.preview.generative_models import GenerativeModel as PreviewGenerativeModel
+
+    if _cached_content is not None and _cached_model is not None:
+        try:
+            _cached_content.update(ttl=_cache_ttl())
+            return _cached_content, _cached_model, False
+        except Exception as e:
+            log.warning(f"No se pudo prolongar la caché de contexto de Gemini; se creará otra: {e}")
 
-    generation_config = GenerationConfig(
-        max_output_tokens=settings.MAX_OUTPUT_TOKENS,
-        temperature=settings.TEMPERATURE,
-        top_p=settings.TOP_P,
+    cached_content = caching.CachedContent.create(
+        model_name=settings.GEMINI_MODEL,
+        system_instruction=PIDA_SYSTEM_PROMPT,
+        ttl=_cache_ttl(),
+        display_name="pida-system-prompt",
     )
+    return cached_content, PreviewGenerativeModel.from_cached_content(cached_content=cached_content), True
 
-    model = GenerativeModel(settings.GEMINI_MODEL)
-    log.info(f"Cliente de Vertex AI inicializado y modelo '{settings.GEMINI_MODEL}' cargado.")
+async def refresh_context_cache():
+    """Crea o renueva la caché de contexto. Ante un error la desactiva hasta GEMINI_CONTEXT_CACHE_RETRY."""
+    global _cached_content, _cached_model, _cache_expires_at, _cache_retry_at
+    if not settings.GEMINI_CONTEXT_CACHE_ENABLED or await get_model_async() is None:
+        return
+    try:
+        cached_content, cached_model, created = await asyncio.to_thread(_refresh_cached_content)
+    except Exception as e:
+        _stats["cache_failures"] += 1
+        _cache_retry_at = time.monotonic() + settings.GEMINI_CONTEXT_CACHE_RETRY
+        log.error(f"No se pudo crear la caché de contexto de Gemini; se usa system_instruction: {e}")
+        return
+    _cached_content, _cached_model = cached_content, cached_model
+    _cache_expires_at = time.monotonic() + settings.GEMINI_CONTEXT_CACHE_TTL
+    _stats["cache_creations" if created else "cache_refreshes"] += 1
+    log.info(f"Caché de contexto de Gemini {'creada' if created else 'renovada'}: {getattr(cached_content, 'name', '?')}.")
+
+def _schedule_cache_refresh():
+    global _cache_task
+    if _cache_task is not None and not _cache_task.done():
+        return
+    if time.monotonic() < _cache_retry_at:
+        return
+    _cache_task = asyncio.create_task(refresh_context_cache())
+
+async def _chat_model() -> Tuple[Optional["GenerativeModel"], bool]:
+    """Modelo para el turno y si usa la caché de contexto. Programa la renovación cuando toca."""
+    base = await get_model_async()
+    if base is None or not settings.GEMINI_CONTEXT_CACHE_ENABLED:
+        return base, False
+    now = time.monotonic()
+    if _cached_model is None or now >= _cache_expires_at - settings.GEMINI_CONTEXT_CACHE_REFRESH_MARGIN:
+        _schedule_cache_refresh()
+    if _cached_model is not None and now < _cache_expires_at:
+        return _cached_model, True
+    return base, False
+
+def _record_turn(cached: bool, usage_metadata: Any):
+    """Cuenta los tokens de entrada servidos desde la caché de contexto en el turno."""
+    _stats["turns"] += 1
+    if not cached:
+        return
+    # Vertex informa de los tokens servidos desde la caché en el último chunk;
+    # si no lo hace, se usa la estimación local del prompt de sistema.
+    saved = getattr(usage_metadata, "cached_content_token_count", 0) or estimate_tokens(PIDA_SYSTEM_PROMPT)
+    _stats["cached_turns"] += 1
+    _stats["input_tokens_saved"] += saved
+    log.info(f"Gemini: ~{saved} tokens de entrada servidos desde la caché de contexto.")
 
-except Exception as e:
-    log.critical(f"No se pudo inicializar Vertex AI o cargar el modelo: {e}", exc_info=True)
-    model = None
+def stats() -> Dict[str, Any]:
+    return {
+        **_stats,
+        "system_prompt_tokens": estimate_tokens(PIDA_SYSTEM_PROMPT),
+        "context_cache_enabled": settings.GEMINI_CONTEXT_CACHE_ENABLED,
+        "context_cache_active": _cached_model is not None and time.monotonic() < _cache_expires_at,
+        "context_cache_ttl_remaining": round(max(0.0, _cache_expires_at - time.monotonic()), 1),
+    }
 
 # --- FUNCIONES AUXILIARES ---
 
-def prepare_history_for_vertex(history: List[ChatMessage]) -> List[Content]:
+def message_to_vertex(message: ChatMessage) -> "Content":
+    """Convierte un único mensaje al formato que espera la API de Gemini."""
+    from vertexai.generative_models import Content, Part
+    role = 'user' if message.role == 'user' else 'model'
+    return Content(role=role, parts=[Part.from_text(message.content)])
+
+def prepare_history_for_vertex(history: List[ChatMessage]) -> List["Content"]:
     """Convierte nuestro historial de Pydantic al formato que espera la API de Gemini."""
-    vertex_history = []
-    for message in history:
-        role = 'user' if message.role == 'user' else 'model'
-        vertex_history.append(Content(role=role, parts=[Part.from_text(message.content)]))
-    return vertex_history
+    return [message_to_vertex(message) for message in history]
+
+def estimate_tokens(text: str) -> int:
+    """Estimación rápida y local del número de tokens de un texto."""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+async def summarize_history(previous_summary: Optional[str], messages: List[ChatMessage]) -> Optional[str]:
+    """
+    Resume los mensajes indicados, integrando el resumen anterior si lo hay.
+    Devuelve None si el modelo no está disponible o la llamada falla.
+    """
+    if await get_model_async() is None or summary_model is None or not messages:
+        return None
+
+    parts = [HISTORY_SUMMARY_PROMPT]
+    if previous_summary:
+        parts.append(f"Resumen anterior:\n{previous_summary}")
+    transcript = "\n\n".join(
+        f"{'Usuario' if m.role == 'user' else 'Asistente'}: {m.content}" for m in messages
+    )
+    parts.append(f"Conversación a resumir:\n{transcript}")
+
+    try:
+        response = await summary_model.generate_content_async(
+            "\n\n---\n\n".join(parts),
+            generation_config=summary_generation_config,
+        )
+        return response.text.strip() or None
+    except Exception as e:
+        log.error(f"Error al resumir el historial con Gemini: {e}", exc_info=True)
+        return None
 
-async def generate_streaming_response(system_prompt: str, prompt: str, history: List[Content]) -> AsyncGenerator[str, None]:
+async def generate_streaming_response(prompt: str, history: List["Content"]) -> AsyncGenerator[str, None]:
     """
-    Genera una respuesta del modelo Gemini en modo streaming, asegurando que no se
-    bloquee el event loop de asyncio.
+    Genera una respuesta del modelo Gemini en modo streaming con la API
+    asíncrona del SDK, sin bloquear el event loop mientras se espera cada chunk.
+    El ritmo lo marca el consumidor: no se pide el siguiente chunk hasta que se
+    ha entregado el anterior. Si el cliente se desconecta, la tarea se cancela
+    y se cierra el stream para dejar de generar (y pagar) tokens.
+    El prompt de sistema no viaja en el mensaje: lo aporta el modelo
+    (system_instruction o caché de contexto).
     """
+    model, cached = await _chat_model()
     if not model:
         log.error("El modelo Gemini no está disponible.")
         yield "Error: El modelo de IA no está configurado correctamente."
         return
 
+    response_stream = None
+    started = time.perf_counter()
+    first_token_at = None
+    usage_metadata = None
     try:
-        chat = model.start_chat(history=history)
-        full_prompt = f"{system_prompt}\n\n---\n\n{prompt}"
-        
-        response_stream = chat.send_message(full_prompt, stream=True, generation_config=generation_config)
+        # Copia de la lista: ChatSession añade los turnos nuevos al historial que recibe.
+        chat = model.start_chat(history=list(history))
+        response_stream = await chat.send_message_async(prompt, stream=True, generation_config=generation_config)
 
-        # Iteramos sobre el generador síncrono
-        for chunk in response_stream:
+        async for chunk in response_stream:
+            usage_metadata = getattr(chunk, "usage_metadata", None) or usage_metadata
             if chunk.text:
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                    log.info(f"Gemini: primer token en {first_token_at - started:.3f}s.")
                 yield chunk.text
-                # --- LA LÍNEA CLAVE DE LA SOLUCIÓN ---
-                # Cedemos el control al event loop para que pueda enviar el chunk
-                # antes de procesar el siguiente.
-                await asyncio.sleep(0)
+        _record_turn(cached, usage_metadata)
 
+    except asyncio.CancelledError:
+        log.warning(f"Streaming de Gemini cancelado (cliente desconectado) tras {time.perf_counter() - started:.3f}s.")
+        raise
     except Exception as e:
         log.error(f"Error al generar la respuesta en streaming desde Gemini: {e}", exc_info=True)
         yield "Hubo un problema al contactar al servicio de IA."
+    finally:
+        # Cierra el stream subyacente si se abandona antes de terminar.
+        aclose = getattr(response_stream, "aclose", None)
+        if aclose is not None:
+            try:
+                await aclose()
+            except Exception:
+                pass
@@ -0,0 +1,196 @@
+# src/modules/history_cache.py
+
+import asyncio
+import time
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Dict, List, Optional, Set, Tuple
+from src.config import settings, log
+from src.models.chat_models import ChatMessage
+from src.modules import firestore_client, gemini_client
+
+if TYPE_CHECKING:
+    from vertexai.generative_models import Content
+
+# Caché por conversación del historial ya convertido al formato de Vertex.
+# Evita releer toda la subcolección 'messages' y reconstruir cada Content en
+# cada turno: los mensajes nuevos se escriben en Firestore y se añaden aquí
+# (write-through), de modo que la lista de Content crece de forma incremental.
+# La memoria está acotada por número de conversaciones (LRU) y cada entrada
+# caduca tras HISTORY_CACHE_TTL, por si otro worker escribió en la conversación.
+#
+# Ventana del historial: solo se envían literalmente los turnos más recientes
+# que caben en HISTORY_TOKEN_BUDGET; los anteriores se sustituyen por un
+# resumen acumulado que se guarda en el documento de la conversación, de modo
+# que cada tramo se resume una sola vez. Hasta que el resumen cubre un tramo,
+# ese tramo se sigue enviando literal.
+
+SUMMARY_ACK = "Entendido. Tendré en cuenta ese contexto en mis próximas respuestas."
+
+class _HistoryEntry:
+    __slots__ = ("messages", "contents", "tokens", "summary", "summary_upto", "loaded_at")
+
+    def __init__(self, messages: List[ChatMessage], summary: Optional[str], summary_upto: int):
+        self.messages = messages
+        self.contents = gemini_client.prepare_history_for_vertex(messages)
+        self.tokens = [gemini_client.estimate_tokens(m.content) for m in messages]
+        self.summary = summary
+        self.summary_upto = summary_upto if summary else 0
+        self.loaded_at = time.monotonic()
+
+    def is_expired(self) -> bool:
+        return time.monotonic() - self.loaded_at > settings.HISTORY_CACHE_TTL
+
+    def append(self, message: ChatMessage):
+        self.messages.append(message)
+        self.contents.append(gemini_client.message_to_vertex(message))
+        self.tokens.append(gemini_client.estimate_tokens(message.content))
+
+_entries: "OrderedDict[Tuple[str, str], _HistoryEntry]" = OrderedDict()
+_summary_tasks: Dict[Tuple[str, str], asyncio.Task] = {}
+_stats = {"hits": 0, "misses": 0, "evictions": 0, "windowed_turns": 0, "input_tokens_saved": 0, "summaries": 0}
+
+def _put(key: Tuple[str, str], entry: _HistoryEntry):
+    _entries[key] = entry
+    _entries.move_to_end(key)
+    while len(_entries) > settings.HISTORY_CACHE_MAX_CONVERSATIONS:
+        _entries.popitem(last=False)
+        _stats["evictions"] += 1
+
+async def _get_entry(user_id: str, convo_id: str, exclude_ids: Optional[Set[str]] = None) -> _HistoryEntry:
+    key = (user_id, convo_id)
+    entry = _entries.get(key)
+    if entry is not None and not entry.is_expired():
+        _entries.move_to_end(key)
+        _stats["hits"] += 1
+        return entry
+
+    _stats["misses"] += 1
+    # El SDK de Vertex (para convertir los mensajes) se carga en un hilo si el calentamiento no terminó.
+    messages, (summary, summary_upto), _ = await asyncio.gather(
+        firestore_client.get_conversation_messages(user_id, convo_id, exclude_ids),
+        firestore_client.get_conversation_summary(user_id, convo_id),
+        gemini_client.get_model_async(),
+    )
+    entry = _HistoryEntry(messages, summary, summary_upto)
+    # get_conversation_messages devuelve [] también ante un error de lectura:
+    # no fijamos en caché un historial vacío que podría no serlo.
+    if messages:
+        _put(key, entry)
+    return entry
+
+# --- VENTANA DEL HISTORIAL ---
+
+def _last_turn_start(entry: _HistoryEntry) -> int:
+    """Índice del último mensaje de usuario: el último intercambio siempre se envía literal."""
+    index = len(entry.messages) - 1
+    while index > 0 and entry.messages[index].role != "user":
+        index -= 1
+    return max(index, 0)
+
+def _turn_start_at_or_before(entry: _HistoryEntry, index: int) -> int:
+    """Último índice <= index que empieza un turno (mensaje de usuario)."""
+    while 0 < index < len(entry.messages) and entry.messages[index].role != "user":
+        index -= 1
+    return index
+
+def _window_start(entry: _HistoryEntry, budget: int) -> int:
+    """
+    Índice del primer mensaje que se envía literal para no superar `budget`
+    tokens. Si el límite cae dentro de un turno se incluye el turno completo,
+    y nunca se deja fuera el último intercambio.
+    """
+    used = 0
+    start = len(entry.messages)
+    while start > 0 and used + entry.tokens[start - 1] <= budget:
+        start -= 1
+        used += entry.tokens[start]
+    return min(_turn_start_at_or_before(entry, start), _last_turn_start(entry))
+
+def _schedule_summary(user_id: str, convo_id: str, entry: _HistoryEntry):
+    """
+    Lanza en segundo plano la actualización del resumen, sin retrasar el turno.
+    Resume hasta dejar la mitad del presupuesto libre, para no tener que volver
+    a resumir en cada uno de los turnos siguientes.
+    """
+    key = (user_id, convo_id)
+    if key in _summary_tasks:
+        return
+    upto = _window_start(entry, settings.HISTORY_TOKEN_BUDGET // 2)
+    if upto <= entry.summary_upto:
+        return
+
+    async def _run():
+        try:
+            summary = await gemini_client.summarize_history(entry.summary, entry.messages[entry.summary_upto:upto])
+            if summary:
+                entry.summary, entry.summary_upto = summary, upto
+                _stats["summaries"] += 1
+                await firestore_client.update_conversation_summary(user_id, convo_id, summary, upto)
+                log.info(f"Resumen del historial de la convo {convo_id} actualizado (cubre {upto} mensajes).")
+        finally:
+            _summary_tasks.pop(key, None)
+
+    _summary_tasks[key] = asyncio.create_task(_run())
+
+def _windowed_contents(user_id: str, convo_id: str, entry: _HistoryEntry) -> List["Content"]:
+    budget = settings.HISTORY_TOKEN_BUDGET
+    total_tokens = sum(entry.tokens)
+    if budget <= 0 or total_tokens <= budget:
+        return list(entry.contents)
+
+    if entry.summary_upto < _window_start(entry, budget):
+        _schedule_summary(user_id, convo_id, entry)
+    # Se envía literal todo lo que el resumen no cubre: mientras se genera el
+    # resumen pendiente el turno puede pasarse del presupuesto, pero no se pierde
+    # nada. Lo que el resumen ya cubre no se repite (salvo el último intercambio).
+    start = min(entry.summary_upto, _last_turn_start(entry))
+
+    contents: List["Content"] = []
+    sent_tokens = sum(entry.tokens[start:])
+    if entry.summary:
+        from vertexai.generative_models import Content, Part
+        contents.append(Content(role="user", parts=[Part.from_text(f"Resumen de la conversación anterior:\n{entry.summary}")]))
+        contents.append(Content(role="model", parts=[Part.from_text(SUMMARY_ACK)]))
+        sent_tokens += gemini_client.estimate_tokens(entry.summary) + gemini_client.estimate_tokens(SUMMARY_ACK)
+    contents.extend(entry.contents[start:])
+
+    saved = max(0, total_tokens - sent_tokens)
+    _stats["windowed_turns"] += 1
+    _stats["input_tokens_saved"] += saved
+    log.info(f"Historial de la convo {convo_id}: ~{sent_tokens} tokens enviados de ~{total_tokens} (ahorro ~{saved}).")
+    return contents
+
+# --- API PÚBLICA ---
+
+async def get_history(user_id: str, convo_id: str, exclude_ids: Optional[Set[str]] = None) -> List["Content"]:
+    """
+    Devuelve el historial de la conversación listo para Gemini, recortado a
+    HISTORY_TOKEN_BUDGET con el resumen acumulado de los turnos anteriores.
+    Es una lista nueva: el llamador puede modificarla sin afectar a la caché.
+    `exclude_ids` se aplica si hay que leer de Firestore (ver get_conversation_messages).
+    """
+    entry = await _get_entry(user_id, convo_id, exclude_ids)
+    return _windowed_contents(user_id, convo_id, entry)
+
+def record_message(user_id: str, convo_id: str, message: ChatMessage):
+    """Añade un mensaje ya persistido a la entrada en caché, si existe."""
+    entry = _entries.get((user_id, convo_id))
+    if entry is not None:
+        entry.append(message)
+
+def append_message(user_id: str, convo_id: str, message: ChatMessage, message_id: Optional[str] = None) -> str:
+    """
+    Encola el mensaje para persistirlo en Firestore y lo añade a la caché
+    (write-through). No espera a la escritura; devuelve el ID del mensaje.
+    """
+    message_id = firestore_client.enqueue_message(user_id, convo_id, message, message_id=message_id)
+    record_message(user_id, convo_id, message)
+    return message_id
+
+def invalidate(user_id: str, convo_id: str):
+    """Descarta el historial en caché de una conversación (p. ej. al eliminarla)."""
+    if _entries.pop((user_id, convo_id), None) is not None:
+        log.info(f"Historial en caché de la convo {convo_id} invalidado.")
+
+def stats() -> Dict[str, int]:
+    return {**_stats, "conversations": len(_entries)}
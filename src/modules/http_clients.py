@@ -0,0 +1,89 @@
+# src/modules/http_clients.py
+
+import httpx
+from typing import Dict
+from src.config import settings, log
+
+# Clientes HTTP compartidos por toda la aplicación, uno por servicio externo.
+# Se crean y se cierran desde el lifespan de FastAPI (ver src/main.py) para
+# reutilizar las conexiones keep-alive entre turnos de chat.
+_clients: Dict[str, httpx.AsyncClient] = {}
+
+def _timeout_profiles() -> Dict[str, httpx.Timeout]:
+    """Perfil de timeout de cada servicio externo."""
+    return {
+        "pse": httpx.Timeout(settings.PSE_SEARCH_TIMEOUT, connect=settings.PSE_CONNECT_TIMEOUT),
+        "rag": httpx.Timeout(settings.RAG_TIMEOUT, connect=settings.RAG_CONNECT_TIMEOUT),
+    }
+
+def _http2_available() -> bool:
+    if not settings.HTTP2_ENABLED:
+        return False
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        log.warning("HTTP2_ENABLED está activo pero el paquete 'h2' no está instalado. Se usará HTTP/1.1.")
+        return False
+
+def _build_client(timeout: httpx.Timeout) -> httpx.AsyncClient:
+    limits = httpx.Limits(
+        max_connections=settings.HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY,
+    )
+    return httpx.AsyncClient(timeout=timeout, limits=limits, http2=_http2_available())
+
+async def startup():
+    """Crea los clientes compartidos. Se llama al arrancar la aplicación."""
+    for name, timeout in _timeout_profiles().items():
+        if name not in _clients:
+            _clients[name] = _build_client(timeout)
+    log.info(f"Clientes HTTP compartidos inicializados: {', '.join(_clients)}.")
+
+async def shutdown():
+    """Cierra los clientes compartidos y sus conexiones abiertas."""
+    for name, client in list(_clients.items()):
+        try:
+            await client.aclose()
+        except Exception as e:
+            log.warning(f"Error al cerrar el cliente HTTP '{name}': {e}")
+    _clients.clear()
+
+def get_client(name: str) -> httpx.AsyncClient:
+    """
+    Devuelve el cliente compartido del servicio indicado. Si se usa fuera del
+    lifespan (por ejemplo, en un script), se crea bajo demanda.
+    """
+    client = _clients.get(name)
+    if client is None or client.is_closed:
+        client = _build_client(_timeout_profiles()[name])
+        _clients[name] = client
+    return client
+
+def get_pse_client() -> httpx.AsyncClient:
+    return get_client("pse")
+
+def get_rag_client() -> httpx.AsyncClient:
+    return get_client("rag")
+
+def pool_stats() -> Dict[str, Dict[str, int]]:
+    """
+    Estadísticas del pool de conexiones de cada cliente: conexiones abiertas,
+    ociosas, en uso y peticiones en espera de una conexión libre.
+    httpx no las expone públicamente, así que se leen del pool de httpcore.
+    """
+    stats = {}
+    for name, client in _clients.items():
+        pool = getattr(getattr(client, "_transport", None), "_pool", None)
+        connections = list(getattr(pool, "connections", []) or [])
+        open_conns = [c for c in connections if not c.is_closed()]
+        idle = sum(1 for c in open_conns if c.is_idle())
+        requests = list(getattr(pool, "_requests", []) or [])
+        stats[name] = {
+            "open": len(open_conns),
+            "idle": idle,
+            "in_use": len(open_conns) - idle,
+            "waiting_requests": sum(1 for r in requests if getattr(r, "connection", None) is None),
+        }
+    return stats
@@ -1,92 +1,259 @@
 # src/modules/pse_client.py
 
+import asyncio
+import time
 import httpx
-import io
-from bs4 import BeautifulSoup
-from pypdf import PdfReader
+from typing import AsyncIterator, List, Tuple
+from urllib.parse import urlparse
 from src.config import settings, log
+from src.core import metrics
+from src.models.context_models import SourceDocument, SourceSearchResult
+from src.modules import http_clients, content_cache, doc_extractor, extraction_pool, query_cache
 
 FETCH_ERROR_MESSAGE = "No se pudo extraer contenido de esta fuente."
 MAX_PDF_PAGES_TO_READ = 10 # <-- NUEVA CONSTANTE DE OPTIMIZACIÓN
+MAX_CHARS_PER_SOURCE = 7000
+SNIFF_BYTES = 512 # Bytes iniciales para identificar contenido sin Content-Type fiable
+
+# Resultados recientes por consulta normalizada; las consultas idénticas simultáneas comparten la llamada.
+_results_cache = query_cache.QueryCache("pse", settings.PSE_RESULT_CACHE_TTL, settings.QUERY_CACHE_MAX_ENTRIES)
 
 async def _fetch_and_parse_url(url: str, client: httpx.AsyncClient) -> str:
     """
     Función auxiliar para descargar y extraer el texto de una URL,
     optimizada para leer solo las primeras páginas de un PDF.
+    El texto extraído se guarda en content_cache; una entrada caducada se
+    revalida con una petición condicional (ETag/Last-Modified).
+    La descarga se hace en streaming y nunca supera PSE_MAX_DOWNLOAD_BYTES
+    (PSE_MAX_HTML_BYTES si es HTML).
     """
     try:
+        cached = await content_cache.lookup(url)
+        if cached is not None and cached.is_fresh():
+            return cached.text
+
         headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'}
+        if cached is not None:
+            headers.update(cached.validators())
         # Aumentamos el timeout general por si la descarga inicial es lenta
-        response = await client.get(url, headers=headers, timeout=20.0, follow_redirects=True)
-        response.raise_for_status()
-        
-        content_type = response.headers.get("content-type", "").lower()
-
-        # Opción 1: El contenido es un PDF (LÓGICA OPTIMIZADA)
-        if "application/pdf" in content_type:
-            log.info(f"Detectado PDF en la URL: {url}. Extrayendo texto de las primeras {MAX_PDF_PAGES_TO_READ} páginas...")
-            pdf_bytes = io.BytesIO(response.content)
-            reader = PdfReader(pdf_bytes)
-            
-            text_content = ""
-            # Leemos solo hasta un máximo de páginas para evitar la lentitud
-            for i, page in enumerate(reader.pages):
-                if i >= MAX_PDF_PAGES_TO_READ:
-                    log.info(f"Límite de {MAX_PDF_PAGES_TO_READ} páginas alcanzado para {url}. Deteniendo lectura.")
-                    break
-                if page.extract_text():
-                    text_content += page.extract_text()
-
-            return text_content.replace("\\n", " ").replace("\n", " ").strip()[:7000]
-
-        # Opción 2: El contenido es HTML
-        elif "text/html" in content_type:
-            log.info(f"Detectado HTML en la URL: {url}. Extrayendo texto...")
-            soup = BeautifulSoup(response.text, 'lxml')
-            paragraphs = [p.get_text() for p in soup.find_all('p')]
-            content = " ".join(paragraphs).replace("\\n", " ").replace("\n", " ").strip()
-            return content[:7000] if content else FETCH_ERROR_MESSAGE
-
-        # Opción 3: Contenido no soportado
+        async with client.stream("GET", url, headers=headers, timeout=settings.PSE_FETCH_TIMEOUT, follow_redirects=True) as response:
+            if cached is not None and response.status_code == 304:
+                await content_cache.mark_revalidated(cached)
+                return cached.text
+            response.raise_for_status()
+
+            # Decidimos con los encabezados, antes de descargar el cuerpo.
+            content_type = response.headers.get("content-type", "").lower()
+            kind = _kind_from_content_type(content_type)
+            if kind is None:
+                log.warning(f"Contenido no soportado en la URL {url} (Content-Type: {content_type})")
+                return FETCH_ERROR_MESSAGE
+
+            downloaded = await _read_capped_body(url, response, kind)
+            if downloaded is None:
+                return FETCH_ERROR_MESSAGE
+            kind, body = downloaded
+            etag = response.headers.get("etag")
+            last_modified = response.headers.get("last-modified")
+
+        if kind == "html":
+            text = body or FETCH_ERROR_MESSAGE
         else:
-            log.warning(f"Contenido no soportado en la URL {url} (Content-Type: {content_type})")
-            return FETCH_ERROR_MESSAGE
+            text = await _extract_pdf_text(url, body)
+        if text and text != FETCH_ERROR_MESSAGE:
+            await content_cache.store(url, text, etag, last_modified)
+        return text
 
     except Exception as e:
         log.warning(f"No se pudo obtener el contenido de la URL {url}: {e}")
         return FETCH_ERROR_MESSAGE
 
-async def search_for_sources(query: str, num_results: int = 3) -> str:
+def _kind_from_content_type(content_type: str) -> str | None:
+    """Clasifica la respuesta por su Content-Type: 'pdf', 'html', 'sniff' (hay que mirar los bytes) o None."""
+    if "application/pdf" in content_type:
+        return "pdf"
+    if "text/html" in content_type or "application/xhtml" in content_type:
+        return "html"
+    if not content_type or "octet-stream" in content_type:
+        return "sniff"
+    return None
+
+def _kind_from_body(body: bytes | bytearray) -> str | None:
+    """Identifica PDF o HTML por los primeros bytes del cuerpo."""
+    if body.startswith(b"%PDF-"):
+        return "pdf"
+    head = bytes(body[:SNIFF_BYTES]).lstrip().lower()
+    if head.startswith(b"<!doctype html") or head.startswith(b"<html"):
+        return "html"
+    return None
+
+async def _read_capped_body(url: str, response: httpx.Response, kind: str) -> tuple[str, bytes | str] | None:
     """
-    Realiza una búsqueda en el PSE y extrae el contenido de las páginas.
+    Lee el cuerpo en streaming. Un PDF se descarga entero hasta
+    PSE_MAX_DOWNLOAD_BYTES; truncado no se puede leer, así que se descarta y
+    se usa el snippet. Un HTML se parsea a medida que llega y la descarga se
+    corta en cuanto hay MAX_CHARS_PER_SOURCE caracteres de texto o se llega a
+    PSE_MAX_HTML_BYTES; en ese caso se devuelve ya el texto extraído.
     """
-    search_url = "https://www.googleapis.com/customsearch/v1"
+    max_bytes = settings.PSE_MAX_DOWNLOAD_BYTES
+    declared = response.headers.get("content-length")
+    if kind == "pdf" and declared and declared.isdigit() and int(declared) > max_bytes:
+        log.warning(f"PDF demasiado grande en {url} ({declared} bytes). Se usará el snippet.")
+        return None
+
+    body = bytearray()
+    chunks = response.aiter_bytes()
+    async for chunk in chunks:
+        body += chunk
+        if kind == "sniff" and len(body) >= SNIFF_BYTES:
+            kind = _kind_from_body(body)
+            if kind is None:
+                log.warning(f"Contenido no reconocido en la URL {url}.")
+                return None
+        if kind == "html":
+            return "html", await _read_html_text(url, response, bytes(body), chunks)
+        if len(body) >= max_bytes:
+            log.warning(f"PDF de más de {max_bytes} bytes en {url}. Se usará el snippet.")
+            return None
+
+    if kind == "sniff":
+        kind = _kind_from_body(body)
+        if kind is None:
+            log.warning(f"Contenido no reconocido en la URL {url}.")
+            return None
+        if kind == "html":
+            return "html", await _read_html_text(url, response, bytes(body), chunks)
+    return kind, bytes(body)
+
+async def _read_html_text(url: str, response: httpx.Response, head: bytes, chunks: AsyncIterator[bytes]) -> str:
+    """
+    Extrae el texto de un HTML mientras se descarga: primero los bytes `head`
+    ya leídos y después el resto de `chunks`. Cada trozo se parsea con lxml
+    en el propio event loop: es código C sobre unos pocos KB, y
+    PSE_MAX_HTML_BYTES acota el total.
+    """
+    log.info(f"Detectado HTML en la URL: {url}. Extrayendo texto...")
+    max_bytes = settings.PSE_MAX_HTML_BYTES
+    collector = doc_extractor.HtmlTextCollector(MAX_CHARS_PER_SOURCE, response.charset_encoding)
+    received = len(head)
+    if collector.feed(head[:max_bytes]) or received >= max_bytes:
+        return collector.close()
+    async for chunk in chunks:
+        chunk = chunk[:max_bytes - received]
+        received += len(chunk)
+        if collector.feed(chunk):
+            break
+        if received >= max_bytes:
+            log.info(f"Descarga de {url} truncada a {max_bytes} bytes.")
+            break
+    return collector.close()
+
+async def _extract_pdf_text(url: str, body: bytes) -> str:
+    """
+    Extrae el texto de un PDF ya descargado. El parseo se hace en el pool de
+    extracción para no bloquear el event loop; si no termina a tiempo se
+    devuelve FETCH_ERROR_MESSAGE y se usa el snippet.
+    """
+    log.info(f"Detectado PDF en la URL: {url}. Extrayendo texto de las primeras {MAX_PDF_PAGES_TO_READ} páginas...")
+    text = await extraction_pool.run(
+        doc_extractor.extract_pdf_text, body, MAX_PDF_PAGES_TO_READ, MAX_CHARS_PER_SOURCE, settings.EXTRACTION_CPU_BUDGET
+    )
+    return text if text is not None else FETCH_ERROR_MESSAGE
+
+async def _fetch_with_limits(
+    url: str,
+    client: httpx.AsyncClient,
+    semaphore: asyncio.Semaphore,
+    host_semaphores: dict[str, asyncio.Semaphore],
+) -> str:
+    """
+    Descarga una página respetando el límite global de concurrencia y el
+    límite de conexiones simultáneas por dominio.
+    """
+    host = urlparse(url).netloc.lower()
+    if host not in host_semaphores:
+        host_semaphores[host] = asyncio.Semaphore(settings.PSE_MAX_CONNECTIONS_PER_HOST)
+    async with semaphore, host_semaphores[host]:
+        started = time.perf_counter()
+        text = await _fetch_and_parse_url(url, client)
+        result = "error" if text == FETCH_ERROR_MESSAGE else "ok"
+        metrics.PSE_PAGE_FETCH_SECONDS.observe(time.perf_counter() - started, result=result)
+        return text
+
+async def _search_documents(query: str, num_results: int) -> Tuple[List[SourceDocument], bool]:
+    """
+    Realiza la búsqueda en el PSE y extrae el contenido de las páginas.
+    Las páginas se descargan en paralelo y toda la etapa está acotada por
+    PSE_SEARCH_DEADLINE: las que no terminan a tiempo usan su snippet.
+    Devuelve los documentos y si todas las páginas se procesaron a tiempo.
+    Lanza una excepción si la propia búsqueda falla.
+    """
+    search_url = settings.PSE_SEARCH_URL
     params = {"key": settings.PSE_API_KEY, "cx": settings.PSE_ID, "q": query, "num": num_results}
 
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.get(search_url, params=params)
-            response.raise_for_status()
-            results = response.json()
-
-            if "items" not in results or not results["items"]:
-                return "No se encontraron resultados de búsqueda externos."
-
-            formatted_results = "\\n\\n### Contexto de Búsqueda Externa:\\n"
-            for item in results["items"]:
-                title = item.get("title", "Sin Título")
-                link = item.get("link", "#")
-                snippet = item.get("snippet", "No hay descripción.").replace("\n", " ")
-                
-                page_content = await _fetch_and_parse_url(link, client)
-                
-                final_content = page_content if page_content != FETCH_ERROR_MESSAGE else snippet
-                
-                formatted_results += f"Título: **[{title}]({link})**\\n"
-                formatted_results += f"Contenido de la Página: {final_content}\\n\\n"
-            
-            return formatted_results
-
-        except Exception as e:
-            log.error(f"Error inesperado en el cliente de PSE: {e}")
-            return "Hubo un error al realizar la búsqueda externa."
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + settings.PSE_SEARCH_DEADLINE
+
+    client = http_clients.get_pse_client()
+    response = await asyncio.wait_for(client.get(search_url, params=params), timeout=settings.PSE_SEARCH_DEADLINE)
+    response.raise_for_status()
+    results = response.json()
+
+    if "items" not in results or not results["items"]:
+        return [], True
+
+    items = results["items"]
+    semaphore = asyncio.Semaphore(settings.PSE_FETCH_CONCURRENCY)
+    host_semaphores: dict[str, asyncio.Semaphore] = {}
+    fetch_tasks = [
+        asyncio.create_task(_fetch_with_limits(item.get("link", "#"), client, semaphore, host_semaphores))
+        for item in items
+    ]
+    try:
+        _, pending = await asyncio.wait(fetch_tasks, timeout=max(0.0, deadline - loop.time()))
+    finally:
+        # Si el plazo vence (o la petición se cancela) no dejamos descargas huérfanas.
+        for task in fetch_tasks:
+            if not task.done():
+                task.cancel()
+    if pending:
+        log.warning(f"Plazo de búsqueda agotado: {len(pending)} de {len(fetch_tasks)} páginas usarán su snippet.")
+        await asyncio.gather(*pending, return_exceptions=True)
+
+    documents = []
+    for item, task in zip(items, fetch_tasks):
+        snippet = item.get("snippet", "No hay descripción.").replace("\n", " ")
+        page_content = task.result() if task not in pending else FETCH_ERROR_MESSAGE
+        documents.append(SourceDocument(
+            origin="web",
+            title=item.get("title", "Sin Título"),
+            link=item.get("link", "#"),
+            content=page_content if page_content != FETCH_ERROR_MESSAGE else snippet,
+        ))
+    return documents, not pending
+
+def format_source_documents(documents: List[SourceDocument]) -> str:
+    """Formatea las fuentes externas como sección de contexto para el prompt."""
+    formatted_results = "\\n\\n### Contexto de Búsqueda Externa:\\n"
+    for doc in documents:
+        formatted_results += f"Título: **[{doc.title}]({doc.link})**\\n"
+        formatted_results += f"Contenido de la Página: {doc.content}\\n\\n"
+    return formatted_results
+
+async def _cached_search_documents(query: str, num_results: int) -> List[SourceDocument]:
+    """_search_documents a través de la caché de resultados (ver query_cache)."""
+    key = (query_cache.normalize_query(query), num_results)
+    # Si el plazo dejó páginas con su snippet, el resultado se comparte con las
+    # peticiones en curso pero no se guarda: la siguiente lo intentará de nuevo.
+    documents, _ = await _results_cache.get_or_load(
+        key, lambda: _search_documents(query, num_results), cache_if=lambda result: result[1]
+    )
+    return list(documents)
+
+async def search_source_documents(query: str, num_results: int = 3) -> SourceSearchResult:
+    """Busca fuentes externas y las devuelve sin formatear; ante un error, sin documentos y con un aviso para el prompt."""
+    try:
+        return SourceSearchResult(documents=await _cached_search_documents(query, num_results))
+    except Exception as e:
+        log.error(f"Error inesperado en el cliente de PSE: {e}")
+        return SourceSearchResult(error_notice="Hubo un error al realizar la búsqueda externa.")
@@ -0,0 +1,96 @@
+# src/modules/query_cache.py
+
+import asyncio
+import re
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+# Caché de resultados de búsqueda (PSE y RAG) con agrupación de peticiones.
+# Cuando muchos usuarios preguntan casi lo mismo a la vez (p. ej. tras publicarse
+# una sentencia), las consultas con la misma forma normalizada comparten una
+# única llamada al servicio externo (single-flight) y su resultado se reutiliza
+# durante un TTL propio de cada fuente. Así se ahorra cuota de Custom Search y
+# carga en el servicio RAG. Los errores no se guardan.
+
+_WHITESPACE = re.compile(r"\s+")
+_EDGE_PUNCTUATION = "¿?¡!.,;: \"'"
+
+def normalize_query(query: str) -> str:
+    """Forma canónica de una consulta: Unicode NFKC, minúsculas, espacios simples y sin puntuación en los extremos."""
+    normalized = unicodedata.normalize("NFKC", query).casefold()
+    return _WHITESPACE.sub(" ", normalized).strip(_EDGE_PUNCTUATION)
+
+class QueryCache:
+    """Caché LRU con TTL y single-flight para una fuente de búsqueda."""
+
+    def __init__(self, name: str, ttl: float, max_entries: int):
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._in_flight: Dict[Hashable, asyncio.Task] = {}
+        self._stats = {"requests": 0, "hits": 0, "coalesced": 0, "upstream_calls": 0, "errors": 0}
+        _caches[name] = self
+
+    async def get_or_load(self, key: Hashable, loader: Callable[[], Awaitable[Any]],
+                          cache_if: Optional[Callable[[Any], bool]] = None) -> Any:
+        """
+        Devuelve el resultado en caché para `key` o, si no lo hay, el de `loader()`.
+        Las llamadas concurrentes con la misma clave esperan a la misma tarea, que
+        está protegida (shield): si un llamador se cancela, no se cancela para el resto.
+        Si se indica `cache_if`, solo se guardan los resultados para los que devuelve True.
+        """
+        self._stats["requests"] += 1
+        entry = self._entries.get(key)
+        if entry is not None:
+            stored_at, value = entry
+            if time.monotonic() - stored_at < self.ttl:
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+                return value
+            del self._entries[key]
+
+        task = self._in_flight.get(key)
+        if task is not None:
+            self._stats["coalesced"] += 1
+        else:
+            self._stats["upstream_calls"] += 1
+            task = asyncio.create_task(self._load(key, loader, cache_if))
+            # Si todos los llamadores se cancelan, nadie recoge la excepción de la tarea.
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            self._in_flight[key] = task
+        return await asyncio.shield(task)
+
+    async def _load(self, key: Hashable, loader: Callable[[], Awaitable[Any]],
+                    cache_if: Optional[Callable[[Any], bool]]) -> Any:
+        try:
+            value = await loader()
+        except BaseException:
+            self._stats["errors"] += 1
+            raise
+        else:
+            if cache_if is None or cache_if(value):
+                self._entries[key] = (time.monotonic(), value)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+            return value
+        finally:
+            self._in_flight.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        requests = self._stats["requests"] or 1
+        return {
+            **self._stats,
+            "entries": len(self._entries),
+            "in_flight": len(self._in_flight),
+            "hit_rate": round(self._stats["hits"] / requests, 3),
+            "coalesce_rate": round(self._stats["coalesced"] / requests, 3),
+        }
+
+_caches: Dict[str, QueryCache] = {}
+
+def stats() -> Dict[str, Dict[str, Any]]:
+    return {name: cache.stats() for name, cache in _caches.items()}
@@ -1,67 +1,116 @@
 # src/modules/rag_client.py
 
+import asyncio
+import logging
 import httpx
-from src.config import log
+from typing import List
+from src.config import settings, log
+from src.models.context_models import SourceDocument, SourceSearchResult
+from src.modules import http_clients, query_cache, resilience
 
 # La URL de tu servicio de indexación. ¡Asegúrate que termine en /query!
-RAG_API_URL = "https://pida-rag-api-640849120264.us-central1.run.app/query"
+RAG_API_URL = settings.RAG_API_URL
 
-async def search_internal_documents(query: str) -> str:
+# Timeout adaptativo, hedging y circuit breaker alrededor de la llamada HTTP (ver resilience).
+_endpoint = resilience.ResilientEndpoint(
+    "rag",
+    min_timeout=settings.RAG_MIN_TIMEOUT,
+    max_timeout=settings.RAG_TIMEOUT,
+    timeout_multiplier=settings.RAG_TIMEOUT_MULTIPLIER,
+    hedge_percentile=settings.RAG_HEDGE_PERCENTILE,
+    min_samples=settings.RAG_LATENCY_MIN_SAMPLES,
+    failure_threshold=settings.RAG_BREAKER_FAILURES,
+    cooldown=settings.RAG_BREAKER_COOLDOWN,
+)
+
+# Resultados recientes por consulta normalizada; las consultas idénticas simultáneas comparten la llamada.
+_results_cache = query_cache.QueryCache("rag", settings.RAG_RESULT_CACHE_TTL, settings.QUERY_CACHE_MAX_ENTRIES)
+
+async def _query_documents(query: str) -> List[SourceDocument]:
     """
-    Realiza una consulta al servicio RAG interno para buscar en los documentos indexados.
-    Ahora es más resiliente a los timeouts y errores de red.
+    Consulta el servicio RAG interno y devuelve los documentos encontrados.
+    Lanza una excepción ante timeouts, errores de red o respuestas no válidas,
+    y resilience.CircuitOpenError si el servicio se considera caído.
     """
     log.info(f"Consultando RAG interno con la query: '{query[:50]}...'")
-    
-    # Aumentamos ligeramente el timeout para dar margen a arranques en frío.
-    timeout_config = httpx.Timeout(30.0, connect=10.0)
-
-    async with httpx.AsyncClient(timeout=timeout_config) as client:
-        try:
-            response = await client.post(
-                RAG_API_URL,
-                json={"query": query}
-            )
-            response.raise_for_status() # Lanza un error si la respuesta no es 2xx
-            data = response.json()
-
-            if not data or "results" not in data or not data["results"]:
-                log.warning("RAG interno no devolvió resultados para la consulta.")
-                return "" # Devolvemos una cadena vacía para no añadir texto innecesario al prompt
-
-            # Formateamos los resultados para inyectarlos en el prompt
-            formatted_results = "\n\n### Contexto de Documentos Internos (RAG):\n"
-            for i, doc in enumerate(data.get("results", [])):
-                # PASO 1: Extraer los datos de forma segura
-                title = doc.get("title")
-                author = doc.get("author")
-                source_filename = doc.get("source")
-                content = doc.get("content", "").replace("\n", " ").strip()
-
-                # PASO 2: Decidir el título a mostrar, con fallbacks
-                display_title = title or source_filename or "Documento Interno"
-
-                # PASO 3: Construir la línea de la cita según las reglas del prompt
-                citation_line = f"**Fuente:** **<{display_title}>**"
-                if author and author.strip() and author != "Autor Desconocido":
-                    citation_line += f", {author}"
-                
-                # PASO DE DEPURACIÓN
-                log.info(f"DEBUG RAG Doc {i}: title='{title}', author='{author}', citation_line='{citation_line}'")
-
-                # PASO 4: Ensamblar la salida con el formato correcto
-                formatted_results += f"{citation_line}\n"
-                formatted_results += f"**Texto:**\n> {content}\n\n"
-            
-            return formatted_results
-
-        except httpx.TimeoutException as e:
-            # --- MANEJO DE ERROR MEJORADO ---
-            log.error(f"Timeout al contactar el servicio RAG interno en {RAG_API_URL}: {e}", exc_info=True)
-            return "\n\n### Contexto de Documentos Internos (RAG):\nEl servicio de búsqueda de documentos internos tardó demasiado en responder y no está disponible en este momento.\n"
-        except httpx.RequestError as e:
-            log.error(f"Error de red al contactar el servicio RAG interno en {RAG_API_URL}: {e}", exc_info=True)
-            return "\n\n### Contexto de Documentos Internos (RAG):\nError de conexión al buscar en los documentos internos.\n"
-        except Exception as e:
-            log.error(f"Error inesperado al procesar la respuesta del RAG interno: {e}", exc_info=True)
-            return "\n\n### Contexto de Documentos Internos (RAG):\nError al procesar la búsqueda en los documentos internos.\n"
+
+    # El cliente compartido usa el perfil de timeout del RAG (RAG_TIMEOUT), con margen
+    # para arranques en frío; el plazo efectivo de cada consulta lo ajusta _endpoint.
+    client = http_clients.get_rag_client()
+
+    async def _post():
+        response = await client.post(
+            RAG_API_URL,
+            json={"query": query}
+        )
+        response.raise_for_status() # Lanza un error si la respuesta no es 2xx
+        return response.json()
+
+    data = await _endpoint.call(_post)
+
+    if not data or "results" not in data or not data["results"]:
+        log.warning("RAG interno no devolvió resultados para la consulta.")
+        return []
+
+    documents = []
+    for doc in data.get("results", []):
+        # PASO 1: Extraer los datos de forma segura
+        title = doc.get("title")
+        author = doc.get("author")
+        source_filename = doc.get("source")
+        content = doc.get("content", "").replace("\n", " ").strip()
+
+        # PASO 2: Decidir el título a mostrar, con fallbacks
+        display_title = title or source_filename or "Documento Interno"
+
+        # El autor solo se cita si está disponible (regla del prompt)
+        if not (author and author.strip() and author != "Autor Desconocido"):
+            author = None
+
+        documents.append(SourceDocument(origin="rag", title=display_title, author=author, content=content))
+    return documents
+
+async def _cached_query_documents(query: str) -> List[SourceDocument]:
+    """_query_documents a través de la caché de resultados (ver query_cache)."""
+    key = query_cache.normalize_query(query)
+    return list(await _results_cache.get_or_load(key, lambda: _query_documents(query)))
+
+def format_internal_documents(documents: List[SourceDocument]) -> str:
+    """Formatea los documentos internos como sección de contexto para el prompt."""
+    formatted_results = "\n\n### Contexto de Documentos Internos (RAG):\n"
+    debug = log.isEnabledFor(logging.DEBUG)
+    for i, doc in enumerate(documents):
+        # PASO 3: Construir la línea de la cita según las reglas del prompt
+        citation_line = f"**Fuente:** **<{doc.title}>**"
+        if doc.author:
+            citation_line += f", {doc.author}"
+
+        # PASO DE DEPURACIÓN (solo con el nivel DEBUG activo: se ejecuta por documento en cada turno)
+        if debug:
+            log.debug(f"DEBUG RAG Doc {i}: title='{doc.title}', author='{doc.author}', citation_line='{citation_line}'")
+
+        # PASO 4: Ensamblar la salida con el formato correcto
+        formatted_results += f"{citation_line}\n"
+        formatted_results += f"**Texto:**\n> {doc.content}\n\n"
+    return formatted_results
+
+async def search_internal_source_documents(query: str) -> SourceSearchResult:
+    """
+    Consulta el RAG interno y devuelve los documentos sin formatear. Ante un
+    timeout o un error devuelve, sin documentos, el aviso que va al prompt.
+    """
+    try:
+        return SourceSearchResult(documents=await _cached_query_documents(query))
+    except resilience.CircuitOpenError:
+        log.warning("RAG interno omitido: el circuito está abierto.")
+        return SourceSearchResult()
+    except (httpx.TimeoutException, asyncio.TimeoutError) as e:
+        log.error(f"Timeout al contactar el servicio RAG interno en {RAG_API_URL}: {e}", exc_info=True)
+        notice = "El servicio de búsqueda de documentos internos tardó demasiado en responder y no está disponible en este momento."
+    except httpx.RequestError as e:
+        log.error(f"Error de red al contactar el servicio RAG interno en {RAG_API_URL}: {e}", exc_info=True)
+        notice = "Error de conexión al buscar en los documentos internos."
+    except Exception as e:
+        log.error(f"Error inesperado al procesar la respuesta del RAG interno: {e}", exc_info=True)
+        notice = "Error al procesar la búsqueda en los documentos internos."
+    return SourceSearchResult(error_notice=f"\n\n### Contexto de Documentos Internos (RAG):\n{notice}\n")
@@ -0,0 +1,195 @@
+# src/modules/resilience.py
+
+import asyncio
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional
+from src.config import log
+
+# Capa de resiliencia para servicios externos lentos o intermitentes (RAG).
+#   - Timeout adaptativo: se calcula a partir de los percentiles de latencia
+#     observados, en lugar de esperar siempre el máximo pensado para arranques en frío.
+#   - Petición cubierta (hedging): si el primer intento supera el p95 se lanza un
+#     segundo intento en paralelo y se usa el primero que responda.
+#   - Circuit breaker: tras varios fallos seguidos se deja de llamar al servicio
+#     durante un tiempo y el llamador usa directamente su respuesta de reserva.
+# Solo debe usarse con llamadas idempotentes (consultas de lectura).
+
+class CircuitOpenError(Exception):
+    """El circuito está abierto: el servicio se considera caído y no se llama."""
+
+class _LatencyTracker:
+    """
+    Latencias de las últimas llamadas. Un timeout se guarda como una muestra
+    censurada igual al plazo agotado (la latencia real fue al menos esa): así el
+    timeout adaptativo crece si el servicio se vuelve más lento de forma estable.
+    """
+
+    def __init__(self, window: int):
+        self.samples: Deque[float] = deque(maxlen=window)
+
+    def add(self, seconds: float):
+        self.samples.append(seconds)
+
+    def percentile(self, pct: float) -> Optional[float]:
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+class _CircuitBreaker:
+    """Circuito cerrado / abierto / semiabierto por fallos consecutivos."""
+
+    def __init__(self, failure_threshold: int, cooldown: float):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.probe_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at < self.cooldown:
+            return "open"
+        return "half_open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self.probe_in_flight:
+            # Una sola llamada de prueba decide si el circuito se cierra.
+            self.probe_in_flight = True
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.probe_in_flight = False
+
+    def record_failure(self) -> bool:
+        """Registra un fallo. Devuelve True si el circuito acaba de abrirse."""
+        self.failures += 1
+        was_open = self.opened_at is not None
+        if self.probe_in_flight or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+        self.probe_in_flight = False
+        return self.opened_at is not None and not was_open
+
+class ResilientEndpoint:
+    """Envuelve las llamadas a un servicio con timeout adaptativo, hedging y circuit breaker."""
+
+    def __init__(self, name: str, min_timeout: float, max_timeout: float, timeout_multiplier: float,
+                 hedge_percentile: float, min_samples: int, failure_threshold: int, cooldown: float,
+                 window: int = 200):
+        self.name = name
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.timeout_multiplier = timeout_multiplier
+        self.hedge_percentile = hedge_percentile
+        self.min_samples = min_samples
+        self.latencies = _LatencyTracker(window)
+        self.breaker = _CircuitBreaker(failure_threshold, cooldown)
+        self._stats = {"calls": 0, "successes": 0, "failures": 0, "timeouts": 0, "hedged": 0, "hedge_wins": 0, "short_circuited": 0}
+        _endpoints[name] = self
+
+    def _has_history(self) -> bool:
+        return len(self.latencies.samples) >= self.min_samples
+
+    def current_timeout(self) -> float:
+        """Plazo total de la llamada: p99 × multiplicador, acotado; el máximo mientras no hay datos suficientes."""
+        if not self._has_history():
+            return self.max_timeout
+        p99 = self.latencies.percentile(99)
+        return min(self.max_timeout, max(self.min_timeout, p99 * self.timeout_multiplier))
+
+    def hedge_delay(self) -> Optional[float]:
+        """Espera antes del segundo intento (el percentil configurado), o None si aún no hay datos."""
+        if not self._has_history():
+            return None
+        return self.latencies.percentile(self.hedge_percentile)
+
+    async def call(self, func: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Ejecuta `func` (que debe crear una llamada nueva en cada invocación).
+        Lanza CircuitOpenError si el circuito está abierto, asyncio.TimeoutError
+        si se agota el plazo adaptativo, o la excepción del último intento fallido.
+        """
+        if not self.breaker.allow():
+            self._stats["short_circuited"] += 1
+            raise CircuitOpenError(f"Circuito de '{self.name}' abierto.")
+
+        self._stats["calls"] += 1
+        # La llamada de prueba del circuito semiabierto usa el plazo máximo: el
+        # adaptativo puede haberse quedado corto si el servicio se volvió más lento.
+        timeout = self.max_timeout if self.breaker.probe_in_flight else self.current_timeout()
+        try:
+            result = await asyncio.wait_for(self._hedged(func), timeout=timeout)
+        except asyncio.CancelledError:
+            # La cancelación del llamador no dice nada de la salud del servicio.
+            self.breaker.probe_in_flight = False
+            raise
+        except Exception as e:
+            self._stats["failures"] += 1
+            if isinstance(e, asyncio.TimeoutError):
+                self._stats["timeouts"] += 1
+                self.latencies.add(timeout)
+            if self.breaker.record_failure():
+                log.warning(f"Circuito de '{self.name}' abierto durante {self.breaker.cooldown}s tras {self.breaker.failures} fallos.")
+            raise
+        self._stats["successes"] += 1
+        self.breaker.record_success()
+        return result
+
+    async def _attempt(self, func: Callable[[], Awaitable[Any]]) -> Any:
+        started = time.monotonic()
+        result = await func()
+        self.latencies.add(time.monotonic() - started)
+        return result
+
+    async def _hedged(self, func: Callable[[], Awaitable[Any]]) -> Any:
+        first = asyncio.create_task(self._attempt(func))
+        attempts = [first]
+        try:
+            delay = self.hedge_delay()
+            if delay is not None:
+                done, _ = await asyncio.wait([first], timeout=delay)
+                if not done:
+                    self._stats["hedged"] += 1
+                    attempts.append(asyncio.create_task(self._attempt(func)))
+
+            pending = set(attempts)
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not first:
+                            self._stats["hedge_wins"] += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in attempts:
+                if not task.done():
+                    task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        p50, p95, p99 = (self.latencies.percentile(p) for p in (50, 95, 99))
+        return {
+            **self._stats,
+            "circuit": self.breaker.state,
+            "timeout_s": round(self.current_timeout(), 3),
+            "hedge_delay_s": round(self.hedge_delay(), 3) if self.hedge_delay() is not None else None,
+            "latency_p50_s": round(p50, 3) if p50 is not None else None,
+            "latency_p95_s": round(p95, 3) if p95 is not None else None,
+            "latency_p99_s": round(p99, 3) if p99 is not None else None,
+        }
+
+_endpoints: Dict[str, ResilientEndpoint] = {}
+
+def stats() -> Dict[str, Dict[str, Any]]:
+    return {name: endpoint.stats() for name, endpoint in _endpoints.items()}
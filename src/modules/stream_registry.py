@@ -0,0 +1,201 @@
+# src/modules/stream_registry.py
+
+import asyncio
+import functools
+import time
+import uuid
+from collections import deque
+from typing import AsyncIterator, Callable, Deque, Dict, Optional, Tuple
+from src.config import settings, log
+
+# Registro de generaciones en curso para poder reanudar un stream SSE.
+# La generación de cada turno se ejecuta en una tarea propia, desacoplada de la
+# conexión HTTP: sus eventos se guardan numerados en un buffer circular y los
+# clientes se suscriben a él. Si la conexión se corta, el cliente vuelve a
+# conectarse con la cabecera Last-Event-ID y recibe los eventos que le faltan
+# (de la generación en curso o ya terminada) sin repetir PSE, RAG ni Gemini.
+# Una generación sin clientes se cancela tras SSE_RESUME_GRACE segundos; las
+# terminadas se conservan SSE_RESUME_TTL segundos, con un tope global de memoria.
+
+class StreamGoneError(Exception):
+    """El stream no existe, ha caducado o ya no conserva los eventos pedidos."""
+
+class _Stream:
+    __slots__ = ("stream_id", "user_id", "convo_id", "events", "size", "next_seq", "done", "finished_at",
+                 "task", "subscribers", "cancel_handle", "_waiter")
+
+    def __init__(self, user_id: str, convo_id: str):
+        self.stream_id = uuid.uuid4().hex[:16]
+        self.user_id = user_id
+        self.convo_id = convo_id
+        self.events: Deque[Tuple[int, bytes]] = deque()
+        self.size = 0
+        self.next_seq = 1
+        self.done = False
+        self.finished_at: Optional[float] = None
+        self.task: Optional[asyncio.Task] = None
+        self.subscribers = 0
+        self.cancel_handle: Optional[asyncio.TimerHandle] = None
+        self._waiter = asyncio.Event()
+
+    def append(self, frame: bytes):
+        if len(self.events) >= settings.SSE_RESUME_MAX_EVENTS:
+            _, dropped = self.events.popleft()
+            self.size -= len(dropped)
+        self.events.append((self.next_seq, frame))
+        self.size += len(frame)
+        self.next_seq += 1
+        self._notify()
+
+    def finish(self):
+        self.done = True
+        self.finished_at = time.monotonic()
+        self._notify()
+
+    def _notify(self):
+        waiter, self._waiter = self._waiter, asyncio.Event()
+        waiter.set()
+
+    def can_resume_after(self, seq: int) -> bool:
+        oldest = self.events[0][0] if self.events else self.next_seq
+        return oldest - 1 <= seq < self.next_seq
+
+    def is_expired(self) -> bool:
+        return self.done and time.monotonic() - self.finished_at > settings.SSE_RESUME_TTL
+
+_streams: Dict[str, _Stream] = {}
+_stats = {"started": 0, "resumed": 0, "cancelled_after_grace": 0, "evicted": 0}
+
+def _sweep():
+    """Descarta los streams caducados y, si se supera el tope de memoria, los terminados más antiguos."""
+    for stream_id in [sid for sid, s in _streams.items() if s.is_expired()]:
+        del _streams[stream_id]
+    total = sum(s.size for s in _streams.values())
+    if total <= settings.SSE_RESUME_MAX_BYTES:
+        return
+    finished = sorted((s for s in _streams.values() if s.done), key=lambda s: s.finished_at)
+    for stream in finished:
+        if total <= settings.SSE_RESUME_MAX_BYTES:
+            break
+        total -= stream.size
+        del _streams[stream.stream_id]
+        _stats["evicted"] += 1
+
+async def _run(stream: _Stream, frames: AsyncIterator[bytes]):
+    try:
+        async for frame in frames:
+            stream.append(frame)
+    except asyncio.CancelledError:
+        log.warning(f"Generación {stream.stream_id} de la convo {stream.convo_id} cancelada.")
+        raise
+    except Exception as e:
+        log.error(f"Error en la generación {stream.stream_id} de la convo {stream.convo_id}: {e}", exc_info=True)
+
+def _on_task_done(stream: _Stream, on_done: Optional[Callable[[], None]], task: asyncio.Task):
+    # Como callback de la tarea, se ejecuta aunque se cancele antes de empezar
+    # (y entonces ni _run ni `frames` llegan a ejecutar sus finally).
+    if stream.cancel_handle is not None:
+        stream.cancel_handle.cancel()
+        stream.cancel_handle = None
+    stream.finish()
+    _sweep()
+    if on_done is not None:
+        on_done()
+
+def start(user_id: str, convo_id: str, frames: AsyncIterator[bytes], on_done: Optional[Callable[[], None]] = None) -> _Stream:
+    """
+    Lanza en segundo plano la generación `frames` (eventos SSE ya codificados)
+    y la registra. `on_done` se llama siempre al terminar la generación, también
+    si se cancela antes de empezar.
+    """
+    _sweep()
+    stream = _Stream(user_id, convo_id)
+    _streams[stream.stream_id] = stream
+    stream.task = asyncio.create_task(_run(stream, frames))
+    stream.task.add_done_callback(functools.partial(_on_task_done, stream, on_done))
+    _stats["started"] += 1
+    return stream
+
+def parse_last_event_id(value: str) -> Tuple[str, int]:
+    """Descompone un Last-Event-ID '<stream_id>:<secuencia>'. Lanza ValueError si no es válido."""
+    stream_id, _, seq = value.strip().partition(":")
+    if not stream_id or not seq.isdigit():
+        raise ValueError(f"Last-Event-ID no válido: {value!r}")
+    return stream_id, int(seq)
+
+def find(user_id: str, convo_id: str, stream_id: str, after_seq: int) -> _Stream:
+    """
+    Localiza el stream a reanudar. Lanza StreamGoneError si no existe, es de
+    otro usuario o conversación, ha caducado o ya descartó eventos posteriores a `after_seq`.
+    """
+    stream = _streams.get(stream_id)
+    if stream is None or stream.user_id != user_id or stream.convo_id != convo_id or stream.is_expired():
+        raise StreamGoneError("El stream ya no está disponible.")
+    if not stream.can_resume_after(after_seq):
+        raise StreamGoneError("El stream ya no conserva los eventos solicitados.")
+    _stats["resumed"] += 1
+    return stream
+
+async def subscribe(stream: _Stream, after_seq: int = 0) -> AsyncIterator[bytes]:
+    """
+    Entrega los eventos del stream posteriores a `after_seq`, con su campo 'id',
+    y después los nuevos a medida que se generan, hasta que la generación termina.
+    """
+    stream.subscribers += 1
+    if stream.cancel_handle is not None:
+        stream.cancel_handle.cancel()
+        stream.cancel_handle = None
+    prefix = f"id: {stream.stream_id}:".encode()
+    seq = after_seq
+    try:
+        while True:
+            waiter = stream._waiter
+            pending = [(s, frame) for s, frame in stream.events if s > seq]
+            for s, frame in pending:
+                yield prefix + str(s).encode() + b"\n" + frame
+                seq = s
+            if stream.done and seq >= stream.next_seq - 1:
+                return
+            await waiter.wait()
+    finally:
+        stream.subscribers -= 1
+        if stream.subscribers == 0 and not stream.done and stream.task is not None:
+            # Sin clientes: se da un margen para reconectar antes de dejar de generar.
+            loop = asyncio.get_running_loop()
+            stream.cancel_handle = loop.call_later(settings.SSE_RESUME_GRACE, _cancel_abandoned, stream)
+
+def _cancel_abandoned(stream: _Stream):
+    stream.cancel_handle = None
+    if stream.subscribers == 0 and not stream.done and stream.task is not None:
+        log.info(f"Generación {stream.stream_id} sin clientes tras {settings.SSE_RESUME_GRACE}s. Se cancela.")
+        _stats["cancelled_after_grace"] += 1
+        stream.task.cancel()
+
+async def cancel_conversation(user_id: str, convo_id: str):
+    """Cancela las generaciones en curso de una conversación (p. ej. al eliminarla) y espera a que terminen."""
+    tasks = [
+        s.task for s in _streams.values()
+        if (s.user_id, s.convo_id) == (user_id, convo_id) and s.task is not None and not s.task.done()
+    ]
+    for task in tasks:
+        task.cancel()
+    if tasks:
+        await asyncio.gather(*tasks, return_exceptions=True)
+        log.info(f"Canceladas {len(tasks)} generaciones en curso de la convo {convo_id}.")
+
+async def shutdown():
+    """Cancela las generaciones en curso (guardan su respuesta parcial) y espera a que terminen."""
+    tasks = [s.task for s in _streams.values() if s.task is not None and not s.task.done()]
+    for task in tasks:
+        task.cancel()
+    if tasks:
+        await asyncio.gather(*tasks, return_exceptions=True)
+    _streams.clear()
+
+def stats() -> Dict[str, int]:
+    return {
+        **_stats,
+        "streams": len(_streams),
+        "in_flight": sum(1 for s in _streams.values() if not s.done),
+        "buffered_bytes": sum(s.size for s in _streams.values()),
+    }